@@ -36,6 +36,7 @@ FILES = [
     "edges.jsonl",
     "sources.jsonl",
     "deleted_ids.json",
+    "feed.jsonl",
 ]
 
 
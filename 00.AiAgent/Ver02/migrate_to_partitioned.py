@@ -0,0 +1,107 @@
+"""
+migrate_to_partitioned.py — chuyển storage sang layout partitioned
+===================================================================
+Chạy 1 lần để tách sources/nodes/edges.jsonl (chung cho mọi container)
+thành từng thư mục riêng cho mỗi container:
+  data/users/{user}/containers/{container_id}/sources.jsonl
+  data/users/{user}/containers/{container_id}/nodes.jsonl
+  data/users/{user}/containers/{container_id}/edges.jsonl
+
+containers.jsonl và deleted_ids.json giữ nguyên ở gốc thư mục user.
+Record của container đã xoá bị bỏ qua. File flat cũ được chuyển vào
+data/users/{user}/_flat_backup/ — xoá thủ công khi đã verify xong.
+
+Chạy:
+  python migrate_to_partitioned.py            # mọi user trong data/users/
+  python migrate_to_partitioned.py alice bob  # chỉ các user chỉ định
+
+An toàn khi chạy nhiều lần — user đã có containers/ sẽ được giữ nguyên.
+"""
+
+from __future__ import annotations
+
+import json
+import shutil
+import sys
+from pathlib import Path
+
+ROOT      = Path(__file__).resolve().parent
+USERS_DIR = ROOT / "data" / "users"
+
+ENTITY_FILES = ["sources.jsonl", "nodes.jsonl", "edges.jsonl"]
+
+
+def _read_rows(path: Path) -> list[dict]:
+    if not path.exists():
+        return []
+    rows = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line:
+            row = json.loads(line)
+            if "_snapshot" not in row:
+                rows.append(row)
+    return rows
+
+
+def migrate_user(user_dir: Path) -> None:
+    parts_dir  = user_dir / "containers"
+    backup_dir = user_dir / "_flat_backup"
+
+    if parts_dir.is_dir():
+        print(f"  ✓ {user_dir.name}: đã partitioned, giữ nguyên")
+        return
+    if not any((user_dir / f).exists() for f in ENTITY_FILES):
+        print(f"  ─ {user_dir.name}: không có data flat, bỏ qua")
+        return
+
+    deleted_path = user_dir / "deleted_ids.json"
+    deleted = json.loads(deleted_path.read_text(encoding="utf-8")) if deleted_path.exists() else []
+    deleted = set(deleted["ids"] if isinstance(deleted, dict) else deleted)     # bản mới: {"ids", "compacted"}
+
+    # Ghi vào thư mục tạm rồi rename → không để lại containers/ dở dang nếu lỗi giữa chừng
+    tmp_dir = user_dir / "containers.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    for fname in ENTITY_FILES:
+        per_container: dict[str, list[str]] = {}
+        rows = _read_rows(user_dir / fname)
+        for row in rows:
+            cid = row.get("container_id", "")
+            if not cid or cid in deleted:
+                continue
+            # Giữ nguyên thứ tự append → lịch sử version không đổi
+            per_container.setdefault(cid, []).append(json.dumps(row, ensure_ascii=False))
+        for cid, lines in per_container.items():
+            (tmp_dir / cid).mkdir(parents=True, exist_ok=True)
+            (tmp_dir / cid / fname).write_text("\n".join(lines) + "\n", encoding="utf-8")
+        kept = sum(len(v) for v in per_container.values())
+        print(f"  ✓ {user_dir.name}/{fname}: {kept}/{len(rows)} records → {len(per_container)} container(s)")
+
+    tmp_dir.mkdir(exist_ok=True)
+    tmp_dir.rename(parts_dir)
+
+    backup_dir.mkdir(exist_ok=True)
+    for fname in ENTITY_FILES:
+        src = user_dir / fname
+        if src.exists():
+            shutil.move(str(src), str(backup_dir / fname))
+
+
+def migrate(users: list[str]) -> None:
+    if not USERS_DIR.exists():
+        print("Không có data/users/ — chạy migrate_to_multiuser.py trước.")
+        return
+    targets = [USERS_DIR / u for u in users] if users else sorted(p for p in USERS_DIR.iterdir() if p.is_dir())
+    for user_dir in targets:
+        if not user_dir.is_dir():
+            print(f"  ─ {user_dir.name}: không tồn tại, bỏ qua")
+            continue
+        migrate_user(user_dir)
+    print()
+    print("Migration xong. Data flat cũ nằm trong _flat_backup/ của mỗi user.")
+
+
+if __name__ == "__main__":
+    print(f"=== Migrate storage → layout partitioned ({USERS_DIR}) ===\n")
+    migrate(sys.argv[1:])
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import os
 import re
+import threading
+import time
+import weakref
 
 from .models import (
     EdgeCreate,
@@ -17,25 +21,191 @@ from .models import (
     ResponseBlock,
     SuggestedNode,
 )
-from .storage import FileStorage
+from . import metrics
+from .embeddings import CONTEXT_MIN_SCORE, DUPLICATE_THRESHOLD, text_of
+from .ingest import SourceIngestor
+from .llm_cache import LLMCache
+from .search import fold
+from .storage import AbstractStorage
+from .streaming import BlockStreamParser
+from .tokens import MESSAGE_OVERHEAD, PromptAssembler, get_tokenizer
+
+
+# ── Shared LLM client ──────────────────────────────────────────────────────
+# 1 client / process cho mọi agent: import openai 1 lần, HTTP connection pool
+# (keep-alive) dùng chung thay vì mở TLS mới cho mỗi request.
+
+_LLM_CLIENT_LOCK = threading.Lock()
+_LLM_CLIENTS: dict[str, object] = {}
+# AsyncOpenAI giữ connection gắn với event loop → cache theo (loop, api_key)
+_ASYNC_LLM_CLIENTS: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+LLM_USER_CONCURRENCY = int(os.getenv("RKS_LLM_USER_CONCURRENCY", "4"))
+LLM_TIMEOUT          = float(os.getenv("RKS_LLM_TIMEOUT", "90"))
+# Số lượt history tối đa gửi kèm — PromptAssembler còn cắt tiếp theo ngân sách token
+HISTORY_TURNS        = int(os.getenv("RKS_HISTORY_TURNS", "12"))
+
+
+def _llm_limits():
+    import httpx
+    max_conn = int(os.getenv("RKS_LLM_MAX_CONNECTIONS", "20"))
+    return httpx.Limits(max_connections=max_conn, max_keepalive_connections=max_conn)
+
+
+def shared_llm_client(api_key: str):
+    """OpenAI client dùng chung theo api_key; None nếu thiếu thư viện openai."""
+    with _LLM_CLIENT_LOCK:
+        client = _LLM_CLIENTS.get(api_key)
+        if client is None:
+            try:
+                import httpx
+                from openai import OpenAI
+            except ImportError:
+                return None
+            client = _LLM_CLIENTS[api_key] = OpenAI(
+                api_key=api_key,
+                http_client=httpx.Client(limits=_llm_limits()),
+            )
+        return client
+
+
+def shared_async_llm_client(api_key: str):
+    """AsyncOpenAI client dùng chung cho event loop hiện tại; None nếu thiếu openai."""
+    loop = asyncio.get_running_loop()
+    with _LLM_CLIENT_LOCK:
+        per_loop = _ASYNC_LLM_CLIENTS.setdefault(loop, {})
+        client = per_loop.get(api_key)
+        if client is None:
+            try:
+                import httpx
+                from openai import AsyncOpenAI
+            except ImportError:
+                return None
+            client = per_loop[api_key] = AsyncOpenAI(
+                api_key=api_key,
+                http_client=httpx.AsyncClient(limits=_llm_limits()),
+            )
+        return client
+
+
+def _response_block(b: dict, i: int) -> ResponseBlock:
+    return ResponseBlock(
+        id=b.get("id", f"b{i}"),
+        type=b.get("type", "definition"),
+        title=b.get("title", ""),
+        content=b.get("content", []),
+        relations=b.get("relations", {}),
+    )
+
+
+# Các dòng context trong system prompt — dùng chung cho render và đếm token
+_NEIGHBORS_HEADER = "\nCác nodes liên quan trong graph:\n"
+_SIMILAR_HEADER   = "\nCác nodes đã có trong graph, gần nghĩa (không đề xuất lại, dùng đúng title khi nhắc tới):\n"
+_EXCERPTS_HEADER  = "\nTrích đoạn tài liệu nguồn liên quan (ưu tiên dùng khi trả lời):\n"
+
+
+def _neighbor_line(nb: dict) -> str:
+    return f"  • [{nb['relation']}] {nb['title']}" + (f": {nb['definition']}" if nb['definition'] else "")
+
+
+def _similar_line(sim: dict) -> str:
+    return f"  • {sim['title']}" + (f": {sim['definition']}" if sim['definition'] else "")
+
+
+def _excerpt_line(ex: dict) -> str:
+    return f"  [{ex['label']}, tr. {ex['page']}] {ex['text']}"
+
+
+def _section(header: str, lines: list[str]) -> str:
+    return header + "\n".join(lines) if lines else ""
+
+
+def _usage_tokens(resp) -> tuple[int, int]:
+    """(prompt_tokens, completion_tokens) từ response API; server không trả usage → (0, 0)."""
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return 0, 0
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0
+
+
+def _llm_error(e: Exception) -> str:
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+        return f"timeout sau {LLM_TIMEOUT:g}s"
+    return str(e)
 
 
 class CognitiveAgent:
-    def __init__(self, storage: FileStorage):
+    def __init__(self, storage: AbstractStorage, cache: LLMCache | None = None,
+                 ingestor: SourceIngestor | None = None):
         self.storage = storage
+        self.cache = cache
+        self.ingestor = ingestor        # None → prompt không kèm trích đoạn source
         self._llm_client = None
+        self._api_key = ""
         self._model = "gpt-4o-mini"
+        # Agent sống theo user (xem pool trong webapp) → semaphore = giới hạn
+        # số LLM call đồng thời của 1 user trên async path
+        self._llm_slots = asyncio.Semaphore(LLM_USER_CONCURRENCY)
         self._init_llm()
 
     def _init_llm(self) -> None:
         """Khởi tạo LLM client nếu có API key."""
         api_key = os.getenv("OPENAI_API_KEY", "")
         if api_key:
-            try:
-                from openai import OpenAI
-                self._llm_client = OpenAI(api_key=api_key)
-            except ImportError:
-                pass
+            self._api_key = api_key
+            self._llm_client = shared_llm_client(api_key)
+
+    @property
+    def llm_enabled(self) -> bool:
+        return self._llm_client is not None
+
+    def _async_llm(self):
+        return shared_async_llm_client(self._api_key) if self._llm_client else None
+
+    # ── LLM call + response cache ──────────────────────────────────────────
+    # Key = model + toàn bộ tham số gọi (messages gồm system prompt). no_cache=True
+    # → bỏ qua lookup nhưng vẫn ghi kết quả mới (= refresh entry).
+
+    def _cache_lookup(self, params: dict, no_cache: bool) -> tuple[str | None, str | None]:
+        """(key, reply đã cache); key None khi cache tắt."""
+        if self.cache is None:
+            return None, None
+        key = LLMCache.key(self._model, params)
+        if no_cache:
+            self.cache.note_bypass()
+            return key, None
+        return key, self.cache.get(key)
+
+    def _cache_put(self, key: str | None, reply: str) -> None:
+        if key is not None and reply:
+            self.cache.put(key, reply)
+
+    def _complete(self, no_cache: bool = False, **kwargs) -> str:
+        key, cached = self._cache_lookup(kwargs, no_cache)
+        if cached is not None:
+            return cached
+        start = time.perf_counter()
+        resp = self._llm_client.chat.completions.create(model=self._model, **kwargs)
+        metrics.record_llm(time.perf_counter() - start, *_usage_tokens(resp))
+        reply = resp.choices[0].message.content or ""
+        self._cache_put(key, reply)
+        return reply
+
+    async def _acomplete(self, client, no_cache: bool = False, **kwargs) -> str:
+        """1 chat completion trên async path: chờ slot của user + timeout tổng."""
+        key, cached = await asyncio.to_thread(self._cache_lookup, kwargs, no_cache)
+        if cached is not None:
+            return cached
+
+        async def call():
+            async with self._llm_slots:
+                start = time.perf_counter()
+                resp = await client.chat.completions.create(model=self._model, **kwargs)
+                metrics.record_llm(time.perf_counter() - start, *_usage_tokens(resp))
+            return resp.choices[0].message.content or ""
+        reply = await asyncio.wait_for(call(), LLM_TIMEOUT)
+        await asyncio.to_thread(self._cache_put, key, reply)
+        return reply
 
     # ── Node maturity ──────────────────────────────────────────────────────
 
@@ -46,9 +216,8 @@ class CognitiveAgent:
         if node.boundary_conditions.strip(): score += 1
         if len(node.assumptions) >= 1:       score += 1
         # Check if it has ≥3 edges
-        edges = self.storage.list_edges(node.container_id)
-        connected = [e for e in edges if e.source_node_id == node.node_id or e.target_node_id == node.node_id]
-        if len(connected) >= 3:              score = max(score, 3)
+        if self.storage.node_degree(node.node_id) >= 3:
+            score = max(score, 3)
         return score
 
     def can_activate(self, node: GraphNode) -> tuple[bool, list[str]]:
@@ -112,43 +281,186 @@ class CognitiveAgent:
 
         if self._llm_client:
             # Build graph context for richer prompt
-            graph_ctx = self._build_graph_context(node)
+            graph_ctx = self._build_graph_context(node, req.message)
             return self._explore_with_llm(req, node, graph_ctx)
         else:
             return self._explore_mock(req, node)
 
-    def _build_graph_context(self, node: GraphNode) -> dict:
-        """Gather container info + neighboring nodes + edge relations."""
-        container = self.storage.get_container(node.container_id)
-        edges = self.storage.list_edges(node.container_id)
-        all_nodes = self.storage.list_nodes(node.container_id)
-        node_map = {n.node_id: n for n in all_nodes}
-
-        neighbors = []
-        for e in edges:
-            if e.source_node_id == node.node_id:
-                nb = node_map.get(e.target_node_id)
-                if nb:
-                    neighbors.append({"title": nb.title, "relation": f"{e.relation_type} →", "definition": nb.definition[:120] if nb.definition else ""})
-            elif e.target_node_id == node.node_id:
-                nb = node_map.get(e.source_node_id)
-                if nb:
-                    neighbors.append({"title": nb.title, "relation": f"← {e.relation_type}", "definition": nb.definition[:120] if nb.definition else ""})
+    # ── Async path ─────────────────────────────────────────────────────────
+    # Chỉ LLM await chạy trên event loop. Storage (giữ RLock + flock của user —
+    # compaction / batch / worker khác đang giữ thì phải chờ), embedding index,
+    # ingest và LLM cache trên đĩa đi qua asyncio.to_thread: chờ lock chỉ chặn
+    # 1 thread, loop vẫn phục vụ các request khác.
+
+    async def explore_async(self, req: ExploreRequest) -> ExploreResponse:
+        """Như explore() nhưng LLM call qua AsyncOpenAI — không giữ thread worker."""
+        node = await asyncio.to_thread(self.storage.get_node, req.node_id)
+        if node is None:
+            return ExploreResponse(reply="Node không tồn tại.")
 
+        client = self._async_llm()
+        if client is None:
+            return await asyncio.to_thread(self._explore_mock, req, node)
+        messages, usage = await asyncio.to_thread(self._explore_prompt, req, node)
+        try:
+            reply = await self._acomplete(client, req.no_cache, messages=messages, temperature=0.7, max_tokens=2500)
+            resp = await asyncio.to_thread(self._parse_explore_reply, req, reply)
+            return self._with_usage(resp, usage, reply)
+        except Exception as e:
+            return ExploreResponse(reply=f"Lỗi LLM: {_llm_error(e)}")
+
+    async def explore_stream(self, req: ExploreRequest):
+        """Async generator (event, data) cho SSE — phát ngay khi model sinh text:
+          clarify: ("summary", str), rồi ("block", ResponseBlock) từng block
+          expand:  ("delta", str) từng đoạn text
+        Luôn kết thúc bằng ("done", ExploreResponse) — kết quả đầy đủ như explore().
+        """
+        node = await asyncio.to_thread(self.storage.get_node, req.node_id)
+        if node is None:
+            yield "done", ExploreResponse(reply="Node không tồn tại.")
+            return
+
+        client = self._async_llm()
+        if client is None:
+            yield "done", await asyncio.to_thread(self._explore_mock, req, node)
+            return
+        messages, usage = await asyncio.to_thread(self._explore_prompt, req, node)
+        params = dict(messages=messages, temperature=0.7, max_tokens=2500)
+        key, cached = await asyncio.to_thread(self._cache_lookup, params, req.no_cache)
+        parser = BlockStreamParser()
+        n_blocks = 0
+
+        def events(delta: str) -> list[tuple[str, object]]:
+            nonlocal n_blocks
+            if req.mode != "clarify":
+                return [("delta", delta)]
+            out = []
+            for event, data in parser.feed(delta):
+                if event == "block":
+                    data = _response_block(data, n_blocks)
+                    n_blocks += 1
+                out.append((event, data))
+            return out
+
+        if cached is not None:
+            for event in events(cached):
+                yield event
+            resp = await asyncio.to_thread(self._parse_explore_reply, req, cached)
+            yield "done", self._with_usage(resp, usage, cached)
+            return
+
+        parts: list[str] = []
+        try:
+            await asyncio.wait_for(self._llm_slots.acquire(), LLM_TIMEOUT)
+            try:
+                start = time.perf_counter()
+                stream = await asyncio.wait_for(client.chat.completions.create(
+                    model=self._model, stream=True, **params,
+                ), LLM_TIMEOUT)
+                try:
+                    chunks = stream.__aiter__()
+                    while True:
+                        # Timeout tính theo khoảng lặng giữa 2 chunk, không theo cả stream
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), LLM_TIMEOUT)
+                        except StopAsyncIteration:
+                            break
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if not delta:
+                            continue
+                        parts.append(delta)
+                        for event in events(delta):
+                            yield event
+                finally:
+                    await stream.close()
+            finally:
+                self._llm_slots.release()
+        except Exception as e:
+            yield "done", ExploreResponse(reply=f"Lỗi LLM: {_llm_error(e)}")
+            return
+        reply = "".join(parts)
+        output_tokens = get_tokenizer(self._model).count(reply)
+        # stream không trả usage → token theo tokenizer local (như token_usage của response)
+        metrics.record_llm(time.perf_counter() - start, usage["input"], output_tokens)
+        await asyncio.to_thread(self._cache_put, key, reply)
+        resp = await asyncio.to_thread(self._parse_explore_reply, req, reply)
+        resp.token_usage = {**usage, "output": output_tokens}
+        yield "done", resp
+
+    def _explore_prompt(self, req: ExploreRequest, node: GraphNode) -> tuple[list[dict], dict]:
+        """(messages, token usage) kèm graph context — đọc storage / embedding / ingest."""
+        return self._explore_messages(req, node, self._build_graph_context(node, req.message))
+
+    def _build_graph_context(self, node: GraphNode, query: str = "") -> dict:
+        """Gather container info + neighboring nodes + edge relations + source excerpts."""
+        container = self.storage.get_container(node.container_id)
+        neighbors_raw = self.storage.get_neighborhood(node.node_id, hops=1, limit=8, def_chars=120)
+        neighbors = [
+            {
+                "title": nb.title,
+                "relation": f"{nb.relation_type} →" if nb.direction == "out" else f"← {nb.relation_type}",
+                "definition": nb.definition,
+            }
+            for nb in neighbors_raw
+        ]
         return {
             "container_title": container.title if container else "",
             "container_description": container.description if container else "",
-            "neighbors": neighbors[:8],  # cap at 8
-            "total_nodes": len(all_nodes),
+            "neighbors": neighbors,
+            "similar": self._similar_context(node, {nb.node_id for nb in neighbors_raw}),
+            "excerpts": self._source_excerpts(node, query),
         }
 
+    def _source_excerpts(self, node: GraphNode, query: str = "", k: int = 3) -> list[dict]:
+        """Top chunk của source PDF đã ingest liên quan tới node (+ câu hỏi hiện tại)."""
+        if self.ingestor is None:
+            return []
+        hits = self.ingestor.relevant_chunks(
+            node.container_id, "\n".join([text_of(node.title, node.definition, node.tags), query]), k=k)
+        return [{"label": h.label, "page": h.page, "text": h.text} for h in hits]
+
+    def _similar_context(self, node: GraphNode, skip: set[str], k: int = 5) -> list[dict]:
+        """Node đã có trong container gần nghĩa nhất với node (chưa nối trực tiếp) —
+        model biết graph đã có gì, tránh đề xuất lại dưới tên khác."""
+        hits = self.storage.similar_nodes(
+            node.container_id, text_of(node.title, node.definition, node.tags), k=k,
+            exclude=skip | {node.node_id}, min_score=CONTEXT_MIN_SCORE,
+        )
+        out = []
+        for hit in hits:
+            other = self.storage.get_node(hit.node_id)
+            if other is not None:
+                out.append({"title": other.title, "definition": other.definition[:120]})
+        return out
+
+    def _dedupe_suggested(self, parent: GraphNode, suggested: list[SuggestedNode]) -> list[SuggestedNode]:
+        """Bỏ suggestion trùng title nhau / trùng node gốc; suggestion gần nghĩa với
+        node đã có (cosine > DUPLICATE_THRESHOLD) được gắn existing_node_id để
+        confirm-suggested nối edge tới node đó thay vì tạo node trùng."""
+        seen = {fold(parent.title).strip()}
+        out = []
+        for s in suggested:
+            key = fold(s.title).strip()
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            hits = self.storage.similar_nodes(
+                parent.container_id, text_of(s.title, s.definition), k=1,
+                exclude=(parent.node_id,), min_score=DUPLICATE_THRESHOLD,
+            )
+            if hits:
+                s.existing_node_id, s.existing_title, s.similarity = hits[0]
+            out.append(s)
+        return out
+
     def _build_system_prompt(self, node: GraphNode, mode: str, graph_ctx: dict | None = None) -> str:
         ctx = graph_ctx or {}
         container_line = f"Domain: {ctx.get('container_title', '')}" + (f" — {ctx.get('container_description', '')}" if ctx.get('container_description') else "")
-        neighbors_text = ""
-        if ctx.get('neighbors'):
-            lines = [f"  • [{nb['relation']}] {nb['title']}" + (f": {nb['definition']}" if nb['definition'] else "") for nb in ctx['neighbors']]
-            neighbors_text = "\nCác nodes liên quan trong graph:\n" + "\n".join(lines)
+        neighbors_text = (
+            _section(_NEIGHBORS_HEADER, [_neighbor_line(nb) for nb in ctx.get('neighbors') or []])
+            + _section(_SIMILAR_HEADER, [_similar_line(sim) for sim in ctx.get('similar') or []])
+            + _section(_EXCERPTS_HEADER, [_excerpt_line(ex) for ex in ctx.get('excerpts') or []])
+        )
 
         base = f"""Bạn là chuyên gia tri thức chuyên sâu, đang hỗ trợ xây dựng Knowledge Graph.
 {container_line}
@@ -209,55 +521,65 @@ Sau câu trả lời, thêm JSON block theo đúng format:
 ]
 ```"""
 
-    def _explore_with_llm(self, req: ExploreRequest, node: GraphNode, graph_ctx: dict | None = None) -> ExploreResponse:
-        messages = [{"role": "system", "content": self._build_system_prompt(node, req.mode, graph_ctx)}]
-        for m in req.history[-6:]:  # max 6 turns context
-            messages.append({"role": m.role, "content": m.content})
+    def _explore_messages(self, req: ExploreRequest, node: GraphNode,
+                          graph_ctx: dict | None = None) -> tuple[list[dict], dict]:
+        """(messages, token usage) — lắp theo ngân sách token, thứ tự ưu tiên:
+        system prompt lõi + câu hỏi (luôn giữ) → neighbors → trích đoạn source
+        → node gần nghĩa → history (lượt mới nhất trước, liền mạch)."""
+        ctx = dict(graph_ctx or {})
+        asm = PromptAssembler(get_tokenizer(self._model))
+        asm.require("system", self._build_system_prompt(node, req.mode, {**ctx, "neighbors": [], "similar": [], "excerpts": []}))
+        asm.require("message", req.message)
+        ctx["neighbors"] = asm.fit("neighbors", ctx.get("neighbors") or [], _neighbor_line, _NEIGHBORS_HEADER)
+        ctx["excerpts"]  = asm.fit("excerpts", ctx.get("excerpts") or [], _excerpt_line, _EXCERPTS_HEADER)
+        ctx["similar"]   = asm.fit("similar", ctx.get("similar") or [], _similar_line, _SIMILAR_HEADER)
+        recent = req.history[-HISTORY_TURNS:][::-1] if HISTORY_TURNS > 0 else []
+        history = asm.fit("history", recent, lambda m: m.content, overhead=MESSAGE_OVERHEAD, contiguous=True)[::-1]
+
+        messages = [{"role": "system", "content": self._build_system_prompt(node, req.mode, ctx)}]
+        messages += [{"role": m.role, "content": m.content} for m in history]
         messages.append({"role": "user", "content": req.message})
+        return messages, asm.usage()
 
-        try:
-            resp = self._llm_client.chat.completions.create(
-                model=self._model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=2500,
-            )
-            reply = resp.choices[0].message.content or ""
+    def _with_usage(self, resp: ExploreResponse, usage: dict, reply: str) -> ExploreResponse:
+        resp.token_usage = {**usage, "output": get_tokenizer(self._model).count(reply)}
+        return resp
 
-            if req.mode == "clarify":
-                # Try to parse structured JSON response
-                try:
-                    raw = re.sub(r"```json|```", "", reply).strip()
-                    data = json.loads(raw)
-                    if "blocks" in data:
-                        blocks = [
-                            ResponseBlock(
-                                id=b.get("id", f"b{i}"),
-                                type=b.get("type", "definition"),
-                                title=b.get("title", ""),
-                                content=b.get("content", []),
-                                relations=b.get("relations", {}),
-                            )
-                            for i, b in enumerate(data["blocks"])
-                        ]
-                        return ExploreResponse(
-                            reply=data.get("summary", ""),
-                            blocks=blocks,
-                        )
-                except Exception:
-                    pass
-                return ExploreResponse(reply=reply)
-
-            # expand mode
-            suggested = self._parse_suggested_nodes(reply)
-            clean_reply = re.sub(r"```json.*?```", "", reply, flags=re.DOTALL).strip()
-            return ExploreResponse(reply=clean_reply, suggested_nodes=suggested)
+    def _explore_with_llm(self, req: ExploreRequest, node: GraphNode, graph_ctx: dict | None = None) -> ExploreResponse:
+        messages, usage = self._explore_messages(req, node, graph_ctx)
+        try:
+            reply = self._complete(req.no_cache, messages=messages, temperature=0.7, max_tokens=2500)
+            return self._with_usage(self._parse_explore_reply(req, reply), usage, reply)
         except Exception as e:
             return ExploreResponse(reply=f"Lỗi LLM: {e}")
 
+    def _parse_explore_reply(self, req: ExploreRequest, reply: str) -> ExploreResponse:
+        if req.mode == "clarify":
+            # Try to parse structured JSON response
+            try:
+                raw = re.sub(r"```json|```", "", reply).strip()
+                data = json.loads(raw)
+                if "blocks" in data:
+                    blocks = [_response_block(b, i) for i, b in enumerate(data["blocks"])]
+                    return ExploreResponse(
+                        reply=data.get("summary", ""),
+                        blocks=blocks,
+                    )
+            except Exception:
+                pass
+            return ExploreResponse(reply=reply)
+
+        # expand mode
+        suggested = self._parse_suggested_nodes(reply)
+        node = self.storage.get_node(req.node_id)
+        if node is not None:
+            suggested = self._dedupe_suggested(node, suggested)
+        clean_reply = re.sub(r"```json.*?```", "", reply, flags=re.DOTALL).strip()
+        return ExploreResponse(reply=clean_reply, suggested_nodes=suggested)
+
     # ── Auto-Document (AI fills definition/mechanism/boundary + suggests nodes) ──
 
-    def auto_document_node(self, node_id: str) -> dict:
+    def auto_document_node(self, node_id: str, no_cache: bool = False) -> dict:
         """
         Tự động điền Document fields + đề xuất related nodes bằng LLM.
         Trả về { node, suggested_nodes }.
@@ -267,18 +589,57 @@ Sau câu trả lời, thêm JSON block theo đúng format:
             raise KeyError(f"Node not found: {node_id}")
 
         if self._llm_client:
-            return self._auto_document_with_llm(node)
+            return self._auto_document_with_llm(node, no_cache)
         else:
             return self._auto_document_mock(node)
 
-    def _auto_document_with_llm(self, node: GraphNode) -> dict:
+    async def auto_document_node_async(self, node_id: str, no_cache: bool = False,
+                                       strict: bool = False) -> dict:
+        """Bản async của auto_document_node() — dùng AsyncOpenAI.
+        strict=True → lỗi LLM raise ra ngoài (job queue retry) thay vì ghi nội dung demo."""
+        node = await asyncio.to_thread(self.storage.get_node, node_id)
+        if node is None:
+            raise KeyError(f"Node not found: {node_id}")
+
+        client = self._async_llm()
+        if client is None:
+            return await asyncio.to_thread(self._auto_document_mock, node)
+        prompt, usage = await asyncio.to_thread(self._auto_document_prompt, node)
+        try:
+            raw = await self._acomplete(
+                client,
+                no_cache,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7,
+                max_tokens=1200,
+                response_format={"type": "json_object"},
+            )
+            data = json.loads(raw or "{}")
+        except Exception as e:
+            if strict:
+                raise
+            return await asyncio.to_thread(self._auto_document_mock, node, _llm_error(e))
+        result = await asyncio.to_thread(self._apply_auto_document, node, data)
+        return result | {"token_usage": {**usage, "output": get_tokenizer(self._model).count(raw)}}
+
+    def _auto_document_prompt(self, node: GraphNode) -> tuple[str, dict]:
+        """(prompt, token usage) — trích đoạn source chỉ lấy phần vừa ngân sách token."""
         relation_types = [r.value for r in RelationType]
         node_types     = [t.value for t in NodeType]
-        prompt = f"""Bạn là chuyên gia tri thức. Hãy tạo tài liệu chi tiết cho khái niệm sau:
+        asm = PromptAssembler(get_tokenizer(self._model))
+        asm.require("system", self._auto_document_template(node, node_types, relation_types, ""))
+        excerpts = asm.fit("excerpts", self._source_excerpts(node), _excerpt_line, _EXCERPTS_HEADER)
+        excerpts_text = _section(_EXCERPTS_HEADER, [_excerpt_line(ex) for ex in excerpts])
+        return self._auto_document_template(node, node_types, relation_types, excerpts_text), asm.usage()
+
+    @staticmethod
+    def _auto_document_template(node: GraphNode, node_types: list[str], relation_types: list[str],
+                                excerpts_text: str) -> str:
+        return f"""Bạn là chuyên gia tri thức. Hãy tạo tài liệu chi tiết cho khái niệm sau:
 
 Khái niệm: "{node.title}"
 Loại node: {node.node_type}
-Container: (domain không xác định — hãy suy diễn từ tên)
+Container: (domain không xác định — hãy suy diễn từ tên){excerpts_text}
 
 Nhiệm vụ:
 1. Viết definition ngắn gọn (2-3 câu) bằng tiếng Việt
@@ -298,19 +659,22 @@ Trả lời theo JSON sau (CHỈ JSON, không thêm text):
   ]
 }}"""
 
+    def _auto_document_with_llm(self, node: GraphNode, no_cache: bool = False) -> dict:
+        prompt, usage = self._auto_document_prompt(node)
         try:
-            resp = self._llm_client.chat.completions.create(
-                model=self._model,
+            raw = self._complete(
+                no_cache,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.7,
                 max_tokens=1200,
                 response_format={"type": "json_object"},
             )
-            raw = resp.choices[0].message.content or "{}"
-            data = json.loads(raw)
+            data = json.loads(raw or "{}")
         except Exception as e:
             return self._auto_document_mock(node, error=str(e))
+        return self._apply_auto_document(node, data) | {"token_usage": {**usage, "output": get_tokenizer(self._model).count(raw)}}
 
+    def _apply_auto_document(self, node: GraphNode, data: dict) -> dict:
         # Apply parsed fields to node
         if data.get("definition"):        node.definition          = data["definition"]
         if data.get("mechanism"):         node.mechanism           = data["mechanism"]
@@ -342,7 +706,7 @@ Trả lời theo JSON sau (CHỈ JSON, không thêm text):
                 definition=item.get("definition", ""),
             ))
 
-        return {"node": node, "suggested_nodes": suggested}
+        return {"node": node, "suggested_nodes": self._dedupe_suggested(node, suggested)}
 
     def _auto_document_mock(self, node: GraphNode, error: str = "") -> dict:
         """Fallback khi không có API key hoặc LLM lỗi."""
@@ -371,7 +735,7 @@ Trả lời theo JSON sau (CHỈ JSON, không thêm text):
                 definition="(demo node)",
             ),
         ]
-        return {"node": node, "suggested_nodes": suggested}
+        return {"node": node, "suggested_nodes": self._dedupe_suggested(node, suggested)}
 
     def _explore_mock(self, req: ExploreRequest, node: GraphNode) -> ExploreResponse:
         """Fallback khi không có LLM API key."""
@@ -404,7 +768,7 @@ Trả lời theo JSON sau (CHỈ JSON, không thêm text):
                 f"Gợi ý 2 nodes mở rộng từ **{node.title}** (demo).\n"
                 f"Set OPENAI_API_KEY trong .env để dùng AI thật."
             )
-            return ExploreResponse(reply=reply, suggested_nodes=suggested)
+            return ExploreResponse(reply=reply, suggested_nodes=self._dedupe_suggested(node, suggested))
 
     def _parse_suggested_nodes(self, text: str) -> list[SuggestedNode]:
         """Parse JSON block từ LLM response."""
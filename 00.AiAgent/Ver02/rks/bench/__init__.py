@@ -0,0 +1,8 @@
+"""Benchmark scripts cho storage / graph hot paths.
+
+Chạy từ thư mục Ver02, ví dụ:
+  python -m rks.bench.cascade --nodes 10000
+  python -m rks.bench.explore_load --explores 64 --latency 2
+  python -m rks.bench.serialization --rows 50000
+  python -m rks.bench.storage_suite --nodes 1000 10000 --edits 10   # mọi method AbstractStorage
+"""
@@ -0,0 +1,100 @@
+"""
+Benchmark export / import bundle NDJSON (rks/bundle.py).
+
+  python -m rks.bench.bundle --nodes 20000 --backend file sqlite
+
+Mỗi backend: dựng container synthetic (cây branching 3), export ra file
+(stream, tuỳ chọn gzip) rồi import lại thành container mới. In thời gian,
+kích thước bundle và đỉnh bộ nhớ Python (tracemalloc) của từng pha — đỉnh
+export / import phải gần như không đổi khi tăng --nodes.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from .. import bundle
+from ..models import GraphEdge, GraphNode, KnowledgeContainer, Source
+from ..storage import open_storage
+
+
+def _measure(fn) -> tuple[object, float, float]:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, round(elapsed, 3), round(peak / 2**20, 2)
+
+
+def run(backend: str, n_nodes: int, use_gzip: bool) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = open_storage(Path(tmp) / "store", backend)
+        kc = KnowledgeContainer(title="bench-bundle")
+        storage.upsert_container(kc)
+        cid = kc.container_id
+        with storage.batch():
+            storage.upsert_source(Source(container_id=cid, label="bench"))
+            nodes = [GraphNode(container_id=cid, title=f"node {i}", definition="x" * 200,
+                               x=float(i), y=float(-i)) for i in range(n_nodes)]
+            for n in nodes:
+                storage.upsert_node(n)
+            for i in range(1, n_nodes):
+                storage.upsert_edge(GraphEdge(container_id=cid, source_node_id=nodes[i].node_id,
+                                              target_node_id=nodes[(i - 1) // 3].node_id))
+        del nodes
+
+        path = Path(tmp) / "bundle.ndjson"
+
+        def export() -> int:
+            chunks = bundle.export_lines(storage, kc)
+            if use_gzip:
+                chunks = bundle.gzip_stream(chunks)
+            with path.open("wb") as f:
+                for data in chunks:
+                    f.write(data)
+            return path.stat().st_size
+
+        def import_() -> dict:
+            reader = bundle.BundleReader()
+            importer = bundle.BundleImporter(storage, "bench")
+            with path.open("rb") as f:
+                while data := f.read(64 * 1024):
+                    for batch in reader.feed(data):
+                        importer.add(batch)
+            for batch in reader.close():
+                importer.add(batch)
+            return importer.finish()["counts"]
+
+        size, export_s, export_mb = _measure(export)
+        counts, import_s, import_mb = _measure(import_)
+        return {
+            "backend": backend,
+            "nodes": n_nodes,
+            "gzip": use_gzip,
+            "bundle_mb": round(size / 2**20, 2),
+            "export_s": export_s,
+            "export_peak_mb": export_mb,
+            "import_s": import_s,
+            "import_peak_mb": import_mb,
+            "imported": counts,
+        }
+
+
+def main(argv: list[str] | None = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--nodes", type=int, nargs="+", default=[5000, 20000])
+    ap.add_argument("--backend", nargs="+", default=["file", "sqlite"], choices=["file", "sqlite"])
+    ap.add_argument("--gzip", action="store_true")
+    args = ap.parse_args(argv)
+    print(json.dumps([run(b, n, args.gzip) for b in args.backend for n in args.nodes], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark delete_node_cascade trên cây synthetic.
+
+  python -m rks.bench.cascade --nodes 10000 --branching 4 --budget 2.0
+
+Sinh 1 cây N node (mỗi node có `branching` con) trong thư mục tạm, rồi
+cascade-delete từ root trên mỗi backend. In kết quả JSON; exit code 1
+nếu backend nào chậm hơn --budget giây (để bắt regression trong CI).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from ..models import GraphEdge, GraphNode, KnowledgeContainer
+from ..storage import open_storage
+
+
+def build_tree(storage, n_nodes: int, branching: int) -> tuple[str, str]:
+    """Ghi 1 cây n_nodes node vào storage. Trả về (container_id, root_id)."""
+    kc = KnowledgeContainer(title="bench-cascade")
+    storage.upsert_container(kc)
+    ids: list[str] = []
+    with storage.batch():
+        for i in range(n_nodes):
+            node = GraphNode(container_id=kc.container_id, title=f"node {i}")
+            storage.upsert_node(node)
+            ids.append(node.node_id)
+            if i:
+                parent = ids[(i - 1) // branching]
+                storage.upsert_edge(GraphEdge(
+                    container_id=kc.container_id, source_node_id=parent, target_node_id=node.node_id,
+                ))
+    return kc.container_id, ids[0]
+
+
+def run(backend: str, n_nodes: int, branching: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = open_storage(Path(tmp), backend)
+        t0 = time.perf_counter()
+        container_id, root_id = build_tree(storage, n_nodes, branching)
+        build_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        deleted = storage.delete_node_cascade(root_id)
+        cascade_s = time.perf_counter() - t0
+
+        remaining = len(storage.list_nodes(container_id))
+    return {
+        "backend": backend,
+        "nodes": n_nodes,
+        "branching": branching,
+        "build_s": round(build_s, 4),
+        "cascade_s": round(cascade_s, 4),
+        "deleted": len(deleted),
+        "remaining": remaining,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--nodes", type=int, default=10_000)
+    ap.add_argument("--branching", type=int, default=4)
+    ap.add_argument("--backend", action="append", choices=["file", "sqlite"],
+                    help="lặp lại để chạy nhiều backend (mặc định: cả hai)")
+    ap.add_argument("--budget", type=float, default=0.0, help="giây tối đa cho cascade, 0 = không kiểm")
+    args = ap.parse_args(argv)
+
+    results = [run(b, args.nodes, args.branching) for b in (args.backend or ["file", "sqlite"])]
+    print(json.dumps(results, indent=2))
+
+    failed = [r for r in results
+              if r["deleted"] != args.nodes or r["remaining"]
+              or (args.budget and r["cascade_s"] > args.budget)]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Load-test /api/explore với fake LLM: đo latency đọc graph khi có nhiều
+LLM call đang treo.
+
+  python -m rks.bench.explore_load --explores 64 --latency 2.0
+
+Khởi động fake LLM (rks.bench.fake_llm) + app (uvicorn) trong cùng process,
+data trong thư mục tạm. Bắn `--explores` request explore song song, đồng thời
+GET graph liên tục; in JSON gồm thời gian tổng của explore và p50/p99 của
+graph read. Exit code 1 nếu graph p99 vượt --budget giây.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_app(port: int):
+    import uvicorn
+    from webapp.main import create_app
+
+    server = uvicorn.Server(uvicorn.Config(create_app(), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def _pct(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+async def _load(base: str, n_explores: int, mode: str) -> dict:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=base, timeout=None,
+                                 limits=httpx.Limits(max_connections=n_explores + 8)) as http:
+        kc   = (await http.post("/api/containers", json={"title": "bench-explore"})).json()
+        node = (await http.post(f"/api/containers/{kc['container_id']}/nodes",
+                                json={"container_id": kc["container_id"], "title": "Entropy"})).json()
+        graph_url = f"/api/containers/{kc['container_id']}/graph"
+
+        done = asyncio.Event()
+        reads: list[float] = []
+
+        async def reader():
+            while not done.is_set():
+                t0 = time.perf_counter()
+                (await http.get(graph_url)).raise_for_status()
+                reads.append(time.perf_counter() - t0)
+
+        async def one_explore():
+            r = await http.post("/api/explore", json={"node_id": node["node_id"], "container_id": kc["container_id"],
+                                                     "mode": mode, "message": "?"})
+            r.raise_for_status()
+            return r.json()
+
+        t0 = time.perf_counter()
+        reader_task = asyncio.create_task(reader())
+        replies = await asyncio.gather(*(one_explore() for _ in range(n_explores)))
+        explore_s = time.perf_counter() - t0
+        done.set()
+        await reader_task
+
+    errors = sum(1 for r in replies if r["reply"].startswith("Lỗi LLM"))
+    return {
+        "explore_total_s": round(explore_s, 3),
+        "explore_errors": errors,
+        "graph_reads": len(reads),
+        "graph_p50_ms": round(_pct(reads, 0.50) * 1000, 2),
+        "graph_p99_ms": round(_pct(reads, 0.99) * 1000, 2),
+        "graph_max_ms": round(max(reads, default=0) * 1000, 2),
+        "graph_mean_ms": round(statistics.fmean(reads) * 1000, 2) if reads else 0.0,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--explores", type=int, default=64, help="số explore request song song")
+    ap.add_argument("--latency", type=float, default=2.0, help="latency của fake LLM (giây)")
+    ap.add_argument("--user-concurrency", type=int, default=64, help="RKS_LLM_USER_CONCURRENCY")
+    ap.add_argument("--mode", choices=["clarify", "expand"], default="clarify")
+    ap.add_argument("--budget", type=float, default=0.0, help="giây tối đa cho graph p99, 0 = không kiểm")
+    args = ap.parse_args(argv)
+
+    from . import fake_llm
+
+    llm = fake_llm.serve(latency=args.latency)
+    with tempfile.TemporaryDirectory() as tmp:
+        # Env phải set trước khi import webapp / rks.agent (đọc env lúc import)
+        os.environ.update({
+            "OPENAI_API_KEY": "fake",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{llm.server_address[1]}/v1",
+            "RKS_DATA_DIR": tmp,
+            "RKS_COMPACT_INTERVAL": "0",
+            "RKS_LLM_USER_CONCURRENCY": str(args.user_concurrency),
+        })
+        os.environ.pop("APP_PASSWORD", None)
+        port = _free_port()
+        server = _start_app(port)
+        try:
+            result = asyncio.run(_load(f"http://127.0.0.1:{port}", args.explores, args.mode))
+        finally:
+            server.should_exit = True
+            llm.shutdown()
+
+    result.update(explores=args.explores, llm_latency_s=args.latency, user_concurrency=args.user_concurrency)
+    print(json.dumps(result, indent=2))
+    return 1 if result["explore_errors"] or (args.budget and result["graph_p99_ms"] > args.budget * 1000) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Fake OpenAI-compatible LLM server để load-test offline.
+
+  python -m rks.bench.fake_llm --port 8901 --latency 2.0
+
+Rồi chạy app với:
+  OPENAI_API_KEY=fake OPENAI_BASE_URL=http://127.0.0.1:8901/v1
+
+Chỉ implement POST /v1/chat/completions. Mỗi request ngủ `latency` giây
+(± jitter) rồi trả nội dung đúng format mà agent parse được; với
+stream=true thì trả SSE, `latency` rải đều trên các chunk ~16 ký tự:
+  - response_format=json_object → JSON auto-document
+  - system prompt "Mode: CLARIFY" → JSON blocks
+  - còn lại (expand)             → text + ```json suggested nodes```
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _clarify_reply() -> str:
+    blocks = [
+        {
+            "id": f"b{i}",
+            "type": t,
+            "title": f"Fake block {i}",
+            "content": [f"Câu {j} của block {i}." for j in range(1, 4)],
+            "relations": {"depends_on": [f"b{i - 1}"] if i > 1 else [], "leads_to": []},
+        }
+        for i, t in enumerate(["definition", "mechanism", "example", "consequence"], start=1)
+    ]
+    return json.dumps({"summary": "Fake summary.", "axis": "overview_to_detail", "blocks": blocks},
+                      ensure_ascii=False)
+
+
+def _expand_reply() -> str:
+    items = [
+        {"title": "Fake concept A", "node_type": "ONTOLOGY", "relation_type": "PART_OF", "definition": "A."},
+        {"title": "Fake concept B", "node_type": "MECHANISM", "relation_type": "FOUNDATION_OF", "definition": "B."},
+    ]
+    return "Gợi ý 2 nodes mở rộng (fake).\n\n```json\n" + json.dumps(items, ensure_ascii=False) + "\n```"
+
+
+def _auto_document_reply() -> str:
+    return json.dumps({
+        "definition": "Fake definition.",
+        "mechanism": "Fake mechanism.",
+        "boundary_conditions": "Fake boundary.",
+        "assumptions": ["Fake assumption 1", "Fake assumption 2"],
+        "suggested_nodes": [
+            {"title": "Fake related", "node_type": "ONTOLOGY", "relation_type": "PART_OF", "definition": "R."},
+        ],
+    }, ensure_ascii=False)
+
+
+def fake_reply(body: dict) -> str:
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        return _auto_document_reply()
+    system = next((m["content"] for m in body.get("messages", []) if m.get("role") == "system"), "")
+    return _clarify_reply() if "Mode: CLARIFY" in system else _expand_reply()
+
+
+def make_handler(latency: float, jitter: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"      # keep-alive → test được connection pool
+
+        def log_message(self, *args):       # im lặng khi load-test
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not self.path.endswith("/chat/completions"):
+                self.send_error(404)
+                return
+            delay = max(0.0, latency + random.uniform(-jitter, jitter))
+            content = fake_reply(body)
+            if body.get("stream"):
+                self._stream(body, content, delay)
+                return
+            time.sleep(delay)
+            payload = json.dumps({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _stream(self, body: dict, content: str, delay: float) -> None:
+            pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for i, piece in enumerate(pieces):
+                time.sleep(delay / len(pieces))
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "fake"),
+                    "choices": [{"index": 0, "delta": {"content": piece},
+                                 "finish_reason": "stop" if i == len(pieces) - 1 else None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+    return Handler
+
+
+def serve(port: int = 0, latency: float = 1.0, jitter: float = 0.0) -> ThreadingHTTPServer:
+    """Chạy server trong daemon thread; port=0 → tự chọn. Trả về server (server_address[1] = port)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency, jitter))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=8901)
+    ap.add_argument("--latency", type=float, default=1.0, help="giây / request")
+    ap.add_argument("--jitter", type=float, default=0.0)
+    args = ap.parse_args()
+    server = serve(args.port, args.latency, args.jitter)
+    print(f"Fake LLM: http://127.0.0.1:{server.server_address[1]}/v1  (latency {args.latency}s)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
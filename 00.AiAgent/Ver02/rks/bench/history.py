@@ -0,0 +1,112 @@
+"""
+Benchmark lịch sử node + graph?at= (FileStorage._History / bảng *_history của SQLite).
+
+  python -m rks.bench.history --nodes 2000 --revisions 10 --backend file sqlite
+
+Mỗi backend: container synthetic, mỗi node sửa --revisions lần (1 nửa trước
+compact, 1 nửa sau). Đo:
+  first_history_s   lần đọc lịch sử đầu — FileStorage build offset index
+  history_ms        node_history trung bình sau đó (seek thẳng, không quét file)
+  append_sync_ms    node_history ngay sau 1 lần sửa — chỉ parse phần mới append
+  graph_at_s        graph_at ở mốc giữa (sau nửa số revision)
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from ..models import GraphEdge, GraphNode, KnowledgeContainer
+from ..storage import open_storage
+
+
+def run(backend: str, n_nodes: int, revisions: int) -> dict:
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = open_storage(Path(tmp) / "store", backend)
+        kc = KnowledgeContainer(title="bench-history")
+        storage.upsert_container(kc)
+        cid = kc.container_id
+        nodes = [GraphNode(container_id=cid, title=f"node {i}") for i in range(n_nodes)]
+        with storage.batch():
+            for i, n in enumerate(nodes):
+                storage.upsert_node(n)
+                if i:
+                    storage.upsert_edge(GraphEdge(container_id=cid, source_node_id=n.node_id,
+                                                  target_node_id=nodes[(i - 1) // 3].node_id))
+
+        def edit_all(rev: int) -> None:
+            with storage.batch():
+                for n in nodes:
+                    n.definition = f"rev {rev}"
+                    n.touch()
+                    n.version += 1
+                    storage.upsert_node(n)
+
+        half = revisions // 2
+        for rev in range(half):
+            edit_all(rev)
+        midpoint = datetime.utcnow()
+        storage.compact()
+        for rev in range(half, revisions):
+            edit_all(rev)
+
+        probe = rng.sample(nodes, min(200, n_nodes))
+        t0 = time.perf_counter()
+        first = storage.node_history(probe[0].node_id)
+        first_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for n in probe:
+            storage.node_history(n.node_id)
+        history_ms = (time.perf_counter() - t0) / len(probe) * 1000
+
+        target = probe[0]
+        target.title = "edited"
+        target.touch()
+        target.version += 1
+        storage.upsert_node(target)
+        t0 = time.perf_counter()
+        after = storage.node_history(target.node_id)
+        append_ms = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        past_nodes, past_edges = storage.graph_at(cid, midpoint)
+        graph_at_s = time.perf_counter() - t0
+
+        errors = []
+        if len(first) != revisions + 1 or len(after) != revisions + 2:
+            errors.append(f"số revision: {len(first)} / {len(after)}, kỳ vọng {revisions + 1} / {revisions + 2}")
+        if len(past_nodes) != n_nodes or len(past_edges) != n_nodes - 1:
+            errors.append(f"graph_at: {len(past_nodes)} node, {len(past_edges)} edge")
+        if any(n.definition != f"rev {half - 1}" for n in past_nodes):
+            errors.append("graph_at trả sai revision")
+        return {
+            "backend": backend,
+            "nodes": n_nodes,
+            "revisions": revisions,
+            "first_history_s": round(first_s, 3),
+            "history_ms": round(history_ms, 3),
+            "append_sync_ms": round(append_ms, 3),
+            "graph_at_s": round(graph_at_s, 3),
+            "errors": errors,
+        }
+
+
+def main(argv: list[str] | None = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--nodes", type=int, nargs="+", default=[2000])
+    ap.add_argument("--revisions", type=int, default=10)
+    ap.add_argument("--backend", nargs="+", default=["file", "sqlite"], choices=["file", "sqlite"])
+    args = ap.parse_args(argv)
+    print(json.dumps([run(b, n, args.revisions) for b in args.backend for n in args.nodes],
+                     indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
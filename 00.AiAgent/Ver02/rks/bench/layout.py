@@ -0,0 +1,93 @@
+"""
+Benchmark layout server-side (rks/layout.py).
+
+  python -m rks.bench.layout --nodes 500 2000 5000 --new 5
+
+Mỗi kích thước: cây synthetic (branching 3) + 5% edge chéo ngẫu nhiên.
+  full         layout cả graph từ đầu (reset / container chưa có vị trí)
+  incremental  thêm --new node nối vào node đã đặt, chỉ đặt các node đó
+Kèm chất lượng: độ dài edge (median), khoảng cách tới node gần nhất (median,
+p5 — nhỏ quá là pill chồng nhau) và sai số lực đẩy lưới so với tính chính xác.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from .. import layout
+from ..models import GraphEdge, GraphNode
+
+
+def build_graph(n_nodes: int, branching: int = 3, cross: float = 0.05,
+                seed: int = 0) -> tuple[list[GraphNode], list[GraphEdge]]:
+    rng = random.Random(seed)
+    nodes = [GraphNode(container_id="bench", title=f"node {i}") for i in range(n_nodes)]
+    edges = [GraphEdge(container_id="bench", source_node_id=nodes[i].node_id,
+                       target_node_id=nodes[(i - 1) // branching].node_id) for i in range(1, n_nodes)]
+    for _ in range(int(n_nodes * cross)):
+        a, b = rng.sample(nodes, 2)
+        edges.append(GraphEdge(container_id="bench", source_node_id=a.node_id, target_node_id=b.node_id))
+    return nodes, edges
+
+
+def _quality(pos: np.ndarray, pairs: np.ndarray, sample: int = 1000) -> dict:
+    edge_len = np.hypot(*(pos[pairs[:, 0]] - pos[pairs[:, 1]]).T)
+    probe = pos[:sample]
+    d = np.hypot(probe[:, None, 0] - pos[None, :, 0], probe[:, None, 1] - pos[None, :, 1])
+    d[d == 0] = np.inf
+    nearest = d.min(axis=1)
+    return {
+        "edge_len_median": round(float(np.median(edge_len)), 1),
+        "nearest_median": round(float(np.median(nearest)), 1),
+        "nearest_p5": round(float(np.percentile(nearest, 5)), 1),
+    }
+
+
+def run(n_nodes: int, n_new: int) -> dict:
+    nodes, edges = build_graph(n_nodes)
+    t0 = time.perf_counter()
+    positions = layout.layout_graph(nodes, edges, seed=1)
+    full_s = time.perf_counter() - t0
+
+    index = {n.node_id: i for i, n in enumerate(nodes)}
+    pos = np.array([positions[n.node_id] for n in nodes])
+    pairs = np.array([(index[e.source_node_id], index[e.target_node_id]) for e in edges])
+    for n in nodes:
+        n.x, n.y = positions[n.node_id]
+
+    new = [GraphNode(container_id="bench", title=f"new {i}") for i in range(n_new)]
+    new_edges = [GraphEdge(container_id="bench", source_node_id=m.node_id,
+                           target_node_id=nodes[i * n_nodes // max(1, n_new)].node_id) for i, m in enumerate(new)]
+    t0 = time.perf_counter()
+    placed = layout.layout_graph(nodes + new, edges + new_edges, seed=1)
+    incremental_s = time.perf_counter() - t0
+
+    rows = np.arange(len(pos))
+    exact = layout._repulsion_exact(pos, rows, layout.LINK_DISTANCE ** 2)
+    grid = layout._repulsion_grid(pos, rows, layout.LINK_DISTANCE ** 2)
+    return {
+        "nodes": n_nodes,
+        "edges": len(edges),
+        "full_s": round(full_s, 3),
+        "incremental_s": round(incremental_s, 4),
+        "incremental_placed": len(placed),
+        "grid_rel_error": round(float(np.linalg.norm(exact - grid) / np.linalg.norm(exact)), 4),
+        **_quality(pos, pairs),
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--nodes", type=int, nargs="+", default=[500, 2000])
+    ap.add_argument("--new", type=int, default=5, help="số node thêm cho lần incremental")
+    args = ap.parse_args(argv)
+    print(json.dumps([run(n, args.new) for n in args.nodes], indent=2))
+
+
+if __name__ == "__main__":
+    main()
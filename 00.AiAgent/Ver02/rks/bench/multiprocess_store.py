@@ -0,0 +1,190 @@
+"""
+Stress test FileStorage khi nhiều process cùng ghi 1 data_dir (uvicorn --workers N).
+
+  python -m rks.bench.multiprocess_store --procs 4 --ops 400 --layout partitioned
+
+Mỗi process: upsert node (đơn lẻ + batch), sửa title, nối edge, xoá node
+(tombstone), đọc node của process khác; process 0 compact định kỳ. Xong thì
+mọi process chờ nhau (barrier) rồi đọc lại — phải thấy đúng cùng 1 trạng thái.
+Cuối cùng mở storage mới từ đĩa và so với nhật ký thao tác của mọi process:
+node sống / đã xoá / title cuối cùng / edge, và change feed: mọi process cùng
+1 revision, delta từ revision lúc bắt đầu phủ đủ node đã sửa / xoá. In JSON; exit code 1 nếu lệch.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from ..models import GraphEdge, GraphNode, KnowledgeContainer
+from ..storage import FileStorage
+
+
+def _worker(data_dir: str, container_id: str, proc: int, ops: int, layout: str, barrier, out) -> None:
+    storage = FileStorage(Path(data_dir), layout=layout)
+    rng = random.Random(proc)
+    live: dict[str, str] = {}        # node_id → title cuối cùng
+    deleted: list[str] = []
+    edges: list[tuple[str, str, str]] = []     # (edge_id, source, target)
+    errors: list[str] = []
+
+    def upsert(title: str) -> GraphNode:
+        node = GraphNode(container_id=container_id, title=title)
+        storage.upsert_node(node)
+        live[node.node_id] = title
+        return node
+
+    for i in range(ops):
+        try:
+            roll = rng.random()
+            if roll < 0.35 or not live:
+                node = upsert(f"p{proc}-{i}")
+                if storage.get_node(node.node_id) is None:
+                    errors.append(f"read-your-write: {node.node_id}")
+            elif roll < 0.45:
+                with storage.batch():
+                    for j in range(10):
+                        upsert(f"p{proc}-{i}-{j}")
+            elif roll < 0.6:
+                node_id = rng.choice(list(live))
+                node = storage.get_node(node_id)
+                node.title = live[node_id] = f"p{proc}-{i}-edit"
+                storage.upsert_node(node)
+            elif roll < 0.7 and len(live) >= 2:
+                a, b = rng.sample(list(live), 2)
+                edge = GraphEdge(container_id=container_id, source_node_id=a, target_node_id=b)
+                storage.upsert_edge(edge)
+                edges.append((edge.edge_id, a, b))
+            elif roll < 0.8:
+                node_id = rng.choice(list(live))
+                storage.delete_node(node_id)
+                del live[node_id]
+                deleted.append(node_id)
+            else:
+                storage.list_nodes(container_id)      # đọc cả graph — gồm dòng của process khác
+                storage.get_neighborhood(rng.choice(list(live)))
+            if proc == 0 and i and i % max(1, ops // 4) == 0:
+                storage.compact()
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+
+    barrier.wait()
+    seen = {n.node_id for n in storage.list_nodes(container_id)}
+    out.put({"proc": proc, "live": live, "deleted": deleted, "edges": edges,
+             "errors": errors, "seen": sorted(seen), "revision": storage.graph_revision(container_id)})
+
+
+def run(procs: int, ops: int, layout: str) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        kc = KnowledgeContainer(title="bench-multiprocess")
+        seed = FileStorage(Path(tmp), layout=layout)
+        seed.upsert_container(kc)
+        probe = GraphNode(container_id=kc.container_id, title="probe")
+        seed.upsert_node(probe)             # tạo feed.jsonl — trước đó revision 0 luôn phải reload
+        seed.delete_node(probe.node_id)
+        since = seed.graph_revision(kc.container_id)
+
+        ctx = multiprocessing.get_context("spawn")
+        barrier, out = ctx.Barrier(procs), ctx.Queue()
+        workers = [ctx.Process(target=_worker, args=(tmp, kc.container_id, p, ops, layout, barrier, out))
+                   for p in range(procs)]
+        t0 = time.perf_counter()
+        for w in workers:
+            w.start()
+        reports = [out.get() for _ in workers]
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - t0
+
+        live: dict[str, str] = {}
+        deleted: set[str] = set()
+        edges: list[tuple[str, str, str]] = []
+        errors: list[str] = []
+        for r in reports:
+            live.update(r["live"])
+            deleted.update(r["deleted"])
+            edges += r["edges"]
+            errors += [f"p{r['proc']} {e}" for e in r["errors"]]
+
+        # Trạng thái cuối đọc từ đĩa bằng process khác (spawn) — không dùng index cache của process này
+        with ctx.Pool(1) as pool:
+            final = pool.apply(_snapshot, (tmp, kc.container_id, layout, since))
+        leftovers = [p.name for p in Path(tmp).rglob("*.tmp")]
+
+    if set(final["nodes"]) != set(live):
+        missing, extra = set(live) - set(final["nodes"]), set(final["nodes"]) - set(live)
+        errors.append(f"nodes lệch: thiếu {len(missing)}, thừa {len(extra)}")
+    wrong_titles = [nid for nid, title in live.items() if final["nodes"].get(nid, title) != title]
+    if wrong_titles:
+        errors.append(f"{len(wrong_titles)} node sai title (mất bản sửa)")
+    resurrected = deleted & set(final["nodes"])
+    if resurrected:
+        errors.append(f"{len(resurrected)} node đã xoá sống lại (mất tombstone)")
+    stale = [r["proc"] for r in reports if set(r["seen"]) != set(live)]
+    if stale:
+        errors.append(f"process {stale} đọc trạng thái cũ sau barrier")
+    # Process chỉ nối / xoá node của chính nó → edge còn sống ⇔ cả 2 đầu còn sống
+    expected_edges = {eid for eid, a, b in edges if a in live and b in live}
+    if set(final["edges"]) != expected_edges:
+        errors.append(f"edges lệch: {len(final['edges'])} / kỳ vọng {len(expected_edges)}")
+    # Change feed trên đĩa: revision / delta như nhau dù hỏi worker nào
+    revisions = {r["revision"] for r in reports} | {final["revision"]}
+    if len(revisions) != 1:
+        errors.append(f"revision khác nhau giữa các process: {sorted(revisions)}")
+    changes = final["changes"]
+    if changes is None:
+        errors.append("graph_changes(since lúc bắt đầu) = None — feed mất thay đổi")
+    else:
+        if not set(live) <= set(changes["nodes"]):
+            errors.append(f"delta thiếu {len(set(live) - set(changes['nodes']))} node")
+        if not deleted <= set(changes["deleted_nodes"]):
+            errors.append(f"delta thiếu {len(deleted - set(changes['deleted_nodes']))} node đã xoá")
+    if leftovers:
+        errors.append(f"còn file tmp: {leftovers}")
+
+    return {
+        "layout": layout,
+        "procs": procs,
+        "ops_per_proc": ops,
+        "elapsed_s": round(elapsed, 3),
+        "nodes_live": len(live),
+        "nodes_deleted": len(deleted),
+        "edges": len(final["edges"]),
+        "errors": errors[:20],
+    }
+
+
+def _snapshot(data_dir: str, container_id: str, layout: str, since: int) -> dict:
+    storage = FileStorage(Path(data_dir), layout=layout)
+    changes = storage.graph_changes(container_id, since)
+    if changes is not None:
+        changes = {"nodes": [n.node_id for n in changes["nodes"]], "deleted_nodes": changes["deleted_nodes"]}
+    return {
+        "nodes": {n.node_id: n.title for n in storage.list_nodes(container_id)},
+        "edges": [e.edge_id for e in storage.list_edges(container_id)],
+        "revision": storage.graph_revision(container_id),
+        "changes": changes,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--procs", type=int, default=4)
+    ap.add_argument("--ops", type=int, default=400, help="số thao tác mỗi process")
+    ap.add_argument("--layout", action="append", choices=["flat", "partitioned"],
+                    help="lặp lại để chạy nhiều layout (mặc định: cả hai)")
+    args = ap.parse_args(argv)
+
+    results = [run(args.procs, args.ops, layout) for layout in (args.layout or ["flat", "partitioned"])]
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    return 1 if any(r["errors"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Microbenchmark serialization: đường stdlib cũ vs đường nhanh (jsonio / pydantic-core).
+
+  python -m rks.bench.serialization --rows 50000
+
+Sinh 1 file nodes.jsonl `rows` dòng (có document fields tiếng Việt) rồi đo:
+  write    — json.dumps(model_dump(mode="json")) vs model_dump_json()
+  load     — json.loads + validate từng dòng vs _EntityIndex._load (jsonio)
+  tail     — process khác append 1% dòng: reload cả file vs chỉ đọc phần đuôi
+  response — jsonable_encoder + json.dumps vs jsonio.dumps vs projection.dump_list
+In kết quả JSON (giây, best of --repeat).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+
+from .. import jsonio
+from ..models import GraphNode
+from ..projection import NODES, SKELETON_NODE_FIELDS, dump_list
+from ..storage import _TA_NODE, _EntityIndex
+
+
+def make_nodes(n: int) -> list[GraphNode]:
+    return [
+        GraphNode(
+            container_id=f"KC_{i % 4}",
+            title=f"Khái niệm {i}",
+            definition="Định nghĩa của khái niệm, đủ dài như document thật. " * 4,
+            mechanism="Cơ chế vận hành: nguyên nhân → hệ quả. " * 4,
+            assumptions=["giả định 1", "giả định 2"],
+            tags=["bench"],
+        )
+        for i in range(n)
+    ]
+
+
+def best(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return round(min(times), 4)
+
+
+def _stdlib_load(path: Path) -> dict:
+    latest = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            row = json.loads(line)
+            latest[row["node_id"]] = row
+    return {rid: _TA_NODE.validate_python(row) for rid, row in latest.items()}
+
+
+def run(rows: int, repeat: int) -> dict:
+    nodes = make_nodes(rows)
+    tmp = Path(tempfile.mkdtemp(prefix="rks-bench-ser-"))
+    path = tmp / "nodes.jsonl"
+
+    result: dict = {"rows": rows, "orjson": jsonio.HAVE_ORJSON}
+    result["write"] = {
+        "stdlib": best(lambda: [json.dumps(n.model_dump(mode="json"), ensure_ascii=False, default=str)
+                                for n in nodes], repeat),
+        "fast":   best(lambda: [n.model_dump_json() for n in nodes], repeat),
+    }
+    path.write_text("".join(n.model_dump_json() + "\n" for n in nodes), encoding="utf-8")
+    result["file_mb"] = round(path.stat().st_size / 1e6, 1)
+
+    def fast_load():
+        index = _EntityIndex(path, "node_id", _TA_NODE)
+        index.refresh()
+        return index
+
+    result["load"] = {"stdlib": best(lambda: _stdlib_load(path), repeat),
+                      "fast":   best(fast_load, repeat)}
+
+    # Tail: index đã load, process khác append thêm 1% dòng
+    extra = make_nodes(max(1, rows // 100))
+    index = fast_load()
+    with path.open("a", encoding="utf-8") as f:
+        f.writelines(n.model_dump_json() + "\n" for n in extra)
+    t0 = time.perf_counter()
+    index.refresh()
+    tail = time.perf_counter() - t0
+    assert len(index.records) == rows + len(extra)
+    result["tail"] = {"appended": len(extra), "full_reload": best(fast_load, repeat),
+                      "tail_only": round(tail, 4)}
+
+    payload = {"nodes": nodes, "revision": 1}
+    result["response"] = {
+        "jsonable_encoder": best(lambda: json.dumps(jsonable_encoder(payload)).encode(), repeat),
+        "jsonio":           best(lambda: jsonio.dumps(payload), repeat),
+        "dump_list":        best(lambda: dump_list(NODES, nodes), repeat),
+        "dump_list_skeleton": best(lambda: dump_list(NODES, nodes, SKELETON_NODE_FIELDS), repeat),
+    }
+    return result
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=50_000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args(argv)
+    print(json.dumps(run(args.rows, args.repeat), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""
+Benchmark suite storage: đo từng method của AbstractStorage trên mỗi backend
+với workload synthetic (rks.bench.workload).
+
+  python -m rks.bench.storage_suite --nodes 1000 10000 --edits 10
+  python -m rks.bench.storage_suite --nodes 100000 --backend file --layout partitioned
+  python -m rks.bench.storage_suite --out base.json
+  python -m rks.bench.storage_suite --baseline base.json --tolerance 1.5
+
+Mỗi (backend, số node) chạy trong 1 process riêng (spawn) → peak RSS không
+lẫn giữa các lần chạy. Trong process: populate workload (kể cả --edits vòng
+sửa mọi node), rồi đo lần lượt đọc → ghi → bảo trì → xoá (thao tác phá huỷ
+cuối cùng, trên node ngẫu nhiên). Mỗi thao tác lặp tới --ops lần hoặc hết
+--budget giây (tối thiểu 3 lần); phần chuẩn bị (prepare) không tính giờ.
+
+Mỗi thao tác: ops, throughput (ops/s), p50 / p99 / max (ms) và rss_peak_mb —
+peak RSS của process tính tới lúc thao tác xong (đơn điệu tăng: bước nhảy chỉ
+ra thao tác đẩy peak lên). "uncovered" liệt kê method public của
+AbstractStorage chưa có thao tác đo — phải rỗng.
+
+--baseline: so p50 với file JSON của lần chạy trước (--out), thao tác chậm
+hơn --tolerance lần (và hơn 0.05 ms) là regression → exit code 1.
+"""
+
+from __future__ import annotations
+
+import argparse
+import inspect
+import json
+import math
+import multiprocessing
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, NamedTuple
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+from .. import storage as storage_mod
+from ..models import GraphEdge, KnowledgeContainer
+from ..storage import AbstractStorage, open_storage
+from .workload import edit_node, fake_text, make_node, make_source, populate
+
+MIN_SAMPLES  = 3
+_REGRESSION_FLOOR_MS = 0.05     # chênh lệch p50 nhỏ hơn mức này coi là nhiễu
+
+
+class Op(NamedTuple):
+    name:    str                              # "method" hoặc "method[biến thể]"
+    call:    Callable[[Any], Any]             # phần được đo — nhận giá trị prepare trả về
+    prepare: Callable[[int], Any] | None = None
+    max_ops: int | None = None                # trần riêng cho thao tác nặng (compact…)
+
+
+def _rss_peak_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)     # macOS: byte, Linux: KB
+
+
+def _pct(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def measure(op: Op, ops: int, budget_s: float) -> dict:
+    samples: list[float] = []
+    deadline = time.perf_counter() + budget_s
+    for i in range(min(ops, op.max_ops or ops)):
+        args = op.prepare(i) if op.prepare else None
+        t0 = time.perf_counter()
+        op.call(args)
+        samples.append(time.perf_counter() - t0)
+        if len(samples) >= MIN_SAMPLES and time.perf_counter() > deadline:
+            break
+    total = sum(samples)
+    return {
+        "ops": len(samples),
+        "throughput": round(len(samples) / total, 1) if total else None,
+        "p50_ms": round(_pct(samples, 0.50) * 1000, 3),
+        "p99_ms": round(_pct(samples, 0.99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+        "rss_peak_mb": _rss_peak_mb(),
+    }
+
+
+def build_ops(storage: AbstractStorage, data_dir: Path, backend: str, wl, rng: random.Random) -> list[Op]:
+    """Thao tác theo thứ tự chạy: đọc → ghi → bảo trì → xoá."""
+    cid = wl.container_id
+    nodes, edges, sources = list(wl.node_ids), list(wl.edge_ids), list(wl.source_ids)
+    pick = lambda ids: lambda _: rng.choice(ids)            # noqa: E731
+    query = lambda _: " ".join(fake_text(rng, 12, 0.2).rstrip(".").split()[:2])  # noqa: E731
+    seq = iter(range(10**9))
+
+    def fresh_node(_=None) -> str:
+        node = make_node(rng, cid, len(nodes) + next(seq))
+        storage.upsert_node(node)
+        storage.upsert_edge(GraphEdge(container_id=cid, source_node_id=rng.choice(nodes),
+                                      target_node_id=node.node_id))
+        return node.node_id
+
+    def changed_since(_) -> int:
+        revision = storage.graph_revision(cid)
+        for _ in range(10):
+            storage.upsert_node(edit_node(rng, storage.get_node(rng.choice(nodes))))
+        return revision
+
+    def open_cold(_) -> None:
+        """Worker mới mở data_dir: FileStorage load lại index từ đĩa, SQLite mở connection mới."""
+        key = data_dir.resolve()
+        current = storage_mod._STATES.pop(key, None)      # FileStorage: không dùng state đang mở
+        try:
+            fresh = open_storage(data_dir, backend)
+            fresh.list_nodes(cid)
+            fresh.close()
+        finally:
+            if current is not None:
+                storage_mod._STATES[key] = current
+
+    def batch_edits(picked: list[str]) -> None:
+        with storage.batch():
+            for nid in picked:
+                storage.upsert_node(edit_node(rng, storage.get_node(nid)))
+
+    def small_container(_) -> str:
+        kc = KnowledgeContainer(title="bench tạm")
+        storage.upsert_container(kc)
+        with storage.batch():
+            for i in range(50):
+                storage.upsert_node(make_node(rng, kc.container_id, i))
+        return kc.container_id
+
+    def take(ids: list[str]) -> Callable[[int], str]:
+        return lambda _: ids.pop(rng.randrange(len(ids)))
+
+    def delete_node(nid: str) -> None:
+        storage.delete_node(nid)
+        if nid in nodes:
+            nodes.remove(nid)
+
+    def cascade(nid: str) -> None:
+        for gone in storage.delete_node_cascade(nid):
+            if gone in nodes:
+                nodes.remove(gone)
+
+    # ── đọc ──
+    ops = [
+        Op("list_containers",    lambda _: storage.list_containers()),
+        Op("get_container",      lambda _: storage.get_container(cid)),
+        Op("list_sources",       lambda _: storage.list_sources(cid)),
+        Op("get_source",         storage.get_source, pick(sources)),
+        Op("list_nodes",         lambda _: storage.list_nodes(cid)),
+        Op("get_node",           storage.get_node, pick(nodes)),
+        Op("list_edges",         lambda _: storage.list_edges(cid)),
+        Op("get_edge",           storage.get_edge, pick(edges)),
+        Op("iter_records[nodes]", lambda _: sum(len(chunk) for chunk in storage.iter_records("nodes", cid))),
+        Op("adjacency",          lambda _: storage.adjacency(cid)),
+        Op("get_neighborhood",   lambda nid: storage.get_neighborhood(nid, hops=2), pick(nodes)),
+        Op("node_degree",        storage.node_degree, pick(nodes)),
+        Op("search",             lambda q: storage.search(q, cid), query),
+        Op("similar_nodes",      lambda q: storage.similar_nodes(cid, q), query),
+        Op("graph_revision",     lambda _: storage.graph_revision(cid)),
+        Op("node_history",       storage.node_history, pick(nodes)),
+        Op("graph_at",           lambda _: storage.graph_at(cid, wl.midpoint)),
+        Op("open[cold]",         open_cold),
+        # ── ghi ──
+        Op("upsert_container",   lambda kc: storage.upsert_container(kc),
+           lambda _: KnowledgeContainer(title=fake_text(rng, 30))),
+        Op("upsert_source",      storage.upsert_source, lambda i: make_source(rng, cid, 10**6 + i)),
+        Op("upsert_node",        storage.upsert_node, lambda _: edit_node(rng, storage.get_node(rng.choice(nodes)))),
+        Op("upsert_edge",        storage.upsert_edge,
+           lambda _: GraphEdge(container_id=cid, source_node_id=rng.choice(nodes), target_node_id=rng.choice(nodes))),
+        Op("batch[100 upsert_node]", batch_edits, lambda _: rng.sample(nodes, min(100, len(nodes)))),
+        Op("graph_changes[10 edits]", lambda since: storage.graph_changes(cid, since), changed_since),
+        Op("set_node_positions[10]", lambda pos: storage.set_node_positions(cid, pos),
+           lambda _: {nid: (rng.uniform(-500, 500), rng.uniform(-500, 500)) for nid in rng.sample(nodes, 10)}),
+        Op("ensure_layout[1 new node]", lambda _: storage.ensure_layout(cid), fresh_node),
+        # ── bảo trì ──
+        Op("garbage_ratio",      lambda _: storage.garbage_ratio()),
+        Op("maybe_compact[no-op]", lambda _: storage.maybe_compact(1.01)),
+        Op("compact",            lambda _: storage.compact(), max_ops=3),
+        Op("close",              lambda s: s.close(), lambda _: open_storage(data_dir, backend)),
+        # ── xoá ──
+        Op("delete_edge",        storage.delete_edge, take(edges), max_ops=len(edges)),
+        Op("delete_source",      storage.delete_source, take(sources), max_ops=len(sources)),
+        Op("delete_node",        delete_node, pick(nodes)),
+        # nhánh nhỏ gần lá — cascade từ gần gốc xoá gần hết cây, các lần sau không còn gì để đo
+        Op("delete_node_cascade", cascade, lambda _: rng.choice(nodes[len(nodes) // 4:])),
+        Op("delete_container[50 nodes]", storage.delete_container, small_container),
+    ]
+    return ops
+
+
+def covered(ops: list[Op]) -> list[str]:
+    """Method public của AbstractStorage chưa có Op nào đo."""
+    public = {name for name, _ in inspect.getmembers(AbstractStorage, callable) if not name.startswith("_")}
+    names = {op.name.split("[")[0] for op in ops} | {"batch"}   # batch đo qua batch[100 upsert_node]
+    return sorted(public - names)
+
+
+def run(backend: str, n_nodes: int, edits: int, ops: int, budget_s: float,
+        layout: str | None, seed: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp) / "store"
+        data_dir.mkdir()
+        if backend == storage_mod.BACKEND_FILE and layout:
+            storage: AbstractStorage = storage_mod.FileStorage(data_dir, layout=layout)
+        else:
+            storage = open_storage(data_dir, backend)
+        wl = populate(storage, n_nodes, edits, seed=seed)
+        ratio, rows = storage.garbage_ratio()
+        result: dict = {
+            "backend": backend,
+            "layout": getattr(storage, "layout", None),
+            "nodes": n_nodes,
+            "edges": len(wl.edge_ids),
+            "edits_per_node": edits,
+            "populate_s": wl.populate_s,
+            "populate_rows_per_s": round(wl.rows / wl.populate_s, 1) if wl.populate_s else None,
+            "garbage_ratio": round(ratio, 3),
+            "disk_mb": round(sum(p.stat().st_size for p in data_dir.rglob("*") if p.is_file()) / 2**20, 2),
+            "rss_after_populate_mb": _rss_peak_mb(),
+            "ops": {},
+        }
+        suite = build_ops(storage, data_dir, backend, wl, random.Random(seed))
+        for op in suite:
+            result["ops"][op.name] = measure(op, ops, budget_s)
+        result["uncovered"] = covered(suite)
+        result["rss_peak_mb"] = _rss_peak_mb()
+        storage.close()
+    return result
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """Regression: p50 chậm hơn baseline `tolerance` lần (cùng backend, layout, số node)."""
+    base = {(r["backend"], r["layout"], r["nodes"]): r for r in baseline}
+    found = []
+    for r in results:
+        old = base.get((r["backend"], r["layout"], r["nodes"]))
+        if old is None:
+            continue
+        for name, stats in r["ops"].items():
+            before = old["ops"].get(name)
+            if before is None:
+                continue
+            now, then = stats["p50_ms"], before["p50_ms"]
+            if now > then * tolerance and now - then > _REGRESSION_FLOOR_MS:
+                found.append(f"{r['backend']}/{r['nodes']} {name}: p50 {then} → {now} ms")
+    return found
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--nodes", type=int, nargs="+", default=[1000, 10000])
+    ap.add_argument("--edits", type=int, default=10, help="số vòng sửa mọi node trước khi đo")
+    ap.add_argument("--backend", nargs="+", default=["file", "sqlite"], choices=["file", "sqlite"])
+    ap.add_argument("--layout", choices=["flat", "partitioned"], help="layout của FileStorage")
+    ap.add_argument("--ops", type=int, default=200, help="số lần tối đa mỗi thao tác")
+    ap.add_argument("--budget", type=float, default=2.0, help="giây tối đa mỗi thao tác")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=Path, help="ghi kết quả JSON ra file (làm baseline lần sau)")
+    ap.add_argument("--baseline", type=Path, help="so với kết quả JSON của lần chạy trước")
+    ap.add_argument("--tolerance", type=float, default=1.5)
+    args = ap.parse_args(argv)
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for backend in args.backend:
+        for n in args.nodes:
+            with ctx.Pool(1) as pool:       # 1 process / lần chạy → peak RSS riêng
+                results.append(pool.apply(run, (backend, n, args.edits, args.ops, args.budget,
+                                                args.layout, args.seed)))
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    print(text)
+    if args.out:
+        args.out.write_text(text + "\n", encoding="utf-8")
+
+    failed = [f"{r['backend']}/{r['nodes']}: chưa đo {r['uncovered']}" for r in results if r["uncovered"]]
+    if args.baseline:
+        failed += compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+    for line in failed:
+        print(line, file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
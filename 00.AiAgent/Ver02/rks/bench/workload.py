@@ -0,0 +1,160 @@
+"""
+Sinh workload synthetic cho benchmark storage: container, source, graph và
+lịch sử edit với kích thước text giống dữ liệu thật.
+
+  from rks.bench.workload import populate
+  wl = populate(storage, n_nodes=10_000, edits=10)
+
+Graph: cây branching 3 + 5% edge chéo ngẫu nhiên (như bench layout / cascade).
+Text: câu ghép từ âm tiết tiếng Việt, độ dài log-normal quanh median của từng
+field (definition ~300 ký tự, mechanism ~500…) — đủ dấu để đi qua đường fold
+của search / embedding như dữ liệu thật. Node có sẵn x/y (container đã layout)
+→ ensure_layout chỉ đặt node mới. Mỗi vòng edit sửa 1 field document của mọi
+node (touch + version += 1), ghi theo lô — log append-only giữ mọi revision.
+Cùng seed → cùng workload.
+"""
+
+from __future__ import annotations
+
+import math
+import random
+import time
+from datetime import datetime
+from typing import NamedTuple
+
+from ..models import GraphEdge, GraphNode, KnowledgeContainer, NodeType, RelationType, Source, SourceType
+from ..storage import AbstractStorage
+
+_SYLLABLES = (
+    "khái niệm cơ chế hệ quả nguyên nhân điều kiện giả định biên giới hạn mô hình "
+    "dữ liệu kinh tế thị trường cân bằng năng lượng nhiệt động học sinh thái quần thể "
+    "tương tác phản hồi tín hiệu cấu trúc chức năng quá trình biến đổi ổn định rủi ro "
+    "chi phí lợi ích chính sách thể chế hành vi nhận thức học tập trí nhớ ngôn ngữ "
+    "đường cong độ dốc tỉ lệ xác suất phân phối mẫu kiểm định sai số đo lường"
+).split()
+_TAGS = [f"chủ đề {i}" for i in range(30)]
+
+# median số ký tự của từng field document
+TEXT_MEDIANS = {"definition": 300, "mechanism": 500, "boundary_conditions": 150, "assumption": 80,
+                "notes": 200}
+_EDIT_FIELDS = ("definition", "mechanism", "boundary_conditions", "assumptions")
+
+
+class Workload(NamedTuple):
+    container_id: str
+    node_ids:     list[str]
+    edge_ids:     list[str]
+    source_ids:   list[str]
+    midpoint:     datetime      # mốc giữa lịch sử edit — graph_at ở đây thấy 1 nửa số revision
+    populate_s:   float
+    rows:         int           # số lần ghi record (kể cả edit)
+
+
+def fake_text(rng: random.Random, median_chars: int, sigma: float = 0.6) -> str:
+    """Câu tiếng Việt ~median_chars ký tự (log-normal, tối thiểu 1 từ)."""
+    target = max(1, int(rng.lognormvariate(math.log(median_chars), sigma)))
+    words, size = [], 0
+    while size < target:
+        word = rng.choice(_SYLLABLES)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words).capitalize() + "."
+
+
+def make_node(rng: random.Random, container_id: str, i: int, spread: float = 0.0) -> GraphNode:
+    angle, radius = rng.uniform(0, 2 * math.pi), spread * math.sqrt(rng.random())
+    return GraphNode(
+        container_id=container_id,
+        title=f"{fake_text(rng, 24, 0.3).rstrip('.')} {i}",
+        node_type=rng.choice(list(NodeType)),
+        definition=fake_text(rng, TEXT_MEDIANS["definition"]),
+        mechanism=fake_text(rng, TEXT_MEDIANS["mechanism"]) if rng.random() < 0.7 else "",
+        boundary_conditions=fake_text(rng, TEXT_MEDIANS["boundary_conditions"]) if rng.random() < 0.4 else "",
+        assumptions=[fake_text(rng, TEXT_MEDIANS["assumption"]) for _ in range(rng.randint(0, 4))],
+        tags=rng.sample(_TAGS, rng.randint(0, 4)),
+        x=round(radius * math.cos(angle), 1) if spread else None,
+        y=round(radius * math.sin(angle), 1) if spread else None,
+    )
+
+
+def make_source(rng: random.Random, container_id: str, i: int) -> Source:
+    kind = rng.choice(list(SourceType))
+    return Source(
+        container_id=container_id,
+        type=kind,
+        label=f"{fake_text(rng, 40, 0.3).rstrip('.')} ({i})",
+        path_or_url=f"https://example.org/doc/{i}" if kind == SourceType.URL else f"uploads/doc_{i}.pdf",
+        notes=fake_text(rng, TEXT_MEDIANS["notes"]) if rng.random() < 0.5 else "",
+    )
+
+
+def edit_node(rng: random.Random, node: GraphNode) -> GraphNode:
+    """1 lần sửa document như Document Panel: đổi 1 field, touch, version += 1."""
+    field = rng.choice(_EDIT_FIELDS)
+    if field == "assumptions":
+        update = {"assumptions": [fake_text(rng, TEXT_MEDIANS["assumption"]) for _ in range(rng.randint(1, 4))]}
+    else:
+        update = {field: fake_text(rng, TEXT_MEDIANS[field])}
+    edited = node.model_copy(update={**update, "version": node.version + 1})
+    edited.touch()
+    return edited
+
+
+def populate(storage: AbstractStorage, n_nodes: int, edits: int = 10, sources: int | None = None,
+             branching: int = 3, cross: float = 0.05, seed: int = 0, chunk: int = 1000) -> Workload:
+    """Ghi 1 container n_nodes node + edge + source rồi `edits` vòng sửa mọi node.
+    Mỗi lô ≤ chunk record đi qua storage.batch()."""
+    rng = random.Random(seed)
+    t0 = time.perf_counter()
+    kc = KnowledgeContainer(title=f"bench {n_nodes} nodes", description=fake_text(rng, 120))
+    storage.upsert_container(kc)
+    cid = kc.container_id
+    spread = 130.0 * math.sqrt(n_nodes) / 2       # ≈ bán kính layout của rks/layout.py
+    rows = 1
+
+    source_ids = []
+    n_sources = sources if sources is not None else max(1, n_nodes // 50)
+    with storage.batch():
+        for i in range(n_sources):
+            s = make_source(rng, cid, i)
+            storage.upsert_source(s)
+            source_ids.append(s.source_id)
+    rows += n_sources
+
+    nodes: list[GraphNode] = []
+    edge_ids: list[str] = []
+    relations = list(RelationType)
+    for start in range(0, n_nodes, chunk):
+        with storage.batch():
+            for i in range(start, min(n_nodes, start + chunk)):
+                node = make_node(rng, cid, i, spread)
+                storage.upsert_node(node)
+                nodes.append(node)
+                if i:
+                    parent = nodes[(i - 1) // branching]
+                    edge = GraphEdge(container_id=cid, source_node_id=parent.node_id,
+                                     target_node_id=node.node_id, relation_type=rng.choice(relations))
+                    storage.upsert_edge(edge)
+                    edge_ids.append(edge.edge_id)
+    with storage.batch():
+        for _ in range(int(n_nodes * cross)):
+            a, b = rng.sample(nodes, 2)
+            edge = GraphEdge(container_id=cid, source_node_id=a.node_id, target_node_id=b.node_id,
+                             relation_type=rng.choice(relations))
+            storage.upsert_edge(edge)
+            edge_ids.append(edge.edge_id)
+    rows += n_nodes + len(edge_ids)
+
+    midpoint = datetime.utcnow()
+    for round_ in range(edits):
+        if round_ == edits // 2:
+            midpoint = datetime.utcnow()
+        for start in range(0, n_nodes, chunk):
+            with storage.batch():
+                for i in range(start, min(n_nodes, start + chunk)):
+                    nodes[i] = edit_node(rng, nodes[i])
+                    storage.upsert_node(nodes[i])
+        rows += n_nodes
+
+    return Workload(cid, [n.node_id for n in nodes], edge_ids, source_ids, midpoint,
+                    round(time.perf_counter() - t0, 3), rows)
@@ -0,0 +1,271 @@
+"""
+bundle.py — Export / import 1 container dạng NDJSON (tuỳ chọn gzip), stream.
+
+Mỗi dòng 1 JSON object:
+  {"type": "header", "format": "rks-bundle", "version": 1, "container_id": …, "exported_at": …}
+  {"type": "container", "data": {…}}
+  {"type": "source", "data": {…}}     … mọi source
+  {"type": "node",   "data": {…}}     … mọi node (kèm x/y layout)
+  {"type": "edge",   "data": {…}}     … mọi edge — luôn sau node (import cần map id node)
+  {"type": "end", "counts": {"sources": n, "nodes": n, "edges": n}}
+Chỉ record sống (như sau compact) — không kèm bản cũ / tombstone trong JSONL.
+
+Export: generator theo từng khối storage.iter_records → bộ nhớ không phụ
+thuộc kích thước container. Import: BundleReader tách body (đọc theo chunk)
+thành dòng + gom thành lô ≤ BATCH_ROWS; BundleImporter validate cả lô bằng 1
+lần gọi pydantic-core, đổi id mới cho mọi record (clone cạnh container gốc,
+không đè) rồi ghi qua storage.batch(). RAM chỉ giữ 1 lô + map id node cũ → mới.
+Lỗi giữa chừng → abort() xoá container đang import dở.
+"""
+from __future__ import annotations
+
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator
+
+from pydantic import TypeAdapter, ValidationError
+
+from . import jsonio
+from .models import GraphEdge, GraphNode, KnowledgeContainer, Source
+from .storage import AbstractStorage
+
+FORMAT         = "rks-bundle"
+VERSION        = 1
+BATCH_ROWS     = 1000
+MAX_LINE_BYTES = 16 * 1024 * 1024
+MEDIA_TYPE      = "application/x-ndjson"
+MEDIA_TYPE_GZIP = "application/gzip"
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+# type dòng → (kind của storage.iter_records, adapter validate cả lô)
+_KINDS = {
+    "source": ("sources", TypeAdapter(list[Source])),
+    "node":   ("nodes",   TypeAdapter(list[GraphNode])),
+    "edge":   ("edges",   TypeAdapter(list[GraphEdge])),
+}
+_ORDER = ["header", "container", "source", "node", "edge", "end"]
+
+
+class BundleError(ValueError):
+    """Bundle sai định dạng — message kèm số dòng."""
+
+
+def _line(obj) -> bytes:
+    return jsonio.dumps(obj) + b"\n"
+
+
+# ── Export ─────────────────────────────────────────────────────────────────
+
+def export_lines(storage: AbstractStorage, container: KnowledgeContainer,
+                 chunk: int = BATCH_ROWS) -> Iterator[bytes]:
+    """Các dòng NDJSON của container, mỗi lần yield 1 khối ≤ chunk record."""
+    cid = container.container_id
+    yield _line({"type": "header", "format": FORMAT, "version": VERSION,
+                 "container_id": cid, "exported_at": datetime.utcnow()})
+    yield _line({"type": "container", "data": container})
+    counts = {}
+    for kind_type, (kind, _) in _KINDS.items():
+        counts[kind] = 0
+        for records in storage.iter_records(kind, cid, chunk):
+            counts[kind] += len(records)
+            yield b"".join(_line({"type": kind_type, "data": r}) for r in records)
+    yield _line({"type": "end", "counts": counts})
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Nén gzip từng khối khi đang stream (không dựng cả file trong RAM)."""
+    comp = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for data in chunks:
+        out = comp.compress(data)
+        if out:
+            yield out
+    yield comp.flush()
+
+
+# ── Import ─────────────────────────────────────────────────────────────────
+
+class BundleReader:
+    """Nhận body theo chunk (gzip tự nhận theo magic bytes) → lô dòng đã parse.
+    feed() / close() trả list các lô [(số dòng, object), …], mỗi lô ≤ BATCH_ROWS."""
+
+    def __init__(self, batch_rows: int = BATCH_ROWS):
+        self.batch_rows = batch_rows
+        self._inflate: zlib._Decompress | None = None
+        self._started = False
+        self._buf = b""
+        self._lineno = 0
+        self._batch: list[tuple[int, dict]] = []
+
+    def feed(self, data: bytes) -> list[list[tuple[int, dict]]]:
+        if not self._started:
+            if not data:
+                return []
+            self._started = True
+            if data[:2] == _GZIP_MAGIC:
+                self._inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self._inflate is not None:
+            try:
+                data = self._inflate.decompress(data)
+            except zlib.error as e:
+                raise BundleError(f"gzip hỏng: {e}") from e
+        self._buf += data
+        batches: list[list[tuple[int, dict]]] = []
+        start = 0
+        while True:
+            end = self._buf.find(b"\n", start)
+            if end < 0:
+                break
+            self._add(self._buf[start:end], batches)
+            start = end + 1
+        self._buf = self._buf[start:]
+        if len(self._buf) > MAX_LINE_BYTES:
+            raise BundleError(f"dòng {self._lineno + 1}: dài quá {MAX_LINE_BYTES} byte")
+        return batches
+
+    def close(self) -> list[list[tuple[int, dict]]]:
+        batches: list[list[tuple[int, dict]]] = []
+        if self._inflate is not None:
+            self._buf += self._inflate.flush()
+            if not self._inflate.eof:
+                raise BundleError("gzip bị cắt cụt")
+        if self._buf.strip():
+            self._add(self._buf, batches)
+        self._buf = b""
+        if self._batch:
+            batches.append(self._batch)
+            self._batch = []
+        return batches
+
+    def _add(self, raw: bytes, batches: list) -> None:
+        self._lineno += 1
+        if not raw.strip():
+            return
+        try:
+            row = jsonio.loads(raw)
+        except ValueError as e:
+            raise BundleError(f"dòng {self._lineno}: JSON không hợp lệ ({e})") from e
+        if not isinstance(row, dict) or row.get("type") not in _ORDER:
+            raise BundleError(f"dòng {self._lineno}: thiếu / sai 'type'")
+        self._batch.append((self._lineno, row))
+        if len(self._batch) >= self.batch_rows:
+            batches.append(self._batch)
+            self._batch = []
+
+
+def _new_id(model, field: str) -> str:
+    """Id mới theo default_factory của model (giữ prefix N_ / E_ / SRC_ / KC_)."""
+    return model.model_fields[field].default_factory()
+
+
+class BundleImporter:
+    """Ghi bundle thành 1 container MỚI của `user` (id mới cho mọi record).
+    add(batch) theo thứ tự BundleReader trả ra, xong gọi finish(); lỗi → abort()."""
+
+    def __init__(self, storage: AbstractStorage, user: str, title: str | None = None):
+        self.storage = storage
+        self.user = user
+        self.title = title
+        self.container: KnowledgeContainer | None = None
+        self.counts = {"sources": 0, "nodes": 0, "edges": 0, "skipped_edges": 0}
+        self._node_ids: dict[str, str] = {}         # node_id trong bundle → node_id mới
+        self._stage = -1                             # index trong _ORDER của dòng gần nhất
+        self._declared: dict | None = None           # counts ở dòng "end"
+
+    def _advance(self, lineno: int, kind: str) -> None:
+        stage = _ORDER.index(kind)
+        if stage < self._stage or (stage == self._stage and kind in ("header", "container", "end")):
+            raise BundleError(f"dòng {lineno}: '{kind}' sai thứ tự")
+        if (stage > 0 and self._stage < 0) or (stage > 1 and self.container is None):
+            raise BundleError(f"dòng {lineno}: thiếu header / container trước '{kind}'")
+        self._stage = stage
+
+    def add(self, batch: list[tuple[int, dict]]) -> None:
+        """1 lô dòng liên tiếp — các dòng cùng type liền nhau validate + ghi chung."""
+        group: list[tuple[int, dict]] = []
+        for lineno, row in batch:
+            kind = row["type"]
+            if kind != self._current_kind(group):
+                self._flush(group)
+                group = []
+            self._advance(lineno, kind)
+            if kind in _KINDS:
+                group.append((lineno, row.get("data")))
+            else:
+                self._meta(lineno, kind, row)
+        self._flush(group)
+
+    def _current_kind(self, group: list) -> str | None:
+        return _ORDER[self._stage] if group else None
+
+    def _meta(self, lineno: int, kind: str, row: dict) -> None:
+        if kind == "header":
+            if row.get("format") != FORMAT:
+                raise BundleError(f"dòng {lineno}: không phải {FORMAT}")
+            if not isinstance(row.get("version"), int) or row["version"] > VERSION:
+                raise BundleError(f"dòng {lineno}: version {row.get('version')} chưa hỗ trợ")
+        elif kind == "container":
+            try:
+                src = KnowledgeContainer.model_validate(row.get("data"))
+            except ValidationError as e:
+                raise BundleError(f"dòng {lineno}: {_first_error(e)}") from e
+            self.container = KnowledgeContainer(
+                user_id=self.user,
+                title=(self.title or src.title).strip(),
+                description=src.description,
+            )
+            self.storage.upsert_container(self.container)
+        elif kind == "end":
+            self._declared = row.get("counts") or {}
+
+    def _flush(self, group: list[tuple[int, dict]]) -> None:
+        if not group:
+            return
+        kind, adapter = _KINDS[_ORDER[self._stage]]
+        try:
+            records = adapter.validate_python([data for _, data in group])
+        except ValidationError as e:
+            row = e.errors()[0]["loc"][0]
+            lineno = group[row][0] if isinstance(row, int) else group[0][0]
+            raise BundleError(f"dòng {lineno}: {_first_error(e)}") from e
+        cid = self.container.container_id
+        with self.storage.batch():
+            for r in records:
+                if kind == "sources":
+                    self.storage.upsert_source(r.model_copy(update={
+                        "source_id": _new_id(Source, "source_id"), "container_id": cid}))
+                elif kind == "nodes":
+                    new_id = self._node_ids[r.node_id] = _new_id(GraphNode, "node_id")
+                    self.storage.upsert_node(r.model_copy(update={"node_id": new_id, "container_id": cid}))
+                else:
+                    src, dst = self._node_ids.get(r.source_node_id), self._node_ids.get(r.target_node_id)
+                    if src is None or dst is None:
+                        self.counts["skipped_edges"] += 1
+                        continue
+                    self.storage.upsert_edge(r.model_copy(update={
+                        "edge_id": _new_id(GraphEdge, "edge_id"), "container_id": cid,
+                        "source_node_id": src, "target_node_id": dst}))
+                self.counts[kind] += 1
+
+    def finish(self) -> dict:
+        if self.container is None:
+            raise BundleError("bundle rỗng / thiếu container")
+        if self._declared is None:
+            raise BundleError("thiếu dòng 'end' — bundle bị cắt cụt?")
+        for kind in ("sources", "nodes", "edges"):
+            declared = self._declared.get(kind)
+            got = self.counts[kind] + (self.counts["skipped_edges"] if kind == "edges" else 0)
+            if declared is not None and declared != got:
+                raise BundleError(f"{kind}: bundle khai báo {declared}, đọc được {got}")
+        return {"container": self.container, "counts": self.counts}
+
+    def abort(self) -> None:
+        """Xoá container đang import dở (nếu đã tạo)."""
+        if self.container is not None:
+            self.storage.delete_container(self.container.container_id)
+
+
+def _first_error(e: ValidationError) -> str:
+    err = e.errors()[0]
+    loc = ".".join(str(p) for p in err["loc"][1:] if p != "data") or "data"
+    return f"{loc}: {err['msg']}"
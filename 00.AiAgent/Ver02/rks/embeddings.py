@@ -0,0 +1,195 @@
+"""
+embeddings.py — Embedding index local cho node text (không gọi API).
+
+Embedder mặc định là HashingEmbedder: feature hashing trên token đã fold
+(search.tokenize) + bigram liền kề — tiếng Việt nhiều từ ghép 2 âm tiết
+("kinh tế", "cân bằng") nên bigram giữ được nghĩa mà unigram làm mất.
+Vector L2-normalized → cosine = tích vô hướng; top-k = 1 phép nhân ma trận
+NumPy + argpartition.
+
+Embedder khác (model local, API…) cắm qua biến môi trường
+RKS_EMBEDDER="package.module:factory" — factory() trả object có `dim` và
+`embed(texts) -> ndarray (n, dim)` với các hàng đã normalize.
+
+Dùng cho agent: chèn các node gần nghĩa nhất vào system prompt và đánh dấu
+SuggestedNode trùng với node đã có trước khi confirm-suggested tạo node.
+"""
+from __future__ import annotations
+
+import importlib
+import math
+import os
+import threading
+import zlib
+from collections import Counter
+from typing import Iterable, NamedTuple, Protocol
+
+import numpy as np
+
+from .models import GraphNode
+from .search import tokenize
+
+DEFAULT_DIM = 1024
+# cosine > ngưỡng này → SuggestedNode coi là trùng node đã có
+DUPLICATE_THRESHOLD = float(os.getenv("RKS_DUPLICATE_THRESHOLD", "0.8"))
+# Node gần nghĩa chèn vào system prompt phải có cosine > ngưỡng này
+CONTEXT_MIN_SCORE   = 0.2
+
+
+class Embedder(Protocol):
+    dim: int
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """(len(texts), dim) float32, mỗi hàng L2-normalized (hàng 0 nếu text rỗng)."""
+        ...
+
+
+class Similar(NamedTuple):
+    node_id: str
+    title: str
+    score: float        # cosine, 0..1
+
+
+def text_of(title: str, definition: str = "", tags: Iterable[str] = ()) -> str:
+    """Text đại diện để embed: title lặp 2 lần (trọng số cao hơn) + tags + definition."""
+    return "\n".join([title, title, " ".join(tags), definition])
+
+
+def node_text(node: GraphNode) -> str:
+    return text_of(node.title, node.definition, node.tags)
+
+
+class HashingEmbedder:
+    """Signed feature hashing, tf sublinear (1 + log tf). Hash = crc32 → vector
+    ổn định giữa các process (khác hash() của Python bị random hoá)."""
+
+    _MAX_CACHE = 200_000
+
+    def __init__(self, dim: int = DEFAULT_DIM):
+        self.dim = dim
+        self._slots: dict[str, tuple[int, float]] = {}    # feature → (bucket, dấu)
+
+    def _slot(self, feature: str) -> tuple[int, float]:
+        slot = self._slots.get(feature)
+        if slot is None:
+            h = zlib.crc32(feature.encode())
+            slot = (h % self.dim, 1.0 if h & 0x80000000 else -1.0)
+            if len(self._slots) >= self._MAX_CACHE:
+                self._slots.clear()
+            self._slots[feature] = slot
+        return slot
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            features = Counter(tokens)
+            features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+            vec = out[row]
+            for feature, tf in features.items():
+                bucket, sign = self._slot(feature)
+                vec[bucket] += sign * (1.0 + math.log(tf))
+            norm = float(np.linalg.norm(vec))
+            if norm:
+                vec /= norm
+        return out
+
+
+_EMBEDDER: Embedder | None = None
+_EMBEDDER_LOCK = threading.Lock()
+
+
+def get_embedder() -> Embedder:
+    """Embedder dùng chung trong process — RKS_EMBEDDER="module:factory" hoặc HashingEmbedder."""
+    global _EMBEDDER
+    with _EMBEDDER_LOCK:
+        if _EMBEDDER is None:
+            spec = os.getenv("RKS_EMBEDDER", "")
+            if spec:
+                module, _, attr = spec.partition(":")
+                _EMBEDDER = getattr(importlib.import_module(module), attr or "embedder")()
+            else:
+                _EMBEDDER = HashingEmbedder()
+        return _EMBEDDER
+
+
+class EmbeddingIndex:
+    """Ma trận (n, dim) các document (node của 1 container, chunk tài liệu nguồn…),
+    cập nhật từng document.
+
+    remove() dời hàng cuối vào chỗ trống → ma trận luôn liền, không cần compact.
+    """
+
+    def __init__(self, embedder: Embedder | None = None):
+        self.embedder = embedder or get_embedder()
+        self._ids:    list[str] = []
+        self._titles: list[str] = []
+        self._row:    dict[str, int] = {}
+        self._matrix = np.zeros((0, self.embedder.dim), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _reserve(self, n: int) -> None:
+        if n > len(self._matrix):
+            grown = np.zeros((max(n, 2 * len(self._matrix), 64), self.embedder.dim), dtype=np.float32)
+            grown[:len(self._ids)] = self._matrix[:len(self._ids)]
+            self._matrix = grown
+
+    def add(self, items: Iterable[tuple[str, str, str]]) -> None:
+        """Index (hoặc index lại) nhiều document (id, title, text) — embed 1 batch."""
+        items = list(items)
+        if not items:
+            return
+        vectors = self.embedder.embed([text for _, _, text in items])
+        self._reserve(len(self._ids) + len(items))
+        for (doc_id, title, _), vec in zip(items, vectors):
+            row = self._row.get(doc_id)
+            if row is None:
+                row = self._row[doc_id] = len(self._ids)
+                self._ids.append(doc_id)
+                self._titles.append(title)
+            else:
+                self._titles[row] = title
+            self._matrix[row] = vec
+
+    def add_nodes(self, nodes: Iterable[GraphNode]) -> None:
+        self.add((n.node_id, n.title, node_text(n)) for n in nodes)
+
+    def remove(self, doc_id: str) -> None:
+        row = self._row.pop(doc_id, None)
+        if row is None:
+            return
+        last = len(self._ids) - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            self._ids[row], self._titles[row] = self._ids[last], self._titles[last]
+            self._row[self._ids[row]] = row
+        self._ids.pop()
+        self._titles.pop()
+
+    def nearest(self, text: str, k: int = 5, exclude: Iterable[str] = (),
+                min_score: float = 0.0) -> list[Similar]:
+        """k document có cosine với `text` cao nhất (> min_score), bỏ qua id trong `exclude`."""
+        n = len(self._ids)
+        if not n or k <= 0:
+            return []
+        query = self.embedder.embed([text])[0]
+        if not query.any():
+            return []
+        scores = self._matrix[:n] @ query
+        for doc_id in exclude:
+            row = self._row.get(doc_id)
+            if row is not None:
+                scores[row] = -np.inf
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [Similar(self._ids[i], self._titles[i], round(float(scores[i]), 4))
+                for i in top if scores[i] > min_score]
+
+
+def build_embedding_index(nodes: Iterable[GraphNode]) -> EmbeddingIndex:
+    index = EmbeddingIndex()
+    index.add_nodes(nodes)
+    return index
@@ -0,0 +1,74 @@
+"""
+filelock.py — Khoá file giữa các process (uvicorn --workers N) + ghi file atomic.
+
+FileLock dùng fcntl.flock (advisory, độc quyền) trên 1 file lock riêng. Trong
+1 process lock là reentrant (đếm độ sâu) và KHÔNG thay cho threading lock —
+caller giữ threading lock của mình trước khi vào FileLock. fd mở lại sau fork
+(flock gắn với open file description — dùng chung fd thì không khoá được nhau).
+Windows không có fcntl → FileLock không làm gì (chỉ chạy 1 process).
+"""
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:         # Windows
+    fcntl = None
+
+
+class FileLock:
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: int | None = None
+        self._pid = 0
+        self._depth = 0
+
+    def _open(self) -> int:
+        if self._fd is None or self._pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+            self._depth = 0
+        return self._fd
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if fcntl is not None and (self._depth == 0 or self._pid != os.getpid()):
+            flags = fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB)
+            try:
+                fcntl.flock(self._open(), flags)
+            except BlockingIOError:
+                return False
+        self._depth += 1
+        return True
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)          # đóng fd cũng nhả flock
+            self._fd, self._depth = None, 0
+
+    def __enter__(self) -> FileLock:
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+def atomic_write_bytes(path: Path, data: bytes, fsync: bool = True) -> None:
+    """Ghi tmp (tên riêng theo process + thread) rồi os.replace — reader ở process
+    khác luôn thấy bản cũ hoặc bản mới trọn vẹn, không bao giờ thấy file ghi dở."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with tmp.open("wb") as f:
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Callable, Iterable, NamedTuple
+
+from .models import GraphEdge, GraphNode
+
+
+class Adjacency:
+    """Outgoing / incoming adjacency của 1 container graph, build O(E) từ list edges.
+
+    out[n] — các edge có source_node_id == n
+    inc[n] — các edge có target_node_id == n
+    """
+
+    def __init__(self, edges: Iterable[GraphEdge]):
+        self.out: dict[str, list[GraphEdge]] = {}
+        self.inc: dict[str, list[GraphEdge]] = {}
+        for e in edges:
+            self.out.setdefault(e.source_node_id, []).append(e)
+            self.inc.setdefault(e.target_node_id, []).append(e)
+
+    def children(self, node_id: str) -> list[str]:
+        return [e.target_node_id for e in self.out.get(node_id, ())]
+
+    def parents(self, node_id: str) -> list[str]:
+        return [e.source_node_id for e in self.inc.get(node_id, ())]
+
+    def incident(self, node_id: str) -> list[GraphEdge]:
+        """Mọi edge chạm node (cả 2 chiều; self-loop chỉ tính 1 lần)."""
+        out = self.out.get(node_id, [])
+        return out + [e for e in self.inc.get(node_id, ()) if e.source_node_id != node_id]
+
+    def degree(self, node_id: str) -> int:
+        return len(self.incident(node_id))
+
+    def cascade(self, root_id: str) -> list[str]:
+        """BFS từ root theo outgoing edges, chỉ đi tiếp vào child mà root-path là
+        parent DUY NHẤT (đúng 1 incoming edge, từ node hiện tại). O(V + E)."""
+        to_delete: list[str] = []
+        queue = deque([root_id])
+        visited: set[str] = set()
+        while queue:
+            current = queue.popleft()
+            if current in visited:
+                continue
+            visited.add(current)
+            to_delete.append(current)
+            for child in self.children(current):
+                if self.parents(child) == [current]:
+                    queue.append(child)
+        return to_delete
+
+
+class Neighbor(NamedTuple):
+    node_id: str
+    title: str
+    relation_type: str
+    direction: str      # "out": node → neighbor | "in": neighbor → node
+    definition: str     # đã cắt còn tối đa def_chars ký tự
+    hop: int
+
+
+def neighborhood(incident: Callable[[str], list[GraphEdge]], lookup: Callable[[str], GraphNode | None],
+                 root_id: str, hops: int = 1, limit: int = 8, def_chars: int = 120) -> list[Neighbor]:
+    """BFS quanh root theo cả 2 chiều edge, tối đa `hops` bước, dừng khi đủ `limit`.
+    incident(id) → các edge chạm node (vd Adjacency.incident); lookup(id) → node hoặc None.
+    Mỗi edge tới node mới là 1 entry (2 relation tới cùng node → 2 entry).
+    Chi phí O(số edge chạm các node đã thăm) — không phụ thuộc kích thước graph."""
+    out: list[Neighbor] = []
+    seen = {root_id}
+    frontier = [root_id]
+    for hop in range(1, hops + 1):
+        seen_before = set(seen)
+        next_frontier: list[str] = []
+        for current in frontier:
+            for e in incident(current):
+                if e.source_node_id == current:
+                    other, direction = e.target_node_id, "out"
+                else:
+                    other, direction = e.source_node_id, "in"
+                if other in seen_before:
+                    continue
+                nb = lookup(other)
+                if nb is None:
+                    continue
+                if other not in seen:
+                    seen.add(other)
+                    next_frontier.append(other)
+                rel = getattr(e.relation_type, "value", e.relation_type)
+                out.append(Neighbor(other, nb.title, rel, direction, (nb.definition or "")[:def_chars], hop))
+                if len(out) >= limit:
+                    return out
+        frontier = next_frontier
+    return out
@@ -0,0 +1,301 @@
+"""
+ingest.py — Ingest source PDF: extract text → chunk → cache theo content hash.
+
+  extract  pypdf chạy trong process pool (CPU-bound, không giữ GIL của server);
+           mỗi task = PAGES_PER_TASK trang → tiến độ cập nhật theo từng task.
+  chunk    cửa sổ CHUNK_CHARS ký tự, chồng lấn CHUNK_OVERLAP, cắt ở khoảng trắng;
+           mỗi chunk nhớ trang bắt đầu.
+  cache    {data_dir}/chunks/{sha256[:2]}/{sha256}.json — key = sha256 nội dung
+           file nên 1 PDF chỉ parse 1 lần (kể cả khi thêm lại ở container khác);
+           Source.content_hash trỏ tới file cache.
+
+Agent lấy top chunk liên quan (cosine trên EmbeddingIndex) chèn vào prompt —
+không đọc lại PDF mỗi request.
+
+Chỉ ingest file nằm trong thư mục cho phép: RKS_INGEST_ROOTS (phân cách bằng
+os.pathsep) nếu set, không thì {data_dir}/uploads của chính user — user không
+trỏ source được tới file tuỳ ý trên server. Đường dẫn tương đối tính từ data_dir.
+"""
+from __future__ import annotations
+
+import bisect
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import NamedTuple
+
+from . import jsonio
+from .embeddings import EmbeddingIndex
+from .models import IngestStatus, Source, SourceType
+from .storage import AbstractStorage
+
+CHUNK_CHARS    = int(os.getenv("RKS_CHUNK_CHARS", "1200"))
+CHUNK_OVERLAP  = int(os.getenv("RKS_CHUNK_OVERLAP", "200"))
+PAGES_PER_TASK = 8
+INGEST_WORKERS = int(os.getenv("RKS_INGEST_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+CHUNK_MEMO     = 64        # số file chunks giữ trong RAM / user
+UPLOADS_DIR    = "uploads"  # thư mục ingest mặc định trong data_dir của user
+
+
+class Chunk(NamedTuple):
+    page: int           # trang bắt đầu (từ 1)
+    text: str
+
+
+class ChunkHit(NamedTuple):
+    source_id: str
+    label: str
+    page: int
+    text: str
+    score: float
+
+
+# ── Worker (chạy trong process con — chỉ nhận/trả kiểu picklable) ───────────
+
+def _page_count(path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def _extract_pages(path: str, start: int, stop: int) -> list[str]:
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    out = []
+    for i in range(start, min(stop, len(reader.pages))):
+        text = reader.pages[i].extract_text() or ""
+        out.append("\n".join(line.rstrip() for line in text.splitlines()).strip())
+    return out
+
+
+_POOL: ProcessPoolExecutor | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool() -> ProcessPoolExecutor:
+    """Process pool dùng chung toàn process. spawn: server có nhiều thread, fork không an toàn."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _POOL
+
+
+def shutdown_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = None
+
+
+# ── Chunking + cache ────────────────────────────────────────────────────────
+
+def file_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        while block := f.read(1 << 20):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_pages(pages: list[str], size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> list[Chunk]:
+    """Cửa sổ `size` ký tự trượt trên text cả file, lùi `overlap` ký tự giữa 2 chunk;
+    biên chunk dời về khoảng trắng gần nhất để không cắt giữa từ."""
+    starts, parts, pos = [], [], 0
+    for text in pages:
+        starts.append(pos)
+        parts.append(text)
+        pos += len(text) + 2
+    text = "\n\n".join(parts)
+    chunks: list[Chunk] = []
+    pos = 0
+    while pos < len(text):
+        end = min(pos + size, len(text))
+        if end < len(text):
+            cut = max(text.rfind(" ", pos + size // 2, end), text.rfind("\n", pos + size // 2, end))
+            if cut > pos:
+                end = cut
+        body = text[pos:end].strip()
+        if body:
+            chunks.append(Chunk(bisect.bisect_right(starts, pos), body))
+        if end >= len(text):
+            break
+        nxt = max(end - overlap, pos + 1)
+        space = text.find(" ", nxt, end)
+        pos = space + 1 if space != -1 else nxt
+    return chunks
+
+
+class ChunkCache:
+    """Chunks theo content hash: {root}/{hash[:2]}/{hash}.json → {"pages", "chunks": [[page, text]]}.
+    Ghi tmp + os.replace; file đã đọc giữ trong LRU nhỏ."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._lock = threading.Lock()
+        self._memo: OrderedDict[str, list[Chunk]] = OrderedDict()
+
+    def _path(self, content_hash: str) -> Path:
+        return self.root / content_hash[:2] / f"{content_hash}.json"
+
+    def has(self, content_hash: str) -> bool:
+        return content_hash in self._memo or self._path(content_hash).exists()
+
+    def get(self, content_hash: str) -> list[Chunk] | None:
+        with self._lock:
+            chunks = self._memo.get(content_hash)
+            if chunks is not None:
+                self._memo.move_to_end(content_hash)
+                return chunks
+        try:
+            data = jsonio.loads(self._path(content_hash).read_bytes())
+        except (FileNotFoundError, ValueError):
+            return None
+        chunks = [Chunk(page, text) for page, text in data["chunks"]]
+        self._remember(content_hash, chunks)
+        return chunks
+
+    def put(self, content_hash: str, pages: int, chunks: list[Chunk]) -> None:
+        path = self._path(content_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(jsonio.dumps({"pages": pages, "chunks": [list(c) for c in chunks]}))
+        os.replace(tmp, path)
+        self._remember(content_hash, chunks)
+
+    def _remember(self, content_hash: str, chunks: list[Chunk]) -> None:
+        with self._lock:
+            self._memo[content_hash] = chunks
+            self._memo.move_to_end(content_hash)
+            while len(self._memo) > CHUNK_MEMO:
+                self._memo.popitem(last=False)
+
+
+# ── SourceIngestor — 1 / user, sống cùng storage trong session ─────────────
+
+def _ingest_roots(data_dir: Path) -> list[Path]:
+    """RKS_INGEST_ROOTS nếu set, không thì {data_dir}/uploads — không bao giờ rỗng."""
+    roots = [Path(r).expanduser() for r in os.getenv("RKS_INGEST_ROOTS", "").split(os.pathsep) if r.strip()]
+    return [r.resolve() for r in roots or [data_dir / UPLOADS_DIR]]
+
+
+class SourceIngestor:
+    def __init__(self, storage: AbstractStorage, data_dir: Path):
+        self.storage = storage
+        self.data_dir = data_dir
+        self.roots = _ingest_roots(data_dir)
+        self.cache = ChunkCache(data_dir / "chunks")
+        self._lock = threading.Lock()
+        self._status: dict[str, IngestStatus] = {}
+        # container_id → (((source_id, content_hash), ...), EmbeddingIndex, {chunk_id: ChunkHit})
+        self._indexes: dict[str, tuple[tuple, EmbeddingIndex, dict[str, ChunkHit]]] = {}
+
+    # Ingest
+
+    def resolve(self, source: Source) -> Path:
+        """Đường dẫn file của source; ValueError nếu không ingest được."""
+        if source.type != SourceType.PDF:
+            raise ValueError("Chỉ ingest được source PDF")
+        path = Path(source.path_or_url).expanduser()
+        path = (path if path.is_absolute() else self.data_dir / path).resolve()
+        if not any(path.is_relative_to(r) for r in self.roots):
+            raise ValueError("File nằm ngoài thư mục được phép ingest (RKS_INGEST_ROOTS / uploads của user)")
+        if not path.is_file():
+            raise ValueError(f"Không tìm thấy file: {source.path_or_url}")
+        return path
+
+    def status(self, source: Source) -> IngestStatus:
+        with self._lock:
+            st = self._status.get(source.source_id)
+        if st is not None:
+            return st.model_copy()
+        if source.content_hash and self.cache.has(source.content_hash):
+            chunks = self.cache.get(source.content_hash) or []
+            return IngestStatus(source_id=source.source_id, state="done", chunks=len(chunks),
+                                content_hash=source.content_hash, cached=True)
+        return IngestStatus(source_id=source.source_id)
+
+    def start(self, source: Source, force: bool = False) -> IngestStatus:
+        """Bắt đầu ingest nền (thread điều phối + process pool); đang chạy → trả tiến độ hiện tại."""
+        path = self.resolve(source)
+        with self._lock:
+            st = self._status.get(source.source_id)
+            if st is not None and st.state == "running":
+                return st.model_copy()
+            st = self._status[source.source_id] = IngestStatus(source_id=source.source_id, state="running")
+        threading.Thread(target=self._run, args=(source.source_id, path, force),
+                         name=f"ingest-{source.source_id}", daemon=True).start()
+        return st.model_copy()
+
+    def _update(self, source_id: str, **fields) -> None:
+        with self._lock:
+            st = self._status[source_id]
+            for k, v in fields.items():
+                setattr(st, k, v)
+
+    def _run(self, source_id: str, path: Path, force: bool) -> None:
+        try:
+            content_hash = file_hash(path)
+            chunks = None if force else self.cache.get(content_hash)
+            cached = chunks is not None
+            if chunks is None:
+                chunks = self._parse(source_id, str(path), content_hash)
+            source = self.storage.get_source(source_id)
+            if source is not None and source.content_hash != content_hash:
+                source.content_hash = content_hash
+                self.storage.upsert_source(source)
+            self._update(source_id, state="done", chunks=len(chunks), content_hash=content_hash, cached=cached)
+        except Exception as e:
+            self._update(source_id, state="error", error=str(e) or type(e).__name__)
+
+    def _parse(self, source_id: str, path: str, content_hash: str) -> list[Chunk]:
+        pool = _pool()
+        total = pool.submit(_page_count, path).result()
+        self._update(source_id, pages_total=total)
+        futures = {pool.submit(_extract_pages, path, start, start + PAGES_PER_TASK): start
+                   for start in range(0, total, PAGES_PER_TASK)}
+        pages: list[str] = [""] * total
+        done = 0
+        for fut in as_completed(futures):
+            start = futures[fut]
+            texts = fut.result()
+            pages[start:start + len(texts)] = texts
+            done += len(texts)
+            self._update(source_id, pages_done=done)
+        chunks = chunk_pages(pages)
+        self.cache.put(content_hash, total, chunks)
+        return chunks
+
+    # Retrieval
+
+    def relevant_chunks(self, container_id: str, query: str, k: int = 3,
+                        min_score: float = 0.05) -> list[ChunkHit]:
+        """k chunk (của mọi source đã ingest trong container) gần nghĩa với query nhất.
+        Chunk dài hơn query nhiều → cosine thấp hơn so với node-node, ngưỡng cũng thấp hơn."""
+        # cùng 1 file thêm 2 lần (cùng hash) → chỉ index 1 lần
+        sources = list({s.content_hash: s for s in reversed(self.storage.list_sources(container_id))
+                        if s.content_hash}.values())[::-1]
+        if not sources or not query.strip():
+            return []
+        key = tuple((s.source_id, s.content_hash) for s in sources)
+        with self._lock:
+            cached = self._indexes.get(container_id)
+        if cached is None or cached[0] != key:
+            index, hits = EmbeddingIndex(), {}
+            for s in sources:
+                items = []
+                for i, c in enumerate(self.cache.get(s.content_hash) or []):
+                    chunk_id = f"{s.source_id}#{i}"
+                    hits[chunk_id] = ChunkHit(s.source_id, s.label, c.page, c.text, 0.0)
+                    items.append((chunk_id, s.label, c.text))
+                index.add(items)
+            cached = (key, index, hits)
+            with self._lock:
+                self._indexes[container_id] = cached
+        _, index, hits = cached
+        return [hits[sim.node_id]._replace(score=sim.score)
+                for sim in index.nearest(query, k, min_score=min_score)]
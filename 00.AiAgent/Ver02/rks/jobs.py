@@ -0,0 +1,482 @@
+"""
+jobs.py — Job queue in-process cho thao tác AI chạy nền (auto-document…).
+
+  JobStore     trạng thái job của 1 user, append-only {user_dir}/jobs.jsonl
+               (dòng cuối của job_id thắng). Restart server → job queued/running
+               được chạy lại; handler idempotent (node đã document thì bỏ qua).
+  JobQueue     RKS_JOB_WORKERS worker asyncio lấy job từ hàng đợi chung; trong 1
+               job bulk tối đa RKS_JOB_CONCURRENCY item chạy song song.
+  RateLimiter  token bucket cho LLM call của job (RKS_JOB_RATE_PER_MIN, 0 = tắt)
+               — chỉ job nền bị giới hạn, request tương tác thì không.
+  with_retry   lỗi tạm thời (429, 5xx, timeout, mất kết nối) → thử lại với
+               exponential backoff + jitter (tôn trọng Retry-After), tối đa
+               RKS_JOB_RETRIES lần.
+
+Nhiều process (uvicorn --workers N): job chạy ở process nhận nó, nhưng
+JobStore đọc lại phần file process khác vừa append (trạng thái / huỷ thấy được
+từ mọi worker); ghi giữ flock {jobs.jsonl}.lock. Mỗi process giữ 1 WorkerLease
+— lúc khởi động chỉ nhận lại job mà worker giữ nó đã chết.
+
+JobStore là code đồng bộ (threading lock + flock + đọc / ghi file): JobQueue và
+JobContext gọi nó qua asyncio.to_thread — worker khác giữ flock thì chỉ thread
+chờ, event loop vẫn chạy.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import secrets
+import socket
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from . import jsonio
+from .agent import CognitiveAgent
+from .filelock import FileLock, atomic_write_bytes
+from .models import Job, JobState, NodeState
+from .storage import _stat_sig
+
+JOB_WORKERS      = int(os.getenv("RKS_JOB_WORKERS", "2"))
+JOB_CONCURRENCY  = int(os.getenv("RKS_JOB_CONCURRENCY", "4"))
+JOB_RATE_PER_MIN = float(os.getenv("RKS_JOB_RATE_PER_MIN", "60"))
+JOB_RETRIES      = int(os.getenv("RKS_JOB_RETRIES", "4"))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY  = 30.0
+MAX_JOBS_KEPT    = 200      # job cũ hơn bị bỏ khi load lại file
+MAX_JOB_ERRORS   = 20
+SAVE_INTERVAL    = 1.0      # tiến độ ghi xuống file tối đa 1 lần / giây / job
+
+log = logging.getLogger(__name__)
+
+_UNFINISHED = (JobState.QUEUED, JobState.RUNNING)
+
+
+class JobStore:
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._flock = FileLock(path.with_name(path.name + ".lock"))
+        self._jobs: dict[str, Job] = {}
+        self._sig: tuple[int, int, int] | None = None
+        self._offset = 0            # byte đầu file đã đọc vào _jobs
+        self._lines = 0
+        with self._lock, self._flock:
+            self._refresh()
+            if len(self._jobs) > MAX_JOBS_KEPT or self._lines > 2 * len(self._jobs):
+                self._rewrite()
+
+    def _refresh(self) -> None:
+        """Đọc phần process khác vừa append; file bị thay (rewrite) → đọc lại cả file. Caller giữ _lock."""
+        sig = _stat_sig(self.path)
+        if sig == self._sig:
+            return
+        if not (sig and self._sig and sig[2] == self._sig[2] and sig[0] >= self._offset):
+            self._jobs, self._offset, self._lines = {}, 0, 0
+        self._sig = sig
+        if sig is None:
+            return
+        with self.path.open("rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1         # dòng cuối đang ghi dở → lần sau
+        self._offset += end
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            self._lines += 1
+            try:
+                job = Job.model_validate(jsonio.loads(line))
+            except ValueError:
+                continue            # dòng ghi dở khi process chết
+            self._jobs[job.job_id] = job
+
+    def _rewrite(self) -> None:
+        """Giữ MAX_JOBS_KEPT job mới nhất, mỗi job 1 dòng. Caller giữ _lock + _flock."""
+        keep = sorted(self._jobs.values(), key=lambda j: j.created_at)[-MAX_JOBS_KEPT:]
+        self._jobs = {j.job_id: j for j in keep}
+        atomic_write_bytes(self.path, "".join(j.model_dump_json() + "\n" for j in keep).encode("utf-8"))
+        self._sig = _stat_sig(self.path)
+        self._offset = self._sig[0]
+        self._lines = len(keep)
+
+    def _append(self, job: Job) -> None:
+        """Caller giữ _lock + _flock và vừa _refresh()."""
+        torn = self._sig is not None and self._sig[0] > self._offset
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(("\n" if torn else "") + job.model_dump_json() + "\n")
+        self._jobs[job.job_id] = job.model_copy(deep=True)
+        self._sig = _stat_sig(self.path)
+        self._offset = self._sig[0]
+        self._lines += 1
+
+    def save(self, job: Job) -> None:
+        """Ghi trạng thái mới của job. cancel_requested là cờ 1 chiều: worker khác đã
+        yêu cầu huỷ thì giữ cờ (và bật luôn trên `job` — handler đang chạy thấy ngay)."""
+        with self._lock, self._flock:
+            self._refresh()
+            prev = self._jobs.get(job.job_id)
+            if prev is not None and prev.cancel_requested:
+                job.cancel_requested = True
+            self._append(job)
+
+    def claim_orphans(self, worker: str, alive: Callable[[str], bool]) -> list[Job]:
+        """Job queued/running mà worker giữ nó đã chết → chuyển cho `worker`, về QUEUED.
+        Chạy trong flock nên 2 worker khởi động cùng lúc không nhận trùng job."""
+        with self._lock, self._flock:
+            self._refresh()
+            claimed = []
+            for job in list(self._jobs.values()):
+                if job.state in _UNFINISHED and job.worker != worker and not alive(job.worker):
+                    job = job.model_copy(deep=True)
+                    job.state, job.worker = JobState.QUEUED, worker
+                    self._append(job)
+                    claimed.append(job)
+            return claimed
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            self._refresh()
+            job = self._jobs.get(job_id)
+            return job.model_copy(deep=True) if job else None
+
+    def list(self, limit: int = 50) -> list[Job]:
+        with self._lock:
+            self._refresh()
+            jobs = sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)[:limit]
+            return [j.model_copy(deep=True) for j in jobs]
+
+
+class WorkerLease:
+    """Process giữ flock trên {root}/{id}.lock suốt đời → lock còn bị giữ ⇔ worker
+    còn sống (kể cả khi pid bị tái sử dụng sau restart container). Tạo sau khi
+    fork worker (lần đầu JobQueue cần), không tạo lúc import."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.id = f"{socket.gethostname()}-{os.getpid()}-{secrets.token_hex(3)}"
+        self._lock = FileLock(root / f"{self.id}.lock")
+        self._lock.acquire()
+
+    def alive(self, worker: str) -> bool:
+        if not worker:
+            return False
+        if worker == self.id:
+            return True
+        path = self.root / f"{worker}.lock"
+        if not path.exists():
+            return False
+        probe = FileLock(path)
+        try:
+            if not probe.acquire(blocking=False):
+                return True
+            path.unlink(missing_ok=True)    # worker đã chết — dọn lease
+            return False
+        finally:
+            probe.close()
+
+    def close(self) -> None:
+        self._lock.close()
+        (self.root / f"{self.id}.lock").unlink(missing_ok=True)
+
+
+# ── Rate limit + retry ─────────────────────────────────────────────────────
+
+class RateLimiter:
+    """Token bucket: per_minute lượt / phút, tích tối đa `burst` lượt. per_minute ≤ 0 → không giới hạn."""
+
+    def __init__(self, per_minute: float, burst: int | None = None):
+        self.rate = per_minute / 60
+        self.capacity = float(burst or max(1, JOB_CONCURRENCY))
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def is_transient(e: BaseException) -> bool:
+    """Lỗi đáng thử lại: timeout, mất kết nối, HTTP 429 / 5xx (openai.APIStatusError có status_code)."""
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(e, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return type(e).__name__ in ("APIConnectionError", "APITimeoutError", "RateLimitError")
+
+
+def _retry_after(e: BaseException) -> float:
+    response = getattr(e, "response", None)
+    try:
+        return float(response.headers.get("retry-after", 0))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+async def with_retry(fn: Callable[[], Awaitable], attempts: int = JOB_RETRIES,
+                     base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY):
+    """await fn(); lỗi tạm thời → chờ base·2^n (jitter 50–100%, ≥ Retry-After) rồi gọi lại."""
+    for attempt in range(attempts + 1):
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt >= attempts or not is_transient(e):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            await asyncio.sleep(max(delay, min(_retry_after(e), max_delay)))
+
+
+# ── Queue ──────────────────────────────────────────────────────────────────
+
+class JobContext:
+    """Handler nhận ctx: đọc params, báo tiến độ, gọi LLM qua rate limit + retry."""
+
+    def __init__(self, queue: JobQueue, user: str, job: Job, store: JobStore):
+        self.queue = queue
+        self.user = user
+        self.job = job
+        self._store = store
+        self._saved_at = 0.0
+        self._save_lock = asyncio.Lock()    # item song song: bản ghi sau không bị bản trước đè
+
+    @property
+    def cancelled(self) -> bool:
+        return self.job.cancel_requested
+
+    async def set_total(self, total: int) -> None:
+        self.job.total = total
+        await self.save(force=True)
+
+    async def item_done(self) -> None:
+        self.job.done += 1
+        await self.save()
+
+    async def item_failed(self, error: str) -> None:
+        self.job.failed += 1
+        self.job.errors = (self.job.errors + [error])[-MAX_JOB_ERRORS:]
+        await self.save()
+
+    async def save(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if force or now - self._saved_at >= SAVE_INTERVAL:
+            self._saved_at = now
+            async with self._save_lock:
+                await _save(self._store, self.job)
+
+    async def call_llm(self, fn: Callable[[], Awaitable]):
+        async def limited():
+            await self.queue.limiter.acquire()
+            return await fn()
+        return await with_retry(limited)
+
+
+Handler = Callable[[JobContext], Awaitable[dict | None]]
+
+
+async def _save(store: JobStore, job: Job) -> None:
+    """store.save trong thread. Ghi bản chụp — loop vẫn sửa `job` trong lúc thread
+    dump; cờ huỷ worker khác đặt (store bật trên bản chụp) chép lại vào `job`."""
+    snapshot = job.model_copy(deep=True)
+    await asyncio.to_thread(store.save, snapshot)
+    if snapshot.cancel_requested:
+        job.cancel_requested = True
+
+
+class JobQueue:
+    def __init__(self, store_for: Callable[[str], JobStore], handlers: dict[str, Handler],
+                 workers: int = JOB_WORKERS, rate_per_min: float = JOB_RATE_PER_MIN,
+                 lease_dir: Path | None = None):
+        self.handlers = handlers
+        self.rate_per_min = rate_per_min
+        self.limiter = RateLimiter(rate_per_min)
+        self._store_for = store_for
+        self._workers = max(1, workers)
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._running: dict[tuple[str, str], Job] = {}      # (user, job_id) → job đang chạy
+        self._lease_dir = lease_dir
+        self._lease: WorkerLease | None = None
+
+    @property
+    def lease(self) -> WorkerLease | None:
+        """None khi không có lease_dir (1 process) — mọi job dở dang coi như mồ côi."""
+        if self._lease is None and self._lease_dir is not None:
+            self._lease = WorkerLease(self._lease_dir)
+        return self._lease
+
+    @property
+    def worker_id(self) -> str:
+        return self.lease.id if self.lease else ""
+
+    def _ensure_started(self) -> asyncio.Queue:
+        """Worker tạo lazily trên event loop hiện tại (lần submit/resume đầu)."""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self._workers)]
+        return self._queue
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks, self._queue = [], None
+        self.limiter = RateLimiter(self.rate_per_min)   # asyncio.Lock gắn với loop cũ
+        if self._lease is not None:
+            self._lease.close()
+            self._lease = None
+
+    async def _store(self, user: str) -> JobStore:
+        """JobStore của user — lần đầu đọc (có thể rewrite) jobs.jsonl trong flock."""
+        return await asyncio.to_thread(self._store_for, user)
+
+    async def submit(self, user: str, kind: str, params: dict) -> Job:
+        """Gọi từ event loop. kind không có handler → ValueError."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = Job(kind=kind, params=params, worker=self.worker_id)
+        await _save(await self._store(user), job)
+        self._ensure_started().put_nowait((user, job.job_id))
+        return job
+
+    async def resume(self, user: str) -> int:
+        """Đưa lại vào hàng đợi các job queued/running của user mà worker giữ nó đã
+        chết (server restart giữa chừng) — job của worker khác còn sống thì để yên."""
+        lease = self.lease
+        store = await self._store(user)
+        jobs = await asyncio.to_thread(store.claim_orphans, self.worker_id,
+                                       lease.alive if lease else lambda w: False)
+        for job in jobs:
+            self._ensure_started().put_nowait((user, job.job_id))
+        return len(jobs)
+
+    async def get(self, user: str, job_id: str) -> Job | None:
+        live = self._running.get((user, job_id))
+        if live is not None:
+            return live.model_copy(deep=True)
+        return await asyncio.to_thread((await self._store(user)).get, job_id)
+
+    async def list(self, user: str, limit: int = 50) -> list[Job]:
+        jobs = await asyncio.to_thread((await self._store(user)).list, limit)
+        return [self._running.get((user, j.job_id), j).model_copy(deep=True) for j in jobs]
+
+    async def cancel(self, user: str, job_id: str) -> Job | None:
+        live = self._running.get((user, job_id))
+        if live is not None:
+            live.cancel_requested = True           # handler dừng trước item kế tiếp
+            return live.model_copy(deep=True)
+        store = await self._store(user)
+        job = await asyncio.to_thread(store.get, job_id)
+        if job is not None and job.state == JobState.QUEUED:
+            job.cancel_requested = True
+            job.state = JobState.CANCELLED
+            job.finished_at = datetime.utcnow()
+            await _save(store, job)
+        elif job is not None and job.state == JobState.RUNNING and not job.cancel_requested:
+            job.cancel_requested = True             # đang chạy ở worker khác — thấy cờ ở lần save kế
+            await _save(store, job)
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            user, job_id = await self._queue.get()
+            try:
+                await self._run(user, job_id)
+            except Exception:                       # lỗi ngoài handler — không giết worker
+                log.exception("[jobs] %s failed", job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, user: str, job_id: str) -> None:
+        store = await self._store(user)
+        job = await asyncio.to_thread(store.get, job_id)
+        if job is None or job.state != JobState.QUEUED:
+            return                                  # đã huỷ trước khi tới lượt
+        job.state = JobState.RUNNING
+        job.started_at = datetime.utcnow()
+        await _save(store, job)
+        self._running[(user, job_id)] = job
+        try:
+            job.result = await self.handlers[job.kind](JobContext(self, user, job, store)) or {}
+            job.state = JobState.CANCELLED if job.cancel_requested else JobState.DONE
+        except Exception as e:
+            job.state = JobState.ERROR
+            job.errors = (job.errors + [str(e) or type(e).__name__])[-MAX_JOB_ERRORS:]
+        finally:
+            job.finished_at = datetime.utcnow()
+            await _save(store, job)
+            self._running.pop((user, job_id), None)
+
+
+# ── Handlers: auto-document ────────────────────────────────────────────────
+
+def auto_document_handlers(agent_for: Callable[[str], CognitiveAgent],
+                           concurrency: int = JOB_CONCURRENCY) -> dict[str, Handler]:
+    """auto_document           params: node_id, no_cache — node không còn EXPLORE
+                               (đã document) → bỏ qua, result.skipped
+       auto_document_container params: container_id, no_cache — mọi node EXPLORE,
+                               tối đa `concurrency` node song song."""
+
+    # agent_for (lần đầu mở storage + build index của user) và đọc storage chạy
+    # trong thread — như async path của CognitiveAgent, loop không chờ lock / đĩa
+
+    async def document(ctx: JobContext, node_id: str) -> dict:
+        agent = await asyncio.to_thread(agent_for, ctx.user)
+        call = lambda: agent.auto_document_node_async(node_id, ctx.job.params.get("no_cache", False), strict=True)
+        # Không có API key → nội dung demo, không gọi LLM nên không cần rate limit / retry
+        return await (ctx.call_llm(call) if agent.llm_enabled else call())
+
+    async def one(ctx: JobContext) -> dict:
+        await ctx.set_total(1)
+        node_id = ctx.job.params["node_id"]
+        agent = await asyncio.to_thread(agent_for, ctx.user)
+        node = await asyncio.to_thread(agent.storage.get_node, node_id)
+        if node is not None and node.state != NodeState.EXPLORE:
+            # Đã document (vd. job chạy lại sau restart) — như container: chỉ node
+            # EXPLORE; không gọi LLM lần 2, không ghi đè nội dung user đang có
+            await ctx.item_done()
+            return {"node_id": node_id, "suggested_nodes": [], "skipped": True}
+        result = await document(ctx, node_id)
+        await ctx.item_done()
+        return {"node_id": result["node"].node_id,
+                "suggested_nodes": [s.model_dump() for s in result["suggested_nodes"]]}
+
+    async def container(ctx: JobContext) -> dict:
+        agent = await asyncio.to_thread(agent_for, ctx.user)
+        nodes = await asyncio.to_thread(agent.storage.list_nodes, ctx.job.params["container_id"])
+        node_ids = [n.node_id for n in nodes if n.state == NodeState.EXPLORE]
+        ctx.job.done = ctx.job.failed = 0           # resume: đếm lại từ các node còn EXPLORE
+        await ctx.set_total(len(node_ids))
+        slots = asyncio.Semaphore(max(1, concurrency))
+
+        async def run(node_id: str) -> None:
+            async with slots:
+                if ctx.cancelled:
+                    return
+                try:
+                    await document(ctx, node_id)
+                    await ctx.item_done()
+                except KeyError:                    # node bị xoá trong lúc job chạy
+                    await ctx.item_done()
+                except Exception as e:
+                    await ctx.item_failed(f"{node_id}: {e}")
+
+        await asyncio.gather(*(run(nid) for nid in node_ids))
+        return {"documented": ctx.job.done, "failed": ctx.job.failed}
+
+    return {"auto_document": one, "auto_document_container": container}
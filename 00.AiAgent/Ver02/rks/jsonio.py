@@ -0,0 +1,33 @@
+"""
+jsonio.py — JSON encode/decode dùng chung cho storage + API.
+
+orjson nếu được cài (optional, `pip install orjson`), không thì stdlib json.
+Cả 2 nhánh trả bytes UTF-8 (không escape ký tự tiếng Việt) và encode được
+pydantic model / datetime / Enum qua pydantic_core.to_jsonable_python.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from pydantic_core import to_jsonable_python
+
+try:
+    import orjson
+except ImportError:     # optional dependency
+    orjson = None
+
+HAVE_ORJSON = orjson is not None
+
+
+def loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=to_jsonable_python)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"),
+                      default=to_jsonable_python).encode("utf-8")
@@ -0,0 +1,211 @@
+"""
+layout.py — Force-directed layout tính ở server (NumPy), x/y lưu vào node.
+
+/graph trả x/y của từng node → client vẽ ngay, không chạy warm-up simulation
+D3 mỗi lần loadGraph, và layout giữ nguyên giữa các lần mở container.
+
+Incremental: node đã có x/y đứng yên (vẫn đẩy / kéo node khác), chỉ node mới
+(x/y = None) được đặt — khởi đầu cạnh các neighbor đã có vị trí (theo thứ tự
+BFS) rồi chạy force. Node người dùng kéo thả → client PUT vị trí → lưu lại và
+từ đó đứng yên. reset → đặt lại cả container.
+
+Lực kiểu Fruchterman–Reingold: đẩy L²/d giữa mọi cặp node, kéo d²/L theo
+edge, trọng lực nhẹ về tâm; bước dịch tối đa giảm dần (cooling). Lực đẩy:
+  - chính xác (ma trận movable × n) khi số cặp ≤ EXACT_PAIRS — lần incremental
+    (vài node mới) luôn rơi vào đây;
+  - xấp xỉ kiểu Barnes–Hut trên lưới 1 tầng khi graph lớn: cell ở xa thay bằng
+    khối tâm (mass × center of mass), 3×3 cell quanh node tính chính xác từng cặp.
+"""
+from __future__ import annotations
+
+import math
+import os
+import zlib
+from collections import deque
+from typing import Iterable
+
+import numpy as np
+
+from .models import GraphEdge, GraphNode
+
+LINK_DISTANCE     = 130.0       # khớp distance của forceLink cũ ở client
+LAYOUT_ITERATIONS = int(os.getenv("RKS_LAYOUT_ITERATIONS", "200"))
+# Trọng lực tuyến tính về tâm: với lực đẩy ~1/d (2D) bán kính cân bằng ≈ L·√(n/GRAVITY)
+# → GRAVITY ~1 cho mật độ ~1 node / L²; nhỏ quá thì node dồn ra 1 vành rỗng ruột
+GRAVITY           = 1.5
+EXACT_PAIRS       = 100_000     # movable × n ≤ ngưỡng này → lực đẩy chính xác
+GRID_MAX          = 64          # lưới tối đa GRID_MAX × GRID_MAX cell
+_CHUNK_ELEMS      = 1_000_000   # phần tử tối đa của 1 khối ma trận trung gian
+_MIN_D2           = 1.0         # tránh chia 0 khi 2 node trùng vị trí
+
+
+def _pair_forces(dx: np.ndarray, dy: np.ndarray, w: np.ndarray | float, k2: float) -> tuple[np.ndarray, np.ndarray]:
+    """Lực đẩy k²·w·(dx, dy)/d² của từng cặp (mảng cùng shape)."""
+    s = k2 * w / np.maximum(dx * dx + dy * dy, _MIN_D2)
+    return dx * s, dy * s
+
+
+def _repulsion_exact(pos: np.ndarray, rows: np.ndarray, k2: float) -> np.ndarray:
+    """Σ_j k² (p_i − p_j) / |p_i − p_j|² cho các hàng `rows`, chia khối theo _CHUNK_ELEMS."""
+    x, y = pos[:, 0], pos[:, 1]
+    out = np.empty((len(rows), 2))
+    step = max(1, _CHUNK_ELEMS // len(pos))
+    for start in range(0, len(rows), step):
+        chunk = rows[start:start + step]
+        fx, fy = _pair_forces(x[chunk, None] - x, y[chunk, None] - y, 1.0, k2)
+        out[start:start + step, 0] = fx.sum(axis=1)
+        out[start:start + step, 1] = fy.sum(axis=1)
+    return out
+
+
+def _repulsion_grid(pos: np.ndarray, rows: np.ndarray, k2: float) -> np.ndarray:
+    """Như _repulsion_exact nhưng chia mặt phẳng thành lưới: cặp cell cách nhau
+    > 1 cell tương tác qua khối tâm (mass × center of mass) của 2 cell — mọi node
+    trong cell nhận chung lực far field của cell; 3×3 cell quanh node tính từng
+    cặp. Số cell C ≈ (9n²)^⅓ — cân bằng C² cặp cell với ~9n²/C cặp node gần."""
+    n = len(pos)
+    x, y = pos[:, 0], pos[:, 1]
+    g = int(min(GRID_MAX, max(1, round((9 * n * n) ** (1 / 6)))))
+    lo = pos.min(axis=0)
+    h = max(float((pos.max(axis=0) - lo).max()), 1.0) / g * (1 + 1e-9)
+    cx = np.minimum(((x - lo[0]) / h).astype(np.int64), g - 1)
+    cy = np.minimum(((y - lo[1]) / h).astype(np.int64), g - 1)
+    cid = cx * g + cy
+    count = np.bincount(cid, minlength=g * g)
+    occupied = np.flatnonzero(count)
+    slot = np.full(g * g, -1)
+    slot[occupied] = np.arange(len(occupied))
+    mass = count[occupied].astype(np.float64)
+    com_x = np.bincount(cid, x, g * g)[occupied] / mass
+    com_y = np.bincount(cid, y, g * g)[occupied] / mass
+    ocx, ocy = np.divmod(occupied, g)
+
+    # Far field: cell ↔ cell (chỉ các cell chứa node cần tính), bỏ cặp kề nhau
+    row_slot = slot[cid[rows]]
+    need = np.unique(row_slot)
+    far_w = np.where((np.abs(ocx[need, None] - ocx) <= 1) & (np.abs(ocy[need, None] - ocy) <= 1), 0.0, mass)
+    fx, fy = _pair_forces(com_x[need, None] - com_x, com_y[need, None] - com_y, far_w, k2)
+    far = np.zeros((len(occupied), 2))
+    far[need, 0] = fx.sum(axis=1)
+    far[need, 1] = fy.sum(axis=1)
+    out = far[row_slot]
+
+    # Near field: cặp (i, j) với j nằm trong 3×3 cell quanh i — sinh cặp bằng
+    # repeat trên node đã sort theo cell, không vòng lặp Python theo node
+    order = np.argsort(cid, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(count)[:-1]))
+    rx, ry, rcx, rcy = x[rows], y[rows], cx[rows], cy[rows]
+    local = np.arange(len(rows))
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            tx, ty = rcx + dx, rcy + dy
+            valid = (tx >= 0) & (tx < g) & (ty >= 0) & (ty < g)
+            tcid = tx[valid] * g + ty[valid]
+            cnt = count[tcid]
+            total = int(cnt.sum())
+            if not total:
+                continue
+            i = np.repeat(local[valid], cnt)
+            offset = np.arange(total) - np.repeat(np.cumsum(cnt) - cnt, cnt)
+            j = order[np.repeat(starts[tcid], cnt) + offset]
+            fx, fy = _pair_forces(rx[i] - x[j], ry[i] - y[j], 1.0, k2)
+            out[:, 0] += np.bincount(i, fx, len(rows))
+            out[:, 1] += np.bincount(i, fy, len(rows))
+    return out
+
+
+def force_layout(pos: np.ndarray, edges: np.ndarray, movable: np.ndarray,
+                 iterations: int = LAYOUT_ITERATIONS,
+                 link_distance: float = LINK_DISTANCE) -> np.ndarray:
+    """pos (n, 2) — vị trí khởi đầu của mọi node; edges (m, 2) — cặp index;
+    movable (n,) bool — chỉ các hàng này được dịch. Trả mảng vị trí mới."""
+    pos = np.array(pos, dtype=np.float64)
+    n = len(pos)
+    rows = np.flatnonzero(movable)
+    if not len(rows):
+        return pos
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    edges = edges[(edges[:, 0] != edges[:, 1]) & (movable[edges[:, 0]] | movable[edges[:, 1]])]
+    src, dst = edges[:, 0], edges[:, 1]
+    fixed = ~movable
+    center = pos[fixed].mean(axis=0) if fixed.any() else pos.mean(axis=0)
+    k2 = link_distance ** 2
+    repulsion = _repulsion_exact if len(rows) * n <= EXACT_PAIRS else _repulsion_grid
+    max_step = link_distance
+
+    for it in range(iterations):
+        disp = np.zeros((n, 2))
+        disp[rows] = repulsion(pos, rows, k2)
+        if len(edges):
+            diff = pos[src] - pos[dst]
+            f = diff * (np.sqrt(np.einsum("ij,ij->i", diff, diff)) / link_distance)[:, None]
+            for axis in (0, 1):
+                disp[:, axis] += np.bincount(dst, f[:, axis], n) - np.bincount(src, f[:, axis], n)
+        step = disp[rows] - GRAVITY * (pos[rows] - center)
+        length = np.maximum(np.sqrt(np.einsum("ij,ij->i", step, step)), 1e-9)
+        limit = max_step * (1 - it / iterations) + 1.0
+        pos[rows] += step * (np.minimum(length, limit) / length)[:, None]
+    return pos
+
+
+def _seed_positions(pos: np.ndarray, placed: np.ndarray, neighbors: list[list[int]],
+                    rng: np.random.Generator, spacing: float) -> None:
+    """Vị trí khởi đầu cho node chưa đặt: BFS từ các node đã có vị trí, mỗi node
+    đặt cạnh trung bình các neighbor đã đặt; thành phần rời → rải quanh tâm."""
+    placed = placed.copy()
+    center = pos[placed].mean(axis=0) if placed.any() else np.zeros(2)
+    radius = spacing * math.sqrt(max(1, len(pos))) / 2
+    queue = deque(np.flatnonzero(placed).tolist())
+    pending = deque(np.flatnonzero(~placed).tolist())
+    while pending:
+        while queue:
+            current = queue.popleft()
+            for other in neighbors[current]:
+                if placed[other]:
+                    continue
+                anchors = [a for a in neighbors[other] if placed[a]]
+                angle = rng.uniform(0, 2 * math.pi)
+                pos[other] = pos[anchors].mean(axis=0) + spacing * np.array([math.cos(angle), math.sin(angle)])
+                placed[other] = True
+                queue.append(other)
+        while pending and placed[pending[0]]:
+            pending.popleft()
+        if pending:
+            start = pending.popleft()
+            angle, r = rng.uniform(0, 2 * math.pi), radius * math.sqrt(rng.uniform(0.25, 1))
+            pos[start] = center + r * np.array([math.cos(angle), math.sin(angle)])
+            placed[start] = True
+            queue.append(start)
+
+
+def layout_graph(nodes: Iterable[GraphNode], edges: Iterable[GraphEdge], reset: bool = False,
+                 seed: int = 0, iterations: int = LAYOUT_ITERATIONS) -> dict[str, tuple[float, float]]:
+    """Vị trí mới cho node chưa có x/y (reset → mọi node): node_id → (x, y).
+    {} khi mọi node đã có vị trí. Cùng input + seed → cùng kết quả."""
+    nodes = list(nodes)
+    ids = [n.node_id for n in nodes]
+    index = {nid: i for i, nid in enumerate(ids)}
+    placed = np.array([not reset and n.x is not None and n.y is not None for n in nodes], dtype=bool)
+    if placed.all():
+        return {}
+    pos = np.array([(n.x or 0.0, n.y or 0.0) if ok else (0.0, 0.0) for n, ok in zip(nodes, placed)],
+                   dtype=np.float64).reshape(-1, 2)
+
+    pairs = [(index[e.source_node_id], index[e.target_node_id]) for e in edges
+             if e.source_node_id in index and e.target_node_id in index]
+    neighbors: list[list[int]] = [[] for _ in ids]
+    for a, b in pairs:
+        if a != b:
+            neighbors[a].append(b)
+            neighbors[b].append(a)
+
+    rng = np.random.default_rng(seed)
+    _seed_positions(pos, placed, neighbors, rng, LINK_DISTANCE)
+    movable = ~placed
+    pos = force_layout(pos, np.array(pairs, dtype=np.int64).reshape(-1, 2), movable, iterations)
+    return {ids[i]: (round(float(pos[i, 0]), 1), round(float(pos[i, 1]), 1)) for i in np.flatnonzero(movable)}
+
+
+def container_seed(container_id: str) -> int:
+    """Seed ổn định theo container (crc32 — không bị random hoá như hash())."""
+    return zlib.crc32(container_id.encode())
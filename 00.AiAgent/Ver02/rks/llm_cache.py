@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+class LLMCache:
+    """Cache response LLM trên disk, content-addressed.
+
+    key   = sha256(model + toàn bộ tham số gọi: messages — gồm system prompt —,
+            temperature, max_tokens, response_format...)
+    file  = {cache_dir}/{key[:2]}/{key}.json  →  {"created": ts, "value": reply}
+
+    Hết hạn sau `ttl` giây; tổng dung lượng vượt `max_bytes` → evict theo LRU
+    (thứ tự truy cập lưu bằng mtime nên giữ được qua restart). Nhiều process
+    dùng chung thư mục được: file ghi bằng tmp + os.replace.
+    """
+
+    def __init__(self, cache_dir: Path, ttl: float, max_bytes: int):
+        self.dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, int] = OrderedDict()   # key → size, LRU → MRU
+        self._bytes = 0
+        self.hits = self.misses = self.bypassed = self.evictions = 0
+        self._load()
+
+    @staticmethod
+    def key(model: str, params: dict) -> str:
+        raw = json.dumps({"model": model, **params}, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.dir / key[:2] / f"{key}.json"
+
+    def _load(self) -> None:
+        if not self.dir.exists():
+            return
+        files = []
+        for path in self.dir.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, path.stem, st.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._bytes += size
+
+    def _drop(self, key: str) -> None:
+        self._bytes -= self._entries.pop(key, 0)
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            path = self._path(key)
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._bytes -= self._entries.pop(key, 0)
+                self.misses += 1
+                return None
+            if time.time() - data.get("created", 0) > self.ttl:
+                self._drop(key)
+                self.misses += 1
+                return None
+            if key not in self._entries:          # process khác đã ghi
+                size = path.stat().st_size
+                self._entries[key] = size
+                self._bytes += size
+            self._entries.move_to_end(key)
+            os.utime(path)
+            self.hits += 1
+            return data["value"]
+
+    def put(self, key: str, value: str) -> None:
+        raw = json.dumps({"created": time.time(), "value": value}, ensure_ascii=False)
+        path = self._path(key)
+        with self._lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".tmp{os.getpid()}.{threading.get_ident()}")
+            tmp.write_text(raw, encoding="utf-8")
+            os.replace(tmp, path)
+            size = path.stat().st_size
+            self._bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def note_bypass(self) -> None:
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self) -> int:
+        with self._lock:
+            n = len(self._entries)
+            for key in list(self._entries):
+                self._drop(key)
+            return n
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,203 @@
+"""
+metrics.py — Metrics theo request, xuất Prometheus text format (GET /metrics).
+
+Mỗi request HTTP có 1 dict thống kê trong ContextVar — context được copy sang
+thread pool / asyncio.to_thread nên code storage / agent chỉ cần gọi
+record_read() / record_llm(), không cần biết đang ở request nào. Gọi ngoài
+request (job nền, ingest) → cộng vào route="background".
+
+MetricsMiddleware (ASGI thuần — đo tới khi gửi xong body, kể cả streaming):
+  rks_http_requests_in_flight
+  rks_http_request_duration_seconds{method,route,status}      histogram
+  rks_storage_read_bytes_total{route}                         byte đọc từ file / SQLite
+  rks_storage_rows_validated_total{route}                     record qua pydantic validate
+  rks_llm_calls_total / rks_llm_seconds_total{route}
+  rks_llm_call_duration_seconds                               histogram
+  rks_llm_tokens_total{route,kind=input|output}
+
+route = template của route ("/api/nodes/{node_id}") → số series có hạn.
+Registry sống trong process: chạy nhiều worker thì Prometheus scrape từng worker.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BACKGROUND = "background"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# name → (type, help)
+_METRICS: dict[str, tuple[str, str]] = {
+    "rks_http_requests_in_flight":        ("gauge",     "HTTP request đang xử lý"),
+    "rks_http_request_duration_seconds":  ("histogram", "Thời gian xử lý request (tới byte cuối của body)"),
+    "rks_storage_read_bytes_total":       ("counter",   "Byte đọc từ storage (JSONL / SQLite)"),
+    "rks_storage_rows_validated_total":   ("counter",   "Record storage đã validate qua pydantic"),
+    "rks_llm_calls_total":                ("counter",   "Số lần gọi LLM API (không tính cache hit)"),
+    "rks_llm_seconds_total":              ("counter",   "Tổng thời gian chờ LLM API"),
+    "rks_llm_call_duration_seconds":      ("histogram", "Thời gian 1 lần gọi LLM API"),
+    "rks_llm_tokens_total":               ("counter",   "Token LLM (input / output)"),
+}
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Registry:
+    """Counter / gauge / histogram theo (name, labels). Thread-safe, chỉ cộng dồn."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._values: dict[str, dict[Labels, float]] = {}
+        # histogram: labels → [count từng bucket (không cộng dồn)…, +Inf, sum]
+        self._hists: dict[str, dict[Labels, list[float]]] = {}
+
+    def inc(self, name: str, labels: Labels, value: float = 1.0) -> None:
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[labels] = series.get(labels, 0.0) + value
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        with self._lock:
+            hist = self._hists.setdefault(name, {}).get(labels)
+            if hist is None:
+                hist = self._hists[name][labels] = [0.0] * (len(self.buckets) + 2)
+            hist[bisect_left(self.buckets, value)] += 1
+            hist[-1] += value
+
+    def render(self) -> str:
+        with self._lock:
+            values = {name: dict(series) for name, series in self._values.items()}
+            hists = {name: {k: list(v) for k, v in series.items()} for name, series in self._hists.items()}
+        lines: list[str] = []
+        for name, (kind, help_text) in _METRICS.items():
+            if name not in values and name not in hists:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(values.get(name, {}).items()):
+                lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+            for labels, hist in sorted(hists.get(name, {}).items()):
+                cumulative = 0.0
+                for bound, count in zip((*self.buckets, float("inf")), hist):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _fmt_value(bound)
+                    lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', le),))} {_fmt_value(cumulative)}")
+                lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_value(hist[-1])}")
+                lines.append(f"{name}_count{_fmt_labels(labels)} {_fmt_value(cumulative)}")
+        return "\n".join(lines) + "\n"
+
+
+def _fmt_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_value(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+REGISTRY = Registry()
+
+
+# ── Thống kê theo request ───────────────────────────────────────────────────
+
+_CURRENT: ContextVar[dict[str, float] | None] = ContextVar("rks_request_stats", default=None)
+
+# key trong dict thống kê → (metric, label thêm)
+_STAT_METRICS: dict[str, tuple[str, Labels]] = {
+    "storage_bytes":     ("rks_storage_read_bytes_total",     ()),
+    "rows_validated":    ("rks_storage_rows_validated_total", ()),
+    "llm_calls":         ("rks_llm_calls_total",              ()),
+    "llm_seconds":       ("rks_llm_seconds_total",            ()),
+    "llm_input_tokens":  ("rks_llm_tokens_total",             (("kind", "input"),)),
+    "llm_output_tokens": ("rks_llm_tokens_total",             (("kind", "output"),)),
+}
+
+
+def _add(stats: dict[str, float] | None, key: str, value: float) -> None:
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + value
+    else:
+        metric, extra = _STAT_METRICS[key]
+        REGISTRY.inc(metric, (("route", BACKGROUND),) + extra, value)
+
+
+def record_read(nbytes: int, rows: int = 0) -> None:
+    """Storage vừa đọc `nbytes` byte và validate `rows` record."""
+    stats = _CURRENT.get()
+    _add(stats, "storage_bytes", nbytes)
+    if rows:
+        _add(stats, "rows_validated", rows)
+
+
+def record_llm(seconds: float, input_tokens: int = 0, output_tokens: int = 0) -> None:
+    """1 lần gọi LLM API xong (cache hit không tính)."""
+    stats = _CURRENT.get()
+    _add(stats, "llm_calls", 1)
+    _add(stats, "llm_seconds", seconds)
+    _add(stats, "llm_input_tokens", input_tokens)
+    _add(stats, "llm_output_tokens", output_tokens)
+    REGISTRY.observe("rks_llm_call_duration_seconds", (), seconds)
+
+
+def route_label(scope: dict) -> str:
+    """Template route đã match (FastAPI gắn scope["route"]); static / không match gom chung."""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path:
+        return path
+    return "/static" if scope.get("path", "").startswith("/static/") else "unmatched"
+
+
+# ── ASGI middleware ─────────────────────────────────────────────────────────
+
+class MetricsMiddleware:
+    """Đo mọi request HTTP; `profiler` (rks.profiling.RequestProfiler) tuỳ chọn —
+    begin() trước khi vào app, end() khi gửi xong response."""
+
+    def __init__(self, app, registry: Registry = REGISTRY, profiler=None):
+        self.app = app
+        self.registry = registry
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats: dict[str, float] = {}
+        token = _CURRENT.set(stats)
+        session = self.profiler.begin() if self.profiler is not None else None
+        status = 500
+        registry = self.registry
+        registry.inc("rks_http_requests_in_flight", ())
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _CURRENT.reset(token)
+            registry.inc("rks_http_requests_in_flight", (), -1)
+            route = route_label(scope)
+            registry.observe("rks_http_request_duration_seconds",
+                             (("method", scope["method"]), ("route", route), ("status", str(status))), elapsed)
+            for key, value in stats.items():
+                if value:
+                    metric, extra = _STAT_METRICS[key]
+                    registry.inc(metric, (("route", route),) + extra, value)
+            if session is not None:
+                self.profiler.end(session, f"{scope['method']} {route}", elapsed, stats)
@@ -87,6 +87,7 @@ class Source(BaseModel):
     label: str                        # tên hiển thị (tên file / URL / tiêu đề)
     path_or_url: str = ""             # đường dẫn file hoặc URL
     notes: str = ""
+    content_hash: str = ""            # sha256 file đã ingest → chunks/{hash}.json (xem rks/ingest.py)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
@@ -98,6 +99,18 @@ class SourceCreate(BaseModel):
     notes: str = ""
 
 
+class IngestStatus(BaseModel):
+    """Tiến độ ingest 1 source (GET /api/sources/{id}/ingest)."""
+    source_id: str
+    state: str = "idle"               # idle | running | done | error
+    pages_done: int = 0
+    pages_total: int = 0
+    chunks: int = 0
+    content_hash: str = ""
+    cached: bool = False              # True → file đã parse trước đó, dùng lại chunks
+    error: str = ""
+
+
 # ─────────────────────────────────────────────
 # GRAPH NODE  (Cột 3 — Mindmap)
 # ─────────────────────────────────────────────
@@ -122,6 +135,10 @@ class GraphNode(BaseModel):
     tags: list[str] = Field(default_factory=list)
     version: int = 1
 
+    # Vị trí trên canvas — server tính (rks/layout.py) hoặc người dùng kéo thả; None = chưa đặt
+    x: float | None = None
+    y: float | None = None
+
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -156,6 +173,18 @@ class NodeDocument(BaseModel):
     state: NodeState | None = None
 
 
+class NodePositions(BaseModel):
+    """PUT /api/containers/{id}/layout — vị trí node sau khi kéo thả: node_id → [x, y]."""
+    positions: dict[str, tuple[float, float]]
+
+
+class NodeRevision(BaseModel):
+    """1 mục của GET /api/nodes/{id}/history. deleted=True → node bị xoá lúc `at`."""
+    at: datetime
+    deleted: bool = False
+    node: GraphNode | None = None
+
+
 # ─────────────────────────────────────────────
 # GRAPH EDGE
 # ─────────────────────────────────────────────
@@ -195,6 +224,7 @@ class ExploreRequest(BaseModel):
     mode: str = "clarify"      # "clarify" | "expand"
     message: str
     history: list[ExploreMessage] = Field(default_factory=list)
+    no_cache: bool = False     # True → bỏ qua LLM response cache, gọi model lại
 
 
 class SuggestedNode(BaseModel):
@@ -202,6 +232,11 @@ class SuggestedNode(BaseModel):
     node_type: NodeType
     relation_type: RelationType
     definition: str = ""
+    # Node đã có trong container gần nghĩa với suggestion (cosine > DUPLICATE_THRESHOLD)
+    # → confirm-suggested chỉ nối edge tới node đó, không tạo node trùng
+    existing_node_id: str | None = None
+    existing_title: str | None = None
+    similarity: float | None = None
 
 
 class ResponseBlock(BaseModel):
@@ -216,3 +251,39 @@ class ExploreResponse(BaseModel):
     reply: str
     suggested_nodes: list[SuggestedNode] = Field(default_factory=list)
     blocks: list[ResponseBlock] = Field(default_factory=list)
+    # Token đầu vào theo section + output (rks/tokens.py); None khi không gọi LLM
+    token_usage: dict | None = None
+
+
+# ─────────────────────────────────────────────
+# BACKGROUND JOB (xem rks/jobs.py)
+# ─────────────────────────────────────────────
+
+class JobState(str, Enum):
+    QUEUED    = "queued"
+    RUNNING   = "running"
+    DONE      = "done"
+    ERROR     = "error"
+    CANCELLED = "cancelled"
+
+
+class Job(BaseModel):
+    job_id: str = Field(default_factory=lambda: _uid("JOB"))
+    kind: str                          # "auto_document" | "auto_document_container"
+    params: dict = Field(default_factory=dict)
+    state: JobState = JobState.QUEUED
+    total: int = 0                     # số item (node) cần xử lý
+    done: int = 0
+    failed: int = 0
+    errors: list[str] = Field(default_factory=list)   # tối đa vài lỗi gần nhất
+    result: dict = Field(default_factory=dict)
+    cancel_requested: bool = False
+    worker: str = ""                   # process đang giữ job (WorkerLease.id)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+
+class JobCreate(BaseModel):
+    kind: str
+    params: dict = Field(default_factory=dict)
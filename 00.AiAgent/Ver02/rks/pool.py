@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, TypeVar
+
+V = TypeVar("V")
+
+
+class LRURegistry(Generic[V]):
+    """Registry giới hạn kích thước, evict theo LRU, an toàn đa thread.
+
+    Dùng để giữ instance per-user (storage, agent) sống giữa các request
+    thay vì khởi tạo lại mỗi lần.
+    """
+
+    def __init__(self, max_size: int, on_evict: Callable[[V], None] | None = None):
+        self.max_size = max(1, max_size)
+        self._on_evict = on_evict
+        self._items: OrderedDict[Hashable, V] = OrderedDict()
+        self._lock = threading.Lock()
+        self._building: dict[Hashable, threading.Lock] = {}     # key đang chạy factory()
+
+    def get(self, key: Hashable, factory: Callable[[], V]) -> V:
+        """factory() (mở storage, build index… có thể lâu) chạy ngoài lock chung:
+        lookup key khác — kể cả hit — không phải chờ. Cùng key → lock riêng của key,
+        chỉ 1 thread build, các thread khác chờ rồi dùng luôn kết quả."""
+        with self._lock:
+            value = self._hit(key)
+            if value is not None:
+                return value
+            building = self._building.setdefault(key, threading.Lock())
+        with building:
+            with self._lock:
+                value = self._hit(key)
+            if value is not None:
+                return value
+            try:
+                value = factory()
+            except BaseException:
+                with self._lock:
+                    self._building.pop(key, None)
+                raise
+            with self._lock:
+                self._items[key] = value
+                self._building.pop(key, None)
+                evicted = []
+                while len(self._items) > self.max_size:
+                    evicted.append(self._items.popitem(last=False)[1])
+        for old in evicted:
+            if self._on_evict:
+                self._on_evict(old)
+        return value
+
+    def _hit(self, key: Hashable) -> V | None:
+        """Caller giữ self._lock."""
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def peek(self, key: Hashable) -> V | None:
+        with self._lock:
+            return self._items.get(key)
+
+    def values(self) -> list[V]:
+        with self._lock:
+            return list(self._items.values())
+
+    def __len__(self) -> int:
+        return len(self._items)
@@ -0,0 +1,194 @@
+"""
+profiling.py — Profile từng request, chỉ lưu request chậm.
+
+Bật bằng RKS_PROFILE (mặc định off) hoặc lúc chạy qua POST /api/admin/profiler:
+  off            tắt — middleware không tốn gì thêm
+  cprofile       cProfile (stdlib) → {dir}/*.prof (mở bằng snakeviz / pstats)
+  pyinstrument   sampling profiler (optional, `pip install pyinstrument`) → *.html
+  auto           pyinstrument nếu đã cài, không thì cprofile
+
+Middleware chọn request để profile (tỉ lệ RKS_PROFILE_SAMPLE, tối đa 1 request
+cùng lúc — cProfile không chạy lồng được); endpoint chạy dưới profiler trong
+chính thread của nó (route sync chạy ở thread pool). Request xong mà lâu hơn
+RKS_PROFILE_SLOW_MS thì dump file; giữ PROFILE_KEEP file mới nhất.
+
+Giới hạn: chỉ đo thân endpoint (không tính dependency, serialize response,
+body streaming); route async profile bằng cProfile thì lẫn cả coroutine của
+request khác chạy xen trên event loop.
+"""
+from __future__ import annotations
+
+import cProfile
+import functools
+import inspect
+import io
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+
+PROFILE_MODE    = os.getenv("RKS_PROFILE", "off")
+PROFILE_SLOW_MS = float(os.getenv("RKS_PROFILE_SLOW_MS", "500"))
+PROFILE_SAMPLE  = float(os.getenv("RKS_PROFILE_SAMPLE", "1.0"))
+PROFILE_KEEP    = 200
+MODES = ("off", "auto", "cprofile", "pyinstrument")
+
+
+def _has_pyinstrument() -> bool:
+    try:
+        import pyinstrument  # noqa: F401
+    except ImportError:     # optional dependency
+        return False
+    return True
+
+
+class _Session:
+    """Profile của 1 request — chỉ endpoint đầu tiên gọi run()/arun() được đo."""
+
+    def __init__(self, backend: str):
+        self.backend = backend
+        self.result = None          # cProfile.Profile | pyinstrument Session
+        self._claimed = False
+
+    def _claim(self) -> bool:
+        if self._claimed:
+            return False
+        self._claimed = True
+        return True
+
+    def run(self, func, *args, **kwargs):
+        if not self._claim():
+            return func(*args, **kwargs)
+        if self.backend == "pyinstrument":
+            from pyinstrument import Profiler
+            profiler = Profiler(async_mode="disabled")
+            profiler.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.result = profiler.stop()
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            self.result = profiler
+
+    async def arun(self, func, *args, **kwargs):
+        if not self._claim():
+            return await func(*args, **kwargs)
+        if self.backend == "pyinstrument":
+            from pyinstrument import Profiler
+            profiler = Profiler(async_mode="enabled")
+            profiler.start()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.result = profiler.stop()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            self.result = profiler
+
+
+_ACTIVE: ContextVar[_Session | None] = ContextVar("rks_profile_session", default=None)
+
+
+def profiled(func):
+    """Bọc endpoint: chạy dưới profiler nếu request hiện tại được chọn profile."""
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            session = _ACTIVE.get()
+            if session is None:
+                return await func(*args, **kwargs)
+            return await session.arun(func, *args, **kwargs)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            session = _ACTIVE.get()
+            if session is None:
+                return func(*args, **kwargs)
+            return session.run(func, *args, **kwargs)
+    return wrapper
+
+
+class RequestProfiler:
+    def __init__(self, out_dir: Path, mode: str = PROFILE_MODE,
+                 slow_ms: float = PROFILE_SLOW_MS, sample: float = PROFILE_SAMPLE):
+        self.out_dir = out_dir
+        self.slow_ms = slow_ms
+        self.sample = sample
+        self.backend: str | None = None
+        self.mode = "off"
+        self._busy = threading.Lock()
+        self.configure(mode)
+
+    def configure(self, mode: str | None = None, slow_ms: float | None = None,
+                  sample: float | None = None) -> dict:
+        """Đổi cấu hình lúc chạy; ValueError nếu mode không hợp lệ / backend chưa cài."""
+        if mode is not None:
+            if mode not in MODES:
+                raise ValueError(f"mode phải là 1 trong {', '.join(MODES)}")
+            if mode == "pyinstrument" and not _has_pyinstrument():
+                raise ValueError("Chưa cài pyinstrument")
+            backend = None if mode == "off" else mode
+            if mode == "auto":
+                backend = "pyinstrument" if _has_pyinstrument() else "cprofile"
+            self.mode, self.backend = mode, backend
+        if slow_ms is not None:
+            self.slow_ms = max(0.0, slow_ms)
+        if sample is not None:
+            self.sample = min(1.0, max(0.0, sample))
+        return self.config()
+
+    def config(self) -> dict:
+        return {"mode": self.mode, "backend": self.backend, "slow_ms": self.slow_ms,
+                "sample": self.sample, "dir": str(self.out_dir)}
+
+    def begin(self):
+        """Middleware gọi đầu request → (session, context token) hoặc None nếu không profile."""
+        backend = self.backend
+        if backend is None or random.random() >= self.sample or not self._busy.acquire(blocking=False):
+            return None
+        session = _Session(backend)
+        return session, _ACTIVE.set(session)
+
+    def end(self, handle, label: str, elapsed: float, stats: dict) -> None:
+        session, token = handle
+        _ACTIVE.reset(token)
+        try:
+            if session.result is not None and elapsed * 1000 >= self.slow_ms:
+                self._dump(session, label, elapsed, stats)
+        finally:
+            self._busy.release()
+
+    def _dump(self, session: _Session, label: str, elapsed: float, stats: dict) -> None:
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_")[:80]
+        stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(elapsed * 1000)}ms-{slug}"
+        summary = ", ".join(f"{k}={round(v, 4)}" for k, v in stats.items())
+        if session.backend == "pyinstrument":
+            from pyinstrument.renderers import HTMLRenderer
+            path = self.out_dir / f"{stem}.html"
+            path.write_text(HTMLRenderer().render(session.result), encoding="utf-8")
+        else:
+            path = self.out_dir / f"{stem}.prof"
+            session.result.dump_stats(path)
+            out = io.StringIO()
+            pstats.Stats(session.result, stream=out).sort_stats("cumulative").print_stats(25)
+            (self.out_dir / f"{stem}.txt").write_text(f"{label}  {elapsed * 1000:.0f} ms  {summary}\n\n"
+                                                     + out.getvalue(), encoding="utf-8")
+        print(f"[profile] {label} {elapsed * 1000:.0f} ms → {path.name}  {summary}")
+        self._prune()
+
+    def _prune(self) -> None:
+        files = sorted(p for p in self.out_dir.iterdir() if p.suffix in (".prof", ".html", ".txt"))
+        for p in files[:-PROFILE_KEEP]:
+            p.unlink(missing_ok=True)
@@ -0,0 +1,98 @@
+"""
+projection.py — Field projection + cursor pagination cho các list endpoint.
+
+`?fields=a,b` → chỉ serialize các field đó (id luôn có). Serialize qua
+TypeAdapter(list[Model]).dump_json(include=...) — 1 lần gọi pydantic-core cho
+cả list, không dựng dict trung gian, không qua jsonable_encoder của FastAPI.
+
+Cursor = base64url("created_at|id") của item cuối trang; thứ tự (created_at, id)
+ổn định kể cả khi nhiều item cùng created_at. Item tạo sau khi client bắt đầu
+phân trang vẫn xuất hiện ở trang sau (created_at lớn hơn cursor).
+"""
+from __future__ import annotations
+
+import base64
+import heapq
+import json
+from datetime import datetime
+from typing import Iterable, NamedTuple
+
+from pydantic import BaseModel, TypeAdapter
+
+from .models import GraphEdge, GraphNode, Source
+
+# Skeleton = đủ để vẽ canvas; document fields (definition, mechanism, …) để
+# GET /api/nodes/{id} tải khi mở Document Panel.
+SKELETON_NODE_FIELDS = frozenset({"node_id", "title", "node_type", "state", "maturity_score", "x", "y"})
+SKELETON_EDGE_FIELDS = frozenset({"edge_id", "source_node_id", "target_node_id", "relation_type"})
+
+MAX_PAGE_SIZE = 5000
+
+NODES   = TypeAdapter(list[GraphNode])
+EDGES   = TypeAdapter(list[GraphEdge])
+SOURCES = TypeAdapter(list[Source])
+
+
+class Page(NamedTuple):
+    items: list
+    next_cursor: str | None
+
+
+def parse_fields(raw: str | None, model: type[BaseModel], id_field: str) -> frozenset[str] | None:
+    """"title, state" → {"node_id", "title", "state"}. None/rỗng → None (mọi field).
+    Field không tồn tại → ValueError."""
+    if not raw:
+        return None
+    fields = {f.strip() for f in raw.split(",") if f.strip()}
+    unknown = fields - model.model_fields.keys()
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return frozenset(fields | {id_field})
+
+
+def encode_cursor(created_at: datetime, item_id: str) -> str:
+    raw = f"{created_at.isoformat()}|{item_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, item_id = raw.split("|", 1)
+        return datetime.fromisoformat(ts), item_id
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def paginate(items: Iterable, id_field: str, cursor: str | None = None,
+             limit: int | None = None) -> Page:
+    """Trang kế tiếp sau `cursor` theo (created_at, id). limit=None → không cắt trang.
+    nsmallest O(n log limit) — không sort cả container cho 1 trang nhỏ."""
+    def key(x):
+        return x.created_at, getattr(x, id_field)
+
+    if cursor:
+        after = decode_cursor(cursor)
+        items = [x for x in items if key(x) > after]
+    if limit is None:
+        return Page(list(items), None)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    page = heapq.nsmallest(limit + 1, items, key=key)
+    if len(page) <= limit:
+        return Page(page, None)
+    last = page[limit - 1]
+    return Page(page[:limit], encode_cursor(*key(last)))
+
+
+def dump_list(adapter: TypeAdapter, items: list, fields: frozenset[str] | None = None) -> bytes:
+    """JSON bytes của list, chỉ gồm `fields` nếu có."""
+    return adapter.dump_json(items, include={"__all__": set(fields)} if fields else None)
+
+
+def dump_graph(nodes: bytes, edges: bytes, revision: int, next_cursor: str | None) -> bytes:
+    """Ghép payload /graph từ các list đã serialize sẵn."""
+    return b"".join((
+        b'{"nodes":', nodes, b',"edges":', edges,
+        b',"revision":', str(revision).encode(),
+        b',"next_cursor":', json.dumps(next_cursor).encode(), b"}",
+    ))
@@ -0,0 +1,195 @@
+"""
+search.py — Full-text search trên node documents + source.
+
+Text được fold trước khi tokenize: lowercase, bỏ dấu tiếng Việt và đ → d,
+nên "khai niem" khớp "Khái niệm".
+
+SearchIndex là inverted index in-memory, cập nhật từng document (add/remove)
+— FileStorage giữ 1 bản / container. SqliteStorage dùng FTS5 với cùng text đã
+fold và cùng trọng số field.
+"""
+from __future__ import annotations
+
+import bisect
+import heapq
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Iterable, NamedTuple
+
+from .models import GraphNode, Source
+
+# Trọng số (title, tags, body) — dùng chung cho SearchIndex và bm25() của FTS5
+FIELD_WEIGHTS = (3, 2, 1)
+
+# Token cuối của query (đang gõ dở) mở rộng tối đa bấy nhiêu term cùng tiền tố
+# ("kin" → kinh, kinhte, …); các token trước khớp nguyên từ.
+MAX_PREFIX_TERMS = 32
+PREFIX_PENALTY   = 0.8     # khớp tiền tố xếp sau khớp nguyên từ
+# Term xuất hiện ở quá nhiều document: ứng viên chỉ lấy IMPACT_CAP document có
+# trọng số cao nhất (title/tags trước), chia đều cho các term của token hiếm nhất
+# → query từ phổ biến / tiền tố ngắn vẫn < 10 ms.
+IMPACT_CAP       = 1000
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _strip_marks(c: str) -> str:
+    return "".join(x for x in unicodedata.normalize("NFD", c) if not unicodedata.combining(x)).lower()
+
+
+# Bảng fold cho str.translate (chạy ở C): chữ Latin có dấu → chữ gốc thường,
+# combining mark còn sót (text NFD) → bỏ, đ/Đ → d (NFD không tách được đ).
+_FOLD_TABLE: dict[int, str | None] = {
+    cp: folded
+    for cp in (*range(0xC0, 0x250), *range(0x1E00, 0x1F00))
+    if (folded := _strip_marks(chr(cp))) != chr(cp)
+}
+_FOLD_TABLE.update({cp: None for cp in range(0x300, 0x370)})
+_FOLD_TABLE.update({ord("đ"): "d", ord("Đ"): "d"})
+
+
+class SearchHit(NamedTuple):
+    kind: str           # "node" | "source"
+    id: str
+    title: str
+    score: float
+
+
+def fold(text: str) -> str:
+    """Lowercase + bỏ dấu: "Đường cầu" → "duong cau"."""
+    return unicodedata.normalize("NFC", text).translate(_FOLD_TABLE).lower()
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall(fold(text))
+
+
+def node_doc(node: GraphNode) -> tuple[str, str, str]:
+    """(title, tags, body) của node — body gồm các document field."""
+    body = "\n".join([node.definition, node.mechanism, node.boundary_conditions, *node.assumptions])
+    return node.title, " ".join(node.tags), body
+
+
+def source_doc(source: Source) -> tuple[str, str, str]:
+    return source.label, "", source.notes
+
+
+class SearchIndex:
+    """term → {doc_id: trọng số}, kèm danh sách term đã sort để mở rộng tiền tố.
+
+    remove() không dọn term khỏi vocabulary — posting rỗng bị bỏ qua khi query.
+    """
+
+    def __init__(self):
+        self._postings: dict[str, dict[str, float]] = {}
+        self._impact:   dict[str, list[str]] = {}            # term → top IMPACT_CAP doc (lazy)
+        self._terms:    list[str] = []                        # sorted (lazy), cho bisect
+        self._unsorted  = False
+        self._docs:     dict[str, tuple[str, str, Counter]] = {}   # id → (kind, title, terms)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, kind: str, doc_id: str, fields: tuple[str, str, str]) -> None:
+        """Index (hoặc index lại) 1 document; fields = (title, tags, body)."""
+        self.remove(doc_id)
+        tokens: list[str] = []
+        for text, weight in zip(fields, FIELD_WEIGHTS):
+            tokens += tokenize(text) * weight       # trọng số nguyên → lặp token, Counter đếm ở C
+        terms = Counter(tokens)
+        postings = self._postings
+        for tok, w in terms.items():
+            posting = postings.get(tok)
+            if posting is None:
+                posting = postings[tok] = {}
+                self._terms.append(tok)
+                self._unsorted = True
+            posting[doc_id] = math.log1p(w)
+        if self._impact:
+            for tok in terms:
+                self._impact.pop(tok, None)
+        self._docs[doc_id] = (kind, fields[0], terms)
+
+    def remove(self, doc_id: str) -> None:
+        doc = self._docs.pop(doc_id, None)
+        if doc is not None:
+            for tok in doc[2]:
+                self._postings[tok].pop(doc_id, None)
+            if self._impact:
+                for tok in doc[2]:
+                    self._impact.pop(tok, None)
+
+    def _top_docs(self, term: str, cap: int) -> Iterable[str]:
+        """≤ cap doc có trọng số cao nhất của term (cache IMPACT_CAP doc đầu, đã sort)."""
+        posting = self._postings[term]
+        if len(posting) <= cap:
+            return posting
+        top = self._impact.get(term)
+        if top is None:
+            top = self._impact[term] = heapq.nlargest(IMPACT_CAP, posting, key=posting.__getitem__)
+        return top[:cap]
+
+    def _expand(self, tok: str, prefix: bool) -> list[tuple[str, float]]:
+        """Term khớp token: nguyên từ (hệ số 1) + nếu prefix, tối đa MAX_PREFIX_TERMS term cùng tiền tố."""
+        out = [(tok, 1.0)] if self._postings.get(tok) else []
+        if not prefix:
+            return out
+        if self._unsorted:          # timsort: list gần như đã sort → ~O(n)
+            self._terms.sort()
+            self._unsorted = False
+        i = bisect.bisect_right(self._terms, tok)
+        for term in self._terms[i:i + MAX_PREFIX_TERMS]:
+            if not term.startswith(tok):
+                break
+            out.append((term, PREFIX_PENALTY))
+        return out
+
+    def search(self, query: str, limit: int = 20,
+               exclude: set[str] | frozenset[str] = frozenset()) -> list[SearchHit]:
+        """Document chứa MỌI token của query (token cuối khớp cả tiền tố), xếp theo
+        Σ idf · log(1 + trọng số field). `exclude` — id bỏ qua (vd. đã tombstone)."""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens or not self._docs:
+            return []
+        n_docs = len(self._docs)
+        # Mỗi token → [(term, posting, hệ số · idf)] của các term khớp
+        per_token: list[list[tuple[str, dict[str, float], float]]] = []
+        for i, tok in enumerate(tokens):
+            matches = []
+            for term, factor in self._expand(tok, prefix=i == len(tokens) - 1):
+                posting = self._postings[term]
+                if posting:
+                    matches.append((term, posting, factor * math.log(1 + n_docs / len(posting))))
+            if not matches:
+                return []
+            per_token.append(matches)
+
+        # Ứng viên từ token hiếm nhất (term phổ biến: chỉ top IMPACT_CAP doc),
+        # rồi lọc theo các token còn lại (membership trong posting dict)
+        per_token.sort(key=lambda m: sum(len(p) for _, p, _ in m))
+        cap = max(IMPACT_CAP // len(per_token[0]), limit)
+        candidates = set().union(*(self._top_docs(t, cap) for t, _, _ in per_token[0]))
+        for matches in per_token[1:]:
+            candidates = {d for d in candidates if any(d in p for _, p, _ in matches)}
+            if not candidates:
+                return []
+        if exclude:
+            candidates = candidates - exclude if len(exclude) < len(candidates) else \
+                {d for d in candidates if d not in exclude}
+
+        def score(doc_id: str) -> float:
+            return sum(max(idf * p.get(doc_id, 0.0) for _, p, idf in matches) for matches in per_token)
+
+        best = heapq.nlargest(limit, candidates, key=score)
+        return [SearchHit(self._docs[d][0], d, self._docs[d][1], round(score(d), 4)) for d in best]
+
+
+def build_index(nodes: Iterable[GraphNode], sources: Iterable[Source]) -> SearchIndex:
+    index = SearchIndex()
+    for n in nodes:
+        index.add("node", n.node_id, node_doc(n))
+    for s in sources:
+        index.add("source", s.source_id, source_doc(s))
+    return index
@@ -0,0 +1,552 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+
+from pydantic import BaseModel
+
+from . import metrics
+from .graph import Neighbor, neighborhood
+from .models import GraphEdge, GraphNode, KnowledgeContainer, NodeRevision, Source
+from .search import FIELD_WEIGHTS, SearchHit, node_doc, source_doc, tokenize
+from .storage import (
+    _TA_CONTAINER, _TA_EDGE, _TA_NODE, _TA_SOURCE, AbstractStorage, _graph_snapshot, _node_revisions,
+)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SqliteStorage — AbstractStorage trên sqlite3 (stdlib)
+# Mỗi bảng giữ các cột cần query (id, container_id, endpoints) + JSON `data`
+# của model. Mọi truy vấn đi qua index → không còn full-file scan.
+# ─────────────────────────────────────────────────────────────────────────────
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS containers (
+    container_id TEXT PRIMARY KEY,
+    created_at   TEXT NOT NULL,
+    data         TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    source_id    TEXT PRIMARY KEY,
+    container_id TEXT NOT NULL,
+    created_at   TEXT NOT NULL,
+    data         TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    node_id      TEXT PRIMARY KEY,
+    container_id TEXT NOT NULL,
+    created_at   TEXT NOT NULL,
+    data         TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS edges (
+    edge_id        TEXT PRIMARY KEY,
+    container_id   TEXT NOT NULL,
+    source_node_id TEXT NOT NULL,
+    target_node_id TEXT NOT NULL,
+    created_at     TEXT NOT NULL,
+    data           TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_sources_container ON sources(container_id, created_at);
+CREATE INDEX IF NOT EXISTS ix_nodes_container   ON nodes(container_id, created_at);
+CREATE INDEX IF NOT EXISTS ix_edges_container   ON edges(container_id);
+CREATE INDEX IF NOT EXISTS ix_edges_source      ON edges(source_node_id);
+CREATE INDEX IF NOT EXISTS ix_edges_target      ON edges(target_node_id);
+
+-- Change feed: trigger ghi lại mọi insert/delete node + edge, rev = revision graph
+CREATE TABLE IF NOT EXISTS changes (
+    rev          INTEGER PRIMARY KEY AUTOINCREMENT,
+    container_id TEXT NOT NULL,
+    kind         TEXT NOT NULL,
+    entity_id    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_changes_container ON changes(container_id, rev);
+CREATE TRIGGER IF NOT EXISTS tr_nodes_ins AFTER INSERT ON nodes BEGIN
+    INSERT INTO changes (container_id, kind, entity_id) VALUES (NEW.container_id, 'nodes', NEW.node_id);
+END;
+CREATE TRIGGER IF NOT EXISTS tr_nodes_del AFTER DELETE ON nodes BEGIN
+    INSERT INTO changes (container_id, kind, entity_id) VALUES (OLD.container_id, 'nodes', OLD.node_id);
+END;
+CREATE TRIGGER IF NOT EXISTS tr_edges_ins AFTER INSERT ON edges BEGIN
+    INSERT INTO changes (container_id, kind, entity_id) VALUES (NEW.container_id, 'edges', NEW.edge_id);
+END;
+CREATE TRIGGER IF NOT EXISTS tr_edges_del AFTER DELETE ON edges BEGIN
+    INSERT INTO changes (container_id, kind, entity_id) VALUES (OLD.container_id, 'edges', OLD.edge_id);
+END;
+
+-- Lịch sử: mỗi lần ghi node / edge (INSERT OR REPLACE chỉ bắn trigger INSERT) lưu
+-- nguyên bản vào *_history; DELETE thật → dòng data NULL với mốc = lúc xoá.
+-- at = updated_at (node) / created_at (edge) — cùng mốc với FileStorage.
+CREATE TABLE IF NOT EXISTS node_history (
+    seq          INTEGER PRIMARY KEY AUTOINCREMENT,
+    node_id      TEXT NOT NULL,
+    container_id TEXT NOT NULL,
+    at           TEXT NOT NULL,
+    data         TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_node_history_node      ON node_history(node_id, at, seq);
+CREATE INDEX IF NOT EXISTS ix_node_history_container ON node_history(container_id, node_id, at, seq);
+CREATE TABLE IF NOT EXISTS edge_history (
+    seq          INTEGER PRIMARY KEY AUTOINCREMENT,
+    edge_id      TEXT NOT NULL,
+    container_id TEXT NOT NULL,
+    at           TEXT NOT NULL,
+    data         TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_edge_history_container ON edge_history(container_id, edge_id, at, seq);
+CREATE TRIGGER IF NOT EXISTS tr_nodes_history_ins AFTER INSERT ON nodes BEGIN
+    INSERT INTO node_history (node_id, container_id, at, data)
+    VALUES (NEW.node_id, NEW.container_id, json_extract(NEW.data, '$.updated_at'), NEW.data);
+END;
+CREATE TRIGGER IF NOT EXISTS tr_nodes_history_del AFTER DELETE ON nodes BEGIN
+    INSERT INTO node_history (node_id, container_id, at, data)
+    VALUES (OLD.node_id, OLD.container_id, strftime('%Y-%m-%dT%H:%M:%f', 'now'), NULL);
+END;
+CREATE TRIGGER IF NOT EXISTS tr_edges_history_ins AFTER INSERT ON edges BEGIN
+    INSERT INTO edge_history (edge_id, container_id, at, data)
+    VALUES (NEW.edge_id, NEW.container_id, json_extract(NEW.data, '$.created_at'), NEW.data);
+END;
+CREATE TRIGGER IF NOT EXISTS tr_edges_history_del AFTER DELETE ON edges BEGIN
+    INSERT INTO edge_history (edge_id, container_id, at, data)
+    VALUES (OLD.edge_id, OLD.container_id, strftime('%Y-%m-%dT%H:%M:%f', 'now'), NULL);
+END;
+
+-- Full-text search: rowid = rowid của nodes / sources, text đã fold ở Python (search.tokenize)
+-- vì unicode61 không bỏ được dấu của "đ". Upsert index lại trong cùng transaction;
+-- REPLACE không bắn trigger DELETE nên chỉ DELETE thật (cascade, xoá container…) đi qua trigger.
+CREATE VIRTUAL TABLE IF NOT EXISTS search_nodes
+    USING fts5(title, tags, body, tokenize = 'unicode61 remove_diacritics 2');
+CREATE VIRTUAL TABLE IF NOT EXISTS search_sources
+    USING fts5(title, tags, body, tokenize = 'unicode61 remove_diacritics 2');
+CREATE TRIGGER IF NOT EXISTS tr_nodes_unsearch AFTER DELETE ON nodes BEGIN
+    DELETE FROM search_nodes WHERE rowid = OLD.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS tr_sources_unsearch AFTER DELETE ON sources BEGIN
+    DELETE FROM search_sources WHERE rowid = OLD.rowid;
+END;
+"""
+
+# Số dòng change feed giữ lại khi compact; revision cũ hơn → client reload cả graph.
+# Mốc cắt (floor) lưu trong PRAGMA user_version.
+_CHANGES_KEEP = 10_000
+
+# Câu SQL cố định → sqlite3 cache prepared statement theo text của câu lệnh
+_UPSERT_CONTAINER = "INSERT OR REPLACE INTO containers (container_id, created_at, data) VALUES (?, ?, ?)"
+_UPSERT_SOURCE    = "INSERT OR REPLACE INTO sources (source_id, container_id, created_at, data) VALUES (?, ?, ?, ?)"
+_UPSERT_NODE      = "INSERT OR REPLACE INTO nodes (node_id, container_id, created_at, data) VALUES (?, ?, ?, ?)"
+_UPSERT_EDGE      = ("INSERT OR REPLACE INTO edges (edge_id, container_id, source_node_id, target_node_id, created_at, data) "
+                     "VALUES (?, ?, ?, ?, ?, ?)")
+
+_SELECT_CONTAINERS = "SELECT data FROM containers ORDER BY created_at"
+_SELECT_CONTAINER  = "SELECT data FROM containers WHERE container_id = ?"
+_SELECT_SOURCES    = "SELECT data FROM sources WHERE container_id = ? ORDER BY created_at"
+_SELECT_SOURCE     = "SELECT data FROM sources WHERE source_id = ?"
+_SELECT_NODES      = "SELECT data FROM nodes WHERE container_id = ? ORDER BY created_at"
+_SELECT_NODE       = "SELECT data FROM nodes WHERE node_id = ?"
+_SELECT_EDGES      = "SELECT data FROM edges WHERE container_id = ?"
+_SELECT_EDGE       = "SELECT data FROM edges WHERE edge_id = ?"
+_SELECT_CHILDREN   = "SELECT target_node_id FROM edges WHERE source_node_id = ?"
+_SELECT_PARENTS    = "SELECT source_node_id FROM edges WHERE target_node_id = ?"
+_SELECT_OUT_EDGES  = "SELECT data FROM edges WHERE source_node_id = ?"
+_SELECT_IN_EDGES   = "SELECT data FROM edges WHERE target_node_id = ? AND source_node_id != ?"
+_COUNT_DEGREE      = "SELECT COUNT(*) FROM edges WHERE source_node_id = ? OR target_node_id = ?"
+_MAX_REV           = "SELECT MAX(rev) FROM changes WHERE container_id = ?"
+_SELECT_CHANGES    = "SELECT kind, entity_id FROM changes WHERE container_id = ? AND rev > ? ORDER BY rev"
+
+# Đọc theo khối bằng keyset (không giữ cursor giữa các khối — StreamingResponse
+# gọi next() ở thread bất kỳ, connection lại theo thread). (container_id,
+# created_at) / (container_id) của index đã kèm rowid → ORDER BY đi theo index.
+_EXPORT_SQL = {
+    "sources": ("SELECT rowid, created_at, data FROM sources WHERE container_id = ? "
+                "AND (created_at, rowid) > (?, ?) ORDER BY created_at, rowid LIMIT ?"),
+    "nodes":   ("SELECT rowid, created_at, data FROM nodes WHERE container_id = ? "
+                "AND (created_at, rowid) > (?, ?) ORDER BY created_at, rowid LIMIT ?"),
+    "edges":   ("SELECT rowid, created_at, data FROM edges WHERE container_id = ? "
+                "AND rowid > ? ORDER BY rowid LIMIT ?"),
+}
+_EXPORT_TA = {"sources": _TA_SOURCE, "nodes": _TA_NODE, "edges": _TA_EDGE}
+
+# Lịch sử: revision mới nhất có at ≤ ? của mỗi record trong container (data NULL = đã xoá)
+_NODE_HISTORY = "SELECT at, data FROM node_history WHERE node_id = ? ORDER BY at, seq"
+_NODES_AT     = ("SELECT data FROM (SELECT data, ROW_NUMBER() OVER (PARTITION BY node_id ORDER BY at DESC, seq DESC) AS rn "
+                 "FROM node_history WHERE container_id = ? AND at <= ?) WHERE rn = 1 AND data IS NOT NULL")
+_EDGES_AT     = ("SELECT data FROM (SELECT data, ROW_NUMBER() OVER (PARTITION BY edge_id ORDER BY at DESC, seq DESC) AS rn "
+                 "FROM edge_history WHERE container_id = ? AND at <= ?) WHERE rn = 1 AND data IS NOT NULL")
+_BACKFILL_HISTORY = (
+    "INSERT INTO node_history (node_id, container_id, at, data) "
+    "SELECT node_id, container_id, json_extract(data, '$.updated_at'), data FROM nodes",
+    "INSERT INTO edge_history (edge_id, container_id, at, data) "
+    "SELECT edge_id, container_id, json_extract(data, '$.created_at'), data FROM edges",
+)
+
+_UNINDEX_NODE   = "DELETE FROM search_nodes WHERE rowid = (SELECT rowid FROM nodes WHERE node_id = ?)"
+_INDEX_NODE     = "INSERT INTO search_nodes (rowid, title, tags, body) SELECT rowid, ?, ?, ? FROM nodes WHERE node_id = ?"
+_UNINDEX_SOURCE = "DELETE FROM search_sources WHERE rowid = (SELECT rowid FROM sources WHERE source_id = ?)"
+_INDEX_SOURCE   = ("INSERT INTO search_sources (rowid, title, tags, body) "
+                   "SELECT rowid, ?, ?, ? FROM sources WHERE source_id = ?")
+_BM25_WEIGHTS   = ", ".join(str(w) for w in FIELD_WEIGHTS)
+_SEARCH_NODES   = (f"SELECT n.node_id, json_extract(n.data, '$.title'), bm25(search_nodes, {_BM25_WEIGHTS}) AS rank "
+                   "FROM search_nodes JOIN nodes n ON n.rowid = search_nodes.rowid "
+                   "WHERE search_nodes MATCH ? AND n.container_id = ? ORDER BY rank LIMIT ?")
+_SEARCH_SOURCES = (f"SELECT s.source_id, json_extract(s.data, '$.label'), bm25(search_sources, {_BM25_WEIGHTS}) AS rank "
+                   "FROM search_sources JOIN sources s ON s.rowid = search_sources.rowid "
+                   "WHERE search_sources MATCH ? AND s.container_id = ? ORDER BY rank LIMIT ?")
+
+_DELETE_CONTAINER        = "DELETE FROM containers WHERE container_id = ?"
+_DELETE_SOURCES_OF       = "DELETE FROM sources WHERE container_id = ?"
+_DELETE_NODES_OF         = "DELETE FROM nodes WHERE container_id = ?"
+_DELETE_EDGES_OF         = "DELETE FROM edges WHERE container_id = ?"
+_DELETE_SOURCE           = "DELETE FROM sources WHERE source_id = ?"
+_DELETE_NODE             = "DELETE FROM nodes WHERE node_id = ?"
+_DELETE_EDGE             = "DELETE FROM edges WHERE edge_id = ?"
+_DELETE_EDGES_OF_NODE    = "DELETE FROM edges WHERE source_node_id = ? OR target_node_id = ?"
+
+
+def _dump(obj: BaseModel) -> str:
+    return obj.model_dump_json()
+
+
+def _search_row(doc: tuple[str, str, str]) -> tuple[str, str, str]:
+    return tuple(" ".join(tokenize(text)) for text in doc)
+
+
+def _validate_rows(adapter, rows) -> list:
+    """Model từ các dòng (data,) — ghi nhận kích thước JSON (≈ byte) + số record vào metrics."""
+    out, size = [], 0
+    for (data,) in rows:
+        size += len(data)
+        out.append(adapter.validate_json(data))
+    metrics.record_read(size, len(out))
+    return out
+
+
+def _fts_query(query: str) -> str | None:
+    """Query FTS5 như SearchIndex: khái niệm → "khai" "niem"* (token cuối khớp tiền tố)."""
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens:
+        return None
+    return " ".join(f'"{t}"' for t in tokens[:-1]) + f' "{tokens[-1]}"*'
+
+
+class SqliteStorage(AbstractStorage):
+    """SQLite-backed storage: 1 file rks.sqlite3 / user, WAL mode.
+    Upsert = INSERT OR REPLACE; delete = DELETE thật (không cần tombstone).
+    """
+
+    def __init__(self, db_path: Path):
+        super().__init__()
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._path  = db_path
+        self._local = threading.local()       # 1 connection / thread (sqlite3 không share được)
+        # Mọi connection đã mở (của mọi thread trong threadpool) — close() đóng hết
+        self._conns: set[sqlite3.Connection] = set()
+        self._conns_lock = threading.Lock()
+        conn = self._conn()
+        has_search = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'search_nodes'").fetchone()
+        has_history = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'node_history'").fetchone()
+        conn.executescript(_SCHEMA)
+        if not has_search:
+            self.reindex_search()               # DB tạo trước khi có FTS → index dữ liệu cũ
+        if not has_history:
+            with self._tx():                    # DB cũ → bản hiện tại làm revision đầu tiên
+                for sql in _BACKFILL_HISTORY:
+                    conn.execute(sql)
+
+    # ── internal helpers ──────────────────────────────────────────────────
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # check_same_thread=False chỉ để close() đóng được từ thread khác;
+            # ngoài close, connection chỉ được dùng bởi thread đã mở nó
+            conn = sqlite3.connect(self._path, isolation_level=None, cached_statements=64,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.add(conn)
+        return conn
+
+    @contextmanager
+    def _tx(self):
+        conn = self._conn()
+        if conn.in_transaction:             # transaction lồng nhau → gộp vào transaction ngoài
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self) -> None:
+        """Đóng connection của MỌI thread đã dùng instance này (không chỉ thread gọi
+        close) → không giữ fd, connection cuối đóng thì sqlite checkpoint + xoá -wal.
+        Thread còn dùng instance sau đó sẽ mở connection mới."""
+        with self._conns_lock:
+            conns, self._conns = self._conns, set()
+            self._local = threading.local()
+        for conn in conns:
+            conn.close()
+        super().close()
+
+    @contextmanager
+    def batch(self):
+        """1 transaction cho cả block — commit 1 lần."""
+        with self._tx():
+            yield self
+
+    def _one(self, sql: str, key: str, adapter):
+        row = self._conn().execute(sql, (key,)).fetchone()
+        if row is None:
+            return None
+        metrics.record_read(len(row[0]), 1)
+        return adapter.validate_json(row[0])
+
+    def _many(self, sql: str, key: str, adapter) -> list:
+        return _validate_rows(adapter, self._conn().execute(sql, (key,)))
+
+    def iter_records(self, kind: str, container_id: str, chunk: int = 1000) -> Iterator[list]:
+        """Khối ≤ chunk record, mỗi khối 1 query keyset riêng — bộ nhớ O(chunk)."""
+        sql, adapter = _EXPORT_SQL[kind], _EXPORT_TA[kind]
+        last: tuple[str, int] = ("", 0)         # (created_at, rowid) dòng cuối khối trước
+        while True:
+            key = (last[1],) if kind == "edges" else last
+            rows = self._conn().execute(sql, (container_id, *key, chunk)).fetchall()
+            if not rows:
+                return
+            last = (rows[-1][1], rows[-1][0])
+            yield _validate_rows(adapter, ((data,) for _, _, data in rows))
+            if len(rows) < chunk:
+                return
+
+    # ── MAINTENANCE ───────────────────────────────────────────────────────
+
+    def garbage_ratio(self) -> tuple[float, int]:
+        """(tỉ lệ page trống, tổng số page) — tương đương garbage của FileStorage."""
+        conn  = self._conn()
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free  = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (free / pages if pages else 0.0), pages
+
+    def compact(self) -> dict:
+        conn = self._conn()
+        before = conn.execute("PRAGMA page_count").fetchone()[0]
+        floor = (conn.execute("SELECT MAX(rev) FROM changes").fetchone()[0] or 0) - _CHANGES_KEEP
+        if floor > self._floor():
+            with self._tx():
+                conn.execute("DELETE FROM changes WHERE rev <= ?", (floor,))
+                conn.execute(f"PRAGMA user_version = {int(floor)}")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        after = conn.execute("PRAGMA page_count").fetchone()[0]
+        return {"pages_before": before, "pages_after": after}
+
+    def maybe_compact(self, garbage_ratio: float, min_rows: int = 0) -> dict | None:
+        ratio, total = self.garbage_ratio()
+        if total < min_rows or ratio < garbage_ratio:
+            return None
+        return self.compact()
+
+    # ── CONTAINERS ────────────────────────────────────────────────────────
+
+    def list_containers(self) -> list[KnowledgeContainer]:
+        return _validate_rows(_TA_CONTAINER, self._conn().execute(_SELECT_CONTAINERS))
+
+    def get_container(self, container_id: str) -> KnowledgeContainer | None:
+        return self._one(_SELECT_CONTAINER, container_id, _TA_CONTAINER)
+
+    def upsert_container(self, c: KnowledgeContainer) -> None:
+        with self._tx() as conn:
+            conn.execute(_UPSERT_CONTAINER, (c.container_id, c.created_at.isoformat(), _dump(c)))
+
+    def delete_container(self, container_id: str) -> None:
+        with self._tx() as conn:
+            for sql in (_DELETE_EDGES_OF, _DELETE_NODES_OF, _DELETE_SOURCES_OF, _DELETE_CONTAINER):
+                conn.execute(sql, (container_id,))
+
+    # ── SOURCES ───────────────────────────────────────────────────────────
+
+    def list_sources(self, container_id: str) -> list[Source]:
+        return self._many(_SELECT_SOURCES, container_id, _TA_SOURCE)
+
+    def get_source(self, source_id: str) -> Source | None:
+        return self._one(_SELECT_SOURCE, source_id, _TA_SOURCE)
+
+    def upsert_source(self, s: Source) -> None:
+        with self._tx() as conn:
+            conn.execute(_UNINDEX_SOURCE, (s.source_id,))
+            conn.execute(_UPSERT_SOURCE, (s.source_id, s.container_id, s.created_at.isoformat(), _dump(s)))
+            conn.execute(_INDEX_SOURCE, (*_search_row(source_doc(s)), s.source_id))
+
+    def delete_source(self, source_id: str) -> None:
+        with self._tx() as conn:
+            conn.execute(_DELETE_SOURCE, (source_id,))
+
+    # ── NODES ─────────────────────────────────────────────────────────────
+
+    def list_nodes(self, container_id: str) -> list[GraphNode]:
+        return self._many(_SELECT_NODES, container_id, _TA_NODE)
+
+    def get_node(self, node_id: str) -> GraphNode | None:
+        return self._one(_SELECT_NODE, node_id, _TA_NODE)
+
+    def upsert_node(self, node: GraphNode) -> None:
+        with self._tx() as conn:
+            conn.execute(_UNINDEX_NODE, (node.node_id,))
+            conn.execute(_UPSERT_NODE, (node.node_id, node.container_id, node.created_at.isoformat(), _dump(node)))
+            conn.execute(_INDEX_NODE, (*_search_row(node_doc(node)), node.node_id))
+
+    def delete_node(self, node_id: str) -> None:
+        """Delete node + all its edges."""
+        with self._tx() as conn:
+            conn.execute(_DELETE_EDGES_OF_NODE, (node_id, node_id))
+            conn.execute(_DELETE_NODE, (node_id,))
+
+    def delete_node_cascade(self, node_id: str) -> list[str]:
+        """Delete node and all purely-downstream nodes (only 1 incoming edge from this node).
+        Returns list of all deleted node_ids."""
+        with self._tx() as conn:
+            if conn.execute(_SELECT_NODE, (node_id,)).fetchone() is None:
+                return []
+            to_delete: list[str] = []
+            queue = deque([node_id])
+            visited: set[str] = set()
+            while queue:
+                current = queue.popleft()
+                if current in visited:
+                    continue
+                visited.add(current)
+                to_delete.append(current)
+                for (child,) in conn.execute(_SELECT_CHILDREN, (current,)).fetchall():
+                    parents = [p for (p,) in conn.execute(_SELECT_PARENTS, (child,))]
+                    # Only cascade-delete if this node is the ONLY parent
+                    if parents == [current]:
+                        queue.append(child)
+            for nid in to_delete:
+                self.delete_node(nid)
+        return to_delete
+
+    # ── GRAPH ─────────────────────────────────────────────────────────────
+    # Neighborhood / degree đi thẳng qua index source/target — O(degree),
+    # không cần cache như FileStorage.
+
+    def _incident(self, node_id: str) -> list[GraphEdge]:
+        conn = self._conn()
+        return (_validate_rows(_TA_EDGE, conn.execute(_SELECT_OUT_EDGES, (node_id,)))
+                + _validate_rows(_TA_EDGE, conn.execute(_SELECT_IN_EDGES, (node_id, node_id))))
+
+    def get_neighborhood(self, node_id: str, hops: int = 1, limit: int = 8,
+                         def_chars: int = 120) -> list[Neighbor]:
+        if self.get_node(node_id) is None:
+            return []
+        return neighborhood(self._incident, self.get_node, node_id, hops, limit, def_chars)
+
+    def node_degree(self, node_id: str) -> int:
+        return self._conn().execute(_COUNT_DEGREE, (node_id, node_id)).fetchone()[0]
+
+    # ── SEARCH ────────────────────────────────────────────────────────────
+
+    def search(self, query: str, container_id: str, limit: int = 20) -> list[SearchHit]:
+        """FTS5 MATCH trên text đã fold, xếp theo bm25 (trọng số FIELD_WEIGHTS)."""
+        fts = _fts_query(query)
+        if fts is None:
+            return []
+        conn = self._conn()
+        hits = [SearchHit("node", rid, title, round(-rank, 4))
+                for rid, title, rank in conn.execute(_SEARCH_NODES, (fts, container_id, limit))]
+        hits += [SearchHit("source", rid, title, round(-rank, 4))
+                 for rid, title, rank in conn.execute(_SEARCH_SOURCES, (fts, container_id, limit))]
+        hits.sort(key=lambda h: h.score, reverse=True)
+        return hits[:limit]
+
+    def reindex_search(self) -> None:
+        """Dựng lại search_nodes / search_sources từ dữ liệu hiện có."""
+        with self._tx() as conn:
+            conn.execute("DELETE FROM search_nodes")
+            conn.execute("DELETE FROM search_sources")
+            conn.executemany(
+                "INSERT INTO search_nodes (rowid, title, tags, body) VALUES (?, ?, ?, ?)",
+                ((rowid, *_search_row(node_doc(_TA_NODE.validate_json(data))))
+                 for rowid, data in conn.execute("SELECT rowid, data FROM nodes").fetchall()),
+            )
+            conn.executemany(
+                "INSERT INTO search_sources (rowid, title, tags, body) VALUES (?, ?, ?, ?)",
+                ((rowid, *_search_row(source_doc(_TA_SOURCE.validate_json(data))))
+                 for rowid, data in conn.execute("SELECT rowid, data FROM sources").fetchall()),
+            )
+
+    # ── CHANGE FEED ───────────────────────────────────────────────────────
+
+    def _floor(self) -> int:
+        return self._conn().execute("PRAGMA user_version").fetchone()[0]
+
+    def graph_revision(self, container_id: str) -> int:
+        rev = self._conn().execute(_MAX_REV, (container_id,)).fetchone()[0]
+        return max(rev or 0, self._floor())
+
+    def graph_changes(self, container_id: str, since: int) -> dict | None:
+        conn = self._conn()
+        own_tx = not conn.in_transaction
+        if own_tx:
+            conn.execute("BEGIN")      # snapshot đọc nhất quán giữa các câu SELECT
+        try:
+            revision = self.graph_revision(container_id)
+            if since < self._floor() or since > revision:
+                return None
+            changed = dict.fromkeys(conn.execute(_SELECT_CHANGES, (container_id, since)).fetchall())
+            out = {"revision": revision, "nodes": [], "edges": [], "deleted_nodes": [], "deleted_edges": []}
+            for kind, rid in changed:
+                if kind == "nodes":
+                    r = self._one(_SELECT_NODE, rid, _TA_NODE)
+                else:
+                    r = self._one(_SELECT_EDGE, rid, _TA_EDGE)
+                if r is not None and r.container_id == container_id:
+                    out[kind].append(r)
+                else:
+                    out[f"deleted_{kind}"].append(rid)
+            return out
+        finally:
+            if own_tx:
+                conn.execute("COMMIT")
+
+    # ── HISTORY ───────────────────────────────────────────────────────────
+
+    def node_history(self, node_id: str) -> list[NodeRevision] | None:
+        rows = self._conn().execute(_NODE_HISTORY, (node_id,)).fetchall()
+        if not rows:
+            return None
+        metrics.record_read(sum(len(data) for _, data in rows if data), len(rows))
+        return _node_revisions((at, _TA_NODE.validate_json(data) if data else None) for at, data in rows)
+
+    def graph_at(self, container_id: str, at: datetime) -> tuple[list[GraphNode], list[GraphEdge]]:
+        conn, key = self._conn(), at.isoformat()
+        return _graph_snapshot(_validate_rows(_TA_NODE, conn.execute(_NODES_AT, (container_id, key))),
+                               _validate_rows(_TA_EDGE, conn.execute(_EDGES_AT, (container_id, key))))
+
+    # ── EDGES ─────────────────────────────────────────────────────────────
+
+    def list_edges(self, container_id: str) -> list[GraphEdge]:
+        return self._many(_SELECT_EDGES, container_id, _TA_EDGE)
+
+    def get_edge(self, edge_id: str) -> GraphEdge | None:
+        return self._one(_SELECT_EDGE, edge_id, _TA_EDGE)
+
+    def upsert_edge(self, edge: GraphEdge) -> None:
+        with self._tx() as conn:
+            conn.execute(_UPSERT_EDGE, (
+                edge.edge_id, edge.container_id, edge.source_node_id, edge.target_node_id,
+                edge.created_at.isoformat(), _dump(edge),
+            ))
+
+    def delete_edge(self, edge_id: str) -> None:
+        with self._tx() as conn:
+            conn.execute(_DELETE_EDGE, (edge_id,))
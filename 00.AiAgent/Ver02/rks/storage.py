@@ -1,20 +1,52 @@
 from __future__ import annotations
 
-import json
+import os
+import threading
+import time
 from abc import ABC, abstractmethod
+from bisect import bisect_right, insort
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from operator import itemgetter
 from pathlib import Path
+from typing import Iterable, Iterator
 
-from pydantic import TypeAdapter
+from pydantic import BaseModel, TypeAdapter
 
-from .models import GraphEdge, GraphNode, KnowledgeContainer, Source
+from . import jsonio, metrics
+from .filelock import FileLock, atomic_write_bytes
+from .embeddings import EmbeddingIndex, Similar, build_embedding_index
+from .graph import Adjacency, Neighbor, neighborhood
+from .layout import container_seed, layout_graph
+from .models import GraphEdge, GraphNode, KnowledgeContainer, NodeRevision, Source
+from .search import SearchHit, SearchIndex, build_index, node_doc, source_doc
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # AbstractStorage — interface contract
-# Swap FileStorage → PgStorage (Phase 3) mà không đụng routes.
+# Swap FileStorage → SqliteStorage / PgStorage (Phase 3) mà không đụng routes.
 # ─────────────────────────────────────────────────────────────────────────────
 
 class AbstractStorage(ABC):
+    def __init__(self):
+        # Cache dẫn xuất gắn vào instance (storage sống theo session user):
+        # (lock, {container_id: (graph revision, EmbeddingIndex)}) — similar_nodes
+        self._embeddings: tuple[threading.Lock, dict] = (threading.Lock(), {})
+        # (lock, {container_id: revision đã layout xong}) — ensure_layout
+        self._layout: tuple[threading.Lock, dict] = (threading.Lock(), {})
+
+    def close(self) -> None:
+        """Giải phóng tài nguyên khi instance bị bỏ khỏi pool. Subclass gọi super().close()."""
+        for lock, cache in (self._embeddings, self._layout):
+            with lock:
+                cache.clear()
+
+    # Batching — gom nhiều mutation thành 1 lần ghi; mặc định ghi ngay từng lệnh
+    @contextmanager
+    def batch(self):
+        yield self
+
     # Containers
     @abstractmethod
     def list_containers(self) -> list[KnowledgeContainer]: ...
@@ -29,6 +61,8 @@ class AbstractStorage(ABC):
     @abstractmethod
     def list_sources(self, container_id: str) -> list[Source]: ...
     @abstractmethod
+    def get_source(self, source_id: str) -> Source | None: ...
+    @abstractmethod
     def upsert_source(self, s: Source) -> None: ...
     @abstractmethod
     def delete_source(self, source_id: str) -> None: ...
@@ -55,198 +89,1397 @@ class AbstractStorage(ABC):
     @abstractmethod
     def delete_edge(self, edge_id: str) -> None: ...
 
+    # Đọc theo khối — export / stream không cần cả container trong 1 list
+    def iter_records(self, kind: str, container_id: str, chunk: int = 1000) -> Iterator[list]:
+        """Record của container theo từng khối ≤ chunk; kind: sources | nodes | edges.
+        Mặc định cắt từ list_*; backend override để không dựng cả list."""
+        items = getattr(self, f"list_{kind}")(container_id)
+        for start in range(0, len(items), chunk):
+            yield items[start:start + chunk]
+
+    # Graph
+    def adjacency(self, container_id: str) -> Adjacency:
+        return Adjacency(self.list_edges(container_id))
+
+    def get_neighborhood(self, node_id: str, hops: int = 1, limit: int = 8,
+                         def_chars: int = 120) -> list[Neighbor]:
+        """Các node cách node_id ≤ hops bước (cả 2 chiều), kèm relation + definition rút gọn."""
+        node = self.get_node(node_id)
+        if node is None:
+            return []
+        adj = self.adjacency(node.container_id)
+        return neighborhood(adj.incident, self.get_node, node_id, hops, limit, def_chars)
+
+    def node_degree(self, node_id: str) -> int:
+        """Số edge chạm node (self-loop tính 1)."""
+        node = self.get_node(node_id)
+        return self.adjacency(node.container_id).degree(node_id) if node else 0
+
+    # Search
+    def search(self, query: str, container_id: str, limit: int = 20) -> list[SearchHit]:
+        """Node + source của container khớp query, xếp theo độ liên quan."""
+        index = build_index(self.list_nodes(container_id), self.list_sources(container_id))
+        return index.search(query, limit)
+
+    # Embedding — node gần nghĩa (agent: context cho prompt + dedupe SuggestedNode)
+    def similar_nodes(self, container_id: str, text: str, k: int = 5,
+                      exclude: Iterable[str] = (), min_score: float = 0.0) -> list[Similar]:
+        """k node của container gần nghĩa với `text` nhất (cosine trên embedding local)."""
+        lock, cache = self._embeddings
+        with lock:
+            return self._embedding_index(cache, container_id).nearest(text, k, exclude, min_score)
+
+    def _embedding_index(self, cache: dict, container_id: str) -> EmbeddingIndex:
+        """EmbeddingIndex của container: build 1 lần, sau đó chỉ embed lại node đổi
+        theo change feed (graph_changes); feed không còn đủ → build lại."""
+        cached = cache.get(container_id)
+        changes = self.graph_changes(container_id, cached[0]) if cached else None
+        if changes is None:
+            revision = self.graph_revision(container_id)
+            index = build_embedding_index(self.list_nodes(container_id))
+        else:
+            revision, index = changes["revision"], cached[1]
+            for node_id in changes["deleted_nodes"]:
+                index.remove(node_id)
+            index.add_nodes(changes["nodes"])
+        cache[container_id] = (revision, index)
+        return index
+
+    # Layout — x/y tính sẵn cho canvas (rks/layout.py)
+    def ensure_layout(self, container_id: str, reset: bool = False) -> int:
+        """Đặt vị trí cho node chưa có x/y (reset → cả container) và lưu lại.
+        Trả số node vừa đặt. Graph chưa đổi từ lần trước → trả 0, không quét node."""
+        lock, settled = self._layout
+        with lock:
+            if not reset and settled.get(container_id) == self.graph_revision(container_id):
+                return 0
+            positions = layout_graph(self.list_nodes(container_id), self.list_edges(container_id),
+                                     reset=reset, seed=container_seed(container_id))
+            self.set_node_positions(container_id, positions)
+            settled[container_id] = self.graph_revision(container_id)
+            return len(positions)
+
+    def set_node_positions(self, container_id: str, positions: dict[str, tuple[float, float]]) -> int:
+        """Ghi x/y cho các node của container (node lạ / đã xoá bỏ qua). Không đổi
+        version / updated_at — vị trí không phải nội dung. Trả số node đã ghi."""
+        saved = 0
+        with self.batch():
+            for node_id, (x, y) in positions.items():
+                node = self.get_node(node_id)
+                if node is None or node.container_id != container_id:
+                    continue
+                self.upsert_node(node.model_copy(update={"x": x, "y": y}))
+                saved += 1
+        return saved
+
+    # Change feed — revision của graph (nodes + edges) mỗi container, tăng đơn điệu
+    @abstractmethod
+    def graph_revision(self, container_id: str) -> int: ...
+    @abstractmethod
+    def graph_changes(self, container_id: str, since: int) -> dict | None:
+        """Nodes/edges upsert + id bị xoá sau revision `since`:
+        {"revision", "nodes", "edges", "deleted_nodes", "deleted_edges"}.
+        None → `since` quá cũ / không hợp lệ, client phải tải lại cả graph."""
+
+    # Lịch sử — mốc của 1 revision: node.updated_at, edge.created_at, lúc xoá
+    @abstractmethod
+    def node_history(self, node_id: str) -> list[NodeRevision] | None:
+        """Mọi revision của node, cũ → mới (kể cả trước compact, kể cả lần xoá).
+        None → không có node này."""
+    @abstractmethod
+    def graph_at(self, container_id: str, at: datetime) -> tuple[list[GraphNode], list[GraphEdge]]:
+        """Nodes + edges của container như lúc `at` (UTC, naive): mỗi record lấy
+        bản mới nhất có mốc ≤ at, bỏ record đã xoá trước đó."""
+
+
+def _node_revisions(rows: Iterable[tuple[str, GraphNode | None]]) -> list[NodeRevision]:
+    """(mốc, node | None = xoá) cũ → mới → NodeRevision. Bản chỉ đổi x/y (layout,
+    kéo thả — cùng version + updated_at với bản trước) không phải revision: bỏ qua."""
+    out: list[NodeRevision] = []
+    for at, node in rows:
+        prev = out[-1] if out else None
+        if prev is not None and node is None and prev.deleted:
+            continue
+        if (prev is not None and node is not None and prev.node is not None
+                and (prev.node.version, prev.node.updated_at) == (node.version, node.updated_at)):
+            continue
+        out.append(NodeRevision(at=at, deleted=node is None, node=node))
+    return out
+
+
+def _graph_snapshot(nodes: list[GraphNode], edges: list[GraphEdge]) -> tuple[list[GraphNode], list[GraphEdge]]:
+    """Kết quả graph_at: node theo created_at như list_nodes, edge phải còn đủ 2 đầu."""
+    alive = {n.node_id for n in nodes}
+    return (sorted(nodes, key=lambda n: n.created_at),
+            [e for e in edges if e.source_node_id in alive and e.target_node_id in alive])
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Materialized index — 1 bản / data_dir, dùng chung giữa các FileStorage
+# Load file 1 lần, cập nhật tại chỗ khi _append / tombstone,
+# chỉ đọc + validate lại khi size/mtime của file thay đổi từ bên ngoài.
+#
+# Nhiều process (uvicorn --workers N) dùng chung 1 data_dir:
+#   - mọi thao tác ghi giữ flock {data_dir}/.lock (_StoreState.writing) và
+#     refresh index ngay trong lock → không xen dòng, không ghi đè tombstone;
+#   - file chỉ dài thêm (append) → process khác đọc đúng phần sau _offset;
+#     file bị thay (compact, tombstone ghi tmp + rename) → inode đổi → load lại.
+# ─────────────────────────────────────────────────────────────────────────────
+
+_TA_CONTAINER = TypeAdapter(KnowledgeContainer)
+_TA_SOURCE    = TypeAdapter(Source)
+_TA_NODE      = TypeAdapter(GraphNode)
+_TA_EDGE      = TypeAdapter(GraphEdge)
+
+_SNAPSHOT_KEY = "_snapshot"
+_DELETED_KEY  = "_deleted"      # dòng {"_deleted": id, "at": …} — mốc xoá cho lịch sử
+
+_HISTORY_SUFFIX = ".history.jsonl"
+_SCAN_CHUNK     = 8 * 1024 * 1024      # quét log lịch sử theo khối — RAM không theo kích thước file
+# id_field → field làm mốc thời gian của 1 revision (chỉ graph có lịch sử)
+_HISTORY_FIELDS = {"node_id": "updated_at", "edge_id": "created_at"}
+
+
+def _stat_sig(path: Path) -> tuple[int, int, int] | None:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def _dump_line(obj: BaseModel) -> str:
+    return obj.model_dump_json() + "\n"
+
+
+class _EntityIndex:
+    """id → latest validated record, container_id → id set for one JSONL file."""
+
+    def __init__(self, path: Path, id_field: str, adapter: TypeAdapter):
+        self.path      = path
+        self.id_field  = id_field
+        self.adapter   = adapter
+        self.records:      dict[str, BaseModel] = {}
+        self.by_container: dict[str, set[str]] = {}
+        self.rows_total = 0      # số dòng record trong file (kể cả bản cũ) — dùng tính garbage
+        self.version    = 0      # tăng mỗi lần records đổi — key cho cache dẫn xuất
+        self._sig: tuple[int, int, int] | None = None
+        self._offset = 0         # số byte đầu file đã parse + validate vào records
+        self._loaded = False
+        ts_field = _HISTORY_FIELDS.get(id_field)
+        self.history = _History(self, ts_field) if ts_field else None
+
+    def refresh(self) -> None:
+        sig = _stat_sig(self.path)
+        if self._loaded and sig == self._sig:
+            return
+        external = self._loaded
+        prev, self._sig = self._sig, sig
+        if external and sig and prev and sig[2] == prev[2] and sig[0] > self._offset:
+            self._load_tail()    # cùng file, chỉ dài thêm → chỉ đọc phần mới append
+        else:
+            self._load()
+
+    def _load(self) -> None:
+        latest: dict[str, dict] = {}
+        data = self.path.read_bytes() if self.path.exists() else b""
+        end = data.rfind(b"\n") + 1       # dòng cuối process khác đang ghi dở → lần sau
+        self.rows_total = self._parse_into(latest, data[:end])
+        self._offset = end
+        self.records = {}
+        self.by_container = {}
+        for rid, row in latest.items():
+            self._put(rid, self.adapter.validate_python(row))
+        metrics.record_read(end, len(latest))
+        self.version += 1
+        self._loaded = True
+
+    def _load_tail(self) -> None:
+        """Process khác append thêm dòng: record cũ đã validate giữ nguyên,
+        chỉ parse + validate byte sau _offset. Dòng cuối chưa có newline
+        (đang ghi dở) để lần refresh sau."""
+        with self.path.open("rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return
+        latest: dict[str, dict] = {}
+        self.rows_total += self._parse_into(latest, data[:end])
+        self._offset += end
+        for rid, row in latest.items():
+            self._put(rid, self.adapter.validate_python(row))
+        metrics.record_read(end, len(latest))
+        self.version += 1
+
+    def _parse_into(self, latest: dict[str, dict], data: bytes) -> int:
+        rows = 0
+        for line in data.splitlines():
+            line = line.strip()
+            if line:
+                try:
+                    row = jsonio.loads(line)
+                except ValueError:
+                    continue        # dòng ghi dở khi process chết giữa chừng
+                if _SNAPSHOT_KEY in row or _DELETED_KEY in row:
+                    continue
+                latest[row[self.id_field]] = row     # last write wins
+                rows += 1
+        return rows
+
+    def _put(self, rid: str, obj: BaseModel) -> None:
+        old = self.records.get(rid)
+        if old is not None:
+            self.by_container.get(old.container_id, set()).discard(rid)
+        self.records[rid] = obj
+        self.by_container.setdefault(obj.container_id, set()).add(rid)
+        self.version += 1
+
+    def apply(self, obj: BaseModel) -> None:
+        """Ghi nhận record vừa append — không cần đọc lại file."""
+        self._put(getattr(obj, self.id_field), obj)
+        self.rows_total += 1
+        self.mark_synced()
+
+    @property
+    def torn(self) -> bool:
+        """Cuối file có dòng dở (writer chết giữa chừng) — gọi sau refresh(), trong lock ghi."""
+        return self._sig is not None and self._sig[0] > self._offset
+
+    def mark_synced(self) -> None:
+        self._sig = _stat_sig(self.path)
+        self._offset = self._sig[0] if self._sig else 0
+
+    def rewrite(self, live: list[BaseModel], header: dict) -> None:
+        """Ghi lại file chỉ gồm snapshot header + record còn sống, swap atomically."""
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            f.write(jsonio.dumps({_SNAPSHOT_KEY: header}).decode("utf-8") + "\n")
+            for obj in live:
+                f.write(_dump_line(obj))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.records = {}
+        self.by_container = {}
+        for obj in live:
+            self._put(getattr(obj, self.id_field), obj)
+        self.rows_total = len(live)
+        self.version += 1
+        self.mark_synced()
+
+    def ids_in(self, container_id: str) -> set[str]:
+        return self.by_container.get(container_id, set())
+
+
+def _iter_lines(path: Path, start: int = 0, end: int | None = None) -> Iterator[tuple[int, bytes]]:
+    """(offset, dòng kèm newline) của các dòng trọn vẹn trong [start, end), đọc
+    theo khối _SCAN_CHUNK. Dòng cuối chưa có newline (đang ghi dở) bị bỏ qua."""
+    with path.open("rb") as f:
+        f.seek(start)
+        offset, rest = start, b""
+        while end is None or offset + len(rest) < end:
+            block = f.read(_SCAN_CHUNK if end is None else min(_SCAN_CHUNK, end - offset - len(rest)))
+            if not block:
+                break
+            lines = (rest + block).split(b"\n")
+            rest = lines.pop()
+            for line in lines:
+                yield offset, line + b"\n"
+                offset += len(line) + 1
+
+
+def _parse_row(line: bytes) -> dict | None:
+    try:
+        row = jsonio.loads(line)
+    except ValueError:
+        return None
+    return row if isinstance(row, dict) else None
+
+
+class _History:
+    """Mọi revision của 1 entity file (nodes / edges) + offset index của chúng.
+
+    Revision nằm ở 2 file:
+      - log chính — các dòng từ lần compact gần nhất, gồm cả dòng _deleted;
+      - {name}.history.jsonl — archive chỉ append: compact chuyển nguyên văn
+        bản cũ, bản của id đã xoá và dòng _deleted sang đây thay vì bỏ.
+    entries build 1 lần ở lần đọc lịch sử đầu tiên; mỗi sync() sau đó chỉ parse
+    byte mới append của 2 file (log chính bị compact → chỉ đọc lại log chính).
+    Đọc 1 revision = seek thẳng tới (file, offset, length).
+    """
+
+    def __init__(self, index: _EntityIndex, ts_field: str):
+        self.index    = index
+        self.ts_field = ts_field
+        self.path     = index.path.with_name(index.path.stem + _HISTORY_SUFFIX)
+        # id → [(mốc, seq, archive?, offset, length)] sort theo (mốc, seq); length 0 = dòng _deleted
+        self.entries:   dict[str, list[tuple[str, int, bool, int, int]]] = {}
+        self.container: dict[str, str] = {}      # id → container_id
+        self._seq = 0
+        self._archive_offset = 0
+        self._live_offset = 0
+        self._live_ino: int | None = None
+
+    def sync(self) -> None:
+        """Đuổi kịp 2 file — gọi sau index.refresh(), trong lock ghi (compact ở
+        process khác không thay log chính giữa sync và lúc seek đọc)."""
+        sig = self.index._sig
+        ino = sig[2] if sig else None
+        if ino != self._live_ino or self.index._offset < self._live_offset:
+            for entries in self.entries.values():
+                entries[:] = [e for e in entries if e[2]]
+            self._live_ino, self._live_offset = ino, 0
+        self._archive_offset = self._scan(True, self._archive_offset, None)
+        self._live_offset = self._scan(False, self._live_offset, self.index._offset)
+
+    def _scan(self, archive: bool, start: int, end: int | None) -> int:
+        """Đưa các dòng trọn vẹn từ `start` vào entries; trả offset đã quét tới."""
+        stop = start
+        try:
+            for offset, line in _iter_lines(self.path if archive else self.index.path, start, end):
+                stop = offset + len(line)
+                row = _parse_row(line)
+                if row is None:
+                    continue
+                if _DELETED_KEY in row:
+                    self._add(row[_DELETED_KEY], row.get("at"), archive, offset, 0)
+                elif self.index.id_field in row:
+                    rid = row[self.index.id_field]
+                    self._add(rid, row.get(self.ts_field), archive, offset, len(line))
+                    self.container[rid] = row.get("container_id", "")
+        except FileNotFoundError:
+            return start
+        metrics.record_read(stop - start)
+        return stop
+
+    def _add(self, rid: str, at, archive: bool, offset: int, length: int) -> None:
+        if isinstance(at, str):
+            self._seq += 1
+            insort(self.entries.setdefault(rid, []), (at, self._seq, archive, offset, length))
+
+    def _load(self, locs: list[tuple[bool, int, int]]) -> dict[tuple[bool, int, int], BaseModel]:
+        """Validate các dòng tại (archive?, offset, length) — mỗi file mở 1 lần, seek theo offset tăng dần."""
+        out = {}
+        for archive in (True, False):
+            wanted = sorted(loc for loc in locs if loc[0] is archive)
+            if not wanted:
+                continue
+            with (self.path if archive else self.index.path).open("rb") as f:
+                for loc in wanted:
+                    f.seek(loc[1])
+                    out[loc] = self.index.adapter.validate_json(f.read(loc[2]))
+            metrics.record_read(sum(loc[2] for loc in wanted), len(wanted))
+        return out
+
+    def read(self, rid: str) -> list[tuple[str, BaseModel | None]]:
+        """(mốc, record | None = xoá) của rid, cũ → mới."""
+        entries = self.entries.get(rid, [])
+        records = self._load([e[2:] for e in entries if e[4]])
+        return [(e[0], records[e[2:]] if e[4] else None) for e in entries]
+
+    def at(self, container_id: str, at: str) -> list:
+        """Bản mới nhất có mốc ≤ at của mọi id thuộc container (đã xoá lúc đó → bỏ)."""
+        locs = []
+        for rid, cid in self.container.items():
+            if cid != container_id:
+                continue
+            entries = self.entries[rid]
+            i = bisect_right(entries, at, key=itemgetter(0))
+            if i and entries[i - 1][4]:
+                locs.append(entries[i - 1][2:])
+        return list(self._load(locs).values())
+
+    def archive(self, deleted: set[str]) -> int:
+        """Trước khi compact ghi lại log chính: chép nguyên văn sang archive mọi
+        dòng sẽ bị bỏ (bản cũ, bản của id đã xoá, dòng _deleted). Id bị xoá mà
+        không có dòng _deleted (xoá trước khi có lịch sử) → mốc xoá = lúc compact."""
+        if not self.index.path.exists():
+            return 0
+        # Lượt 1: dòng mới nhất của mỗi id + các id đã có dòng _deleted
+        last: dict[str, int] = {}
+        marked: set[str] = set()
+        rows = 0
+        for offset, line in _iter_lines(self.index.path, 0, self.index._offset):
+            row = _parse_row(line)
+            if row is None:
+                continue
+            rows += 1
+            if _DELETED_KEY in row:
+                marked.add(row[_DELETED_KEY])
+            elif self.index.id_field in row:
+                last[row[self.index.id_field]] = offset
+        if rows == sum(1 for rid in last if rid not in deleted):
+            return 0                            # chỉ còn bản mới nhất của id sống — không có gì để chép
+        # Lượt 2: chép nguyên văn mọi dòng không ở lại log chính (không parse lại;
+        # dòng hỏng có chép sang thì lúc quét lịch sử cũng bị bỏ qua như ở log chính)
+        keep = {offset for rid, offset in last.items() if rid not in deleted}
+        header = b'{"' + _SNAPSHOT_KEY.encode() + b'"'
+        moved = 0
+        with self.path.open("ab") as out:
+            for offset, line in _iter_lines(self.index.path, 0, self.index._offset):
+                if offset not in keep and line.strip() and not line.startswith(header):
+                    out.write(line)
+                    moved += 1
+            now = datetime.utcnow().isoformat()
+            for rid in last:
+                if rid in deleted and rid not in marked:
+                    out.write(jsonio.dumps({_DELETED_KEY: rid, "at": now}) + b"\n")
+                    moved += 1
+            out.flush()
+            os.fsync(out.fileno())
+        return moved
+
+
+def _parse_tombstones(data: bytes) -> tuple[set[str], set[str]]:
+    """deleted_ids.json → (ids, compacted). Bản cũ là list id trơn."""
+    raw = jsonio.loads(data)
+    if isinstance(raw, list):
+        return set(raw), set()
+    return set(raw["ids"]), set(raw["compacted"])
+
+
+class _Tombstones:
+    """Id đã xoá. `compacted` = id mà lần compact gần nhất đã bỏ hết dòng — vẫn
+    giữ tới lần compact sau (xem FileStorage.compact)."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.ids: set[str] = set()
+        self.compacted: set[str] = set()
+        self.version = 0
+        self._sig: tuple[int, int, int] | None = None
+        self._loaded = False
+
+    def refresh(self) -> None:
+        sig = _stat_sig(self.path)
+        if self._loaded and sig == self._sig:
+            return
+        self._sig = sig
+        self.ids, self.compacted = set(), set()
+        if sig:
+            data = self.path.read_bytes()
+            metrics.record_read(len(data))
+            self.ids, self.compacted = _parse_tombstones(data)
+        self.version += 1
+        self._loaded = True
+
+    def save(self) -> None:
+        """Ghi tmp + rename: process khác không bao giờ đọc phải file ghi dở."""
+        data = {"ids": list(self.ids), "compacted": list(self.compacted & self.ids)}
+        atomic_write_bytes(self.path, jsonio.dumps(data))
+        self._sig = _stat_sig(self.path)
+
+
+_FEED_FILE        = "feed.jsonl"
+_FEED_HEADER_KEY  = "_feed"
+_FEED_MAX_ENTRIES = 5000       # số thay đổi gần nhất (mọi container) còn trả delta được
+
+
+class _Batch:
+    """Buffer của FileStorage.batch(): dòng chờ append theo file + cờ tombstone."""
+
+    def __init__(self):
+        self.lines: dict[_EntityIndex, list[str]] = {}
+        self.tombstones_dirty = False
+
+    def write(self, index: _EntityIndex) -> None:
+        """Ghi ngay các dòng đang chờ của 1 file: 1 lần open / write / fsync."""
+        lines = self.lines.pop(index, None)
+        if not lines:
+            return
+        index.path.parent.mkdir(parents=True, exist_ok=True)
+        with index.path.open("a", encoding="utf-8") as f:
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        index.mark_synced()
+
+    def flush(self, deleted: _Tombstones, feed: _ChangeFeed) -> None:
+        for index in list(self.lines):
+            self.write(index)
+        if self.tombstones_dirty:
+            deleted.save()
+        feed.flush()                # sau dữ liệu — xem _ChangeFeed
+
+
+class _ChangeFeed:
+    """Revision + log thay đổi gần đây (nodes/edges) của từng container, lưu ở
+    {data_dir}/feed.jsonl → mọi worker cùng data_dir cấp / nhận chung revision,
+    ETag và `since` do worker này trả thì worker khác trả được delta.
+
+    Chỉ ghi trong writing() (flock) và SAU khi dữ liệu đã xuống đĩa: reader ở
+    process khác thấy revision mới thì chắc chắn đọc được record của nó.
+    Dòng đầu là header {"_feed": {start, clock, revs, floor}}; file dài quá
+    2 × max_entries dòng → ghi lại (tmp + rename) chỉ còn max_entries dòng cuối,
+    revision / floor của phần bị cắt giữ trong header. `start` seed theo thời gian
+    (µs) lúc tạo file, +1 mỗi thay đổi → feed.jsonl bị xoá thì revision vẫn tăng,
+    revision cũ client còn giữ < start → coi là quá cũ (client tải lại cả graph).
+    """
+
+    def __init__(self, path: Path, max_entries: int = _FEED_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.start = self.clock = 0         # 0 = chưa có file (chưa ghi lần nào)
+        self.revs:  dict[str, int] = {}
+        self.floor: dict[str, int] = {}     # cid → revision cũ nhất còn trả delta được
+        self.log:   deque[tuple[int, str, str, str]] = deque()   # (rev, cid, kind, id) cũ → mới
+        self.pending: list[tuple[int, str, str, str]] = []       # đã record, chưa flush
+        self._sig: tuple[int, int, int] | None = None
+        self._offset = 0
+        self._loaded = False
+
+    def refresh(self) -> None:
+        """Đọc thay đổi do process khác ghi: file chỉ dài thêm → chỉ parse phần mới."""
+        if self.pending:
+            return              # đang giữ flock (batch) — file không thể đổi từ ngoài
+        sig = _stat_sig(self.path)
+        if self._loaded and sig == self._sig:
+            return
+        prev, self._sig = self._sig, sig
+        if self._loaded and sig and prev and sig[2] == prev[2] and sig[0] > self._offset:
+            with self.path.open("rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+        else:
+            self.start = self.clock = self._offset = 0
+            self.revs, self.floor, self.log = {}, {}, deque()
+            data = self.path.read_bytes() if sig else b""
+        end = data.rfind(b"\n") + 1       # dòng cuối đang ghi dở → lần sau
+        for line in data[:end].splitlines():
+            row = _parse_row(line)
+            if row is None:
+                continue
+            header = row.get(_FEED_HEADER_KEY)
+            if header is not None:
+                self.start, self.clock = header["start"], header["clock"]
+                self.revs, self.floor = header["revs"], header["floor"]
+            elif "rev" in row:
+                self._apply((row["rev"], row["c"], row["k"], row["id"]))
+        self._offset += end
+        metrics.record_read(end)
+        self._loaded = True
+
+    def _apply(self, entry: tuple[int, str, str, str]) -> None:
+        self.log.append(entry)
+        self.revs[entry[1]] = self.clock = entry[0]
+
+    def record(self, container_id: str, kind: str, rid: str) -> None:
+        """Caller giữ writing(); xuống đĩa ở flush() — sau khi dữ liệu đã ghi."""
+        self.refresh()
+        if not self.start:
+            self.start = self.clock = time.time_ns() // 1000
+        entry = (self.clock + 1, container_id, kind, rid)
+        self._apply(entry)
+        self.pending.append(entry)
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        lines, self.pending = self.pending, []
+        if self._sig is None or len(self.log) > 2 * self.max_entries:
+            self._rewrite()
+            return
+        torn = self._sig[0] > self._offset      # writer trước chết giữa dòng
+        text = ("\n" if torn else "") + "".join(
+            jsonio.dumps({"rev": rev, "c": cid, "k": kind, "id": rid}).decode("utf-8") + "\n"
+            for rev, cid, kind, rid in lines)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(text)
+        self._sig = _stat_sig(self.path)
+        self._offset = self._sig[0]
+
+    def _rewrite(self) -> None:
+        while len(self.log) > self.max_entries:
+            rev, cid, _, _ = self.log.popleft()
+            self.floor[cid] = rev
+        header = {"start": self.start, "clock": self.clock, "revs": self.revs, "floor": self.floor}
+        data = jsonio.dumps({_FEED_HEADER_KEY: header}) + b"\n" + b"".join(
+            jsonio.dumps({"rev": rev, "c": cid, "k": kind, "id": rid}) + b"\n"
+            for rev, cid, kind, rid in self.log)
+        atomic_write_bytes(self.path, data)
+        self._sig = _stat_sig(self.path)
+        self._offset = self._sig[0]
+
+    def revision(self, container_id: str) -> int:
+        return self.revs.get(container_id, self.start)
+
+    def since(self, container_id: str, rev: int) -> list[tuple[str, str]] | None:
+        """(kind, id) đổi sau `rev`, mỗi id 1 lần; None nếu log không còn đủ."""
+        if rev < self.floor.get(container_id, self.start) or rev > self.revision(container_id):
+            return None
+        changed: dict[tuple[str, str], None] = {}
+        for entry_rev, cid, kind, rid in reversed(self.log):
+            if entry_rev <= rev:
+                break
+            if cid == container_id:
+                changed[(kind, rid)] = None
+        return list(changed)
+
+
+# id_field của index → kind trong change feed (chỉ graph: nodes + edges)
+_FEED_KINDS = {"node_id": "nodes", "edge_id": "edges"}
+
+# id_field của index → (kind của SearchHit, (title, tags, body) của record)
+_SEARCH_DOCS = {"node_id": ("node", node_doc), "source_id": ("source", source_doc)}
+
+
+LAYOUT_FLAT        = "flat"
+LAYOUT_PARTITIONED = "partitioned"
+
+_PARTITIONS_DIR  = "containers"
+_DELETED_SUFFIX  = ".deleted"
+_ENTITY_KINDS    = ("sources", "nodes", "edges")
+_TOMBSTONES_FILE = "deleted_ids.json"
+_COMPACT_STATS   = "compact_stats.json"     # lần đo garbage / compact gần nhất (xem garbage_upper_bound)
+
+
+def _partition_ids(data_dir: Path) -> list[str]:
+    parts_dir = data_dir / _PARTITIONS_DIR
+    if not parts_dir.is_dir():
+        return []
+    return [p.name for p in parts_dir.iterdir() if p.is_dir() and not p.name.endswith(_DELETED_SUFFIX)]
+
+
+def _dropped_ids(data_dir: Path) -> list[str]:
+    """container_id của các partition đã drop (thư mục *.deleted)."""
+    parts_dir = data_dir / _PARTITIONS_DIR
+    if not parts_dir.is_dir():
+        return []
+    return [p.name[:-len(_DELETED_SUFFIX)] for p in parts_dir.iterdir()
+            if p.is_dir() and p.name.endswith(_DELETED_SUFFIX)]
+
+
+def _entity_paths(data_dir: Path, layout: str) -> dict[str, Path]:
+    """Tên (như _StoreState.entities) → entity file của data_dir."""
+    out = {"containers": data_dir / "containers.jsonl"}
+    if layout == LAYOUT_FLAT:
+        out.update({kind: data_dir / f"{kind}.jsonl" for kind in _ENTITY_KINDS})
+    else:
+        for cid in _partition_ids(data_dir):
+            out.update({f"{cid}/{kind}": data_dir / _PARTITIONS_DIR / cid / f"{kind}.jsonl"
+                        for kind in _ENTITY_KINDS})
+    return out
+
+
+class _Partition:
+    """sources/nodes/edges của một container: containers/{container_id}/*.jsonl"""
+
+    def __init__(self, part_dir: Path):
+        self.dir     = part_dir
+        self.sources = _EntityIndex(part_dir / "sources.jsonl", "source_id", _TA_SOURCE)
+        self.nodes   = _EntityIndex(part_dir / "nodes.jsonl",   "node_id",   _TA_NODE)
+        self.edges   = _EntityIndex(part_dir / "edges.jsonl",   "edge_id",   _TA_EDGE)
+
+
+class _StoreState:
+    """Toàn bộ index của một data_dir + lock bảo vệ chúng.
+
+    flat        — sources/nodes/edges.jsonl chung cho mọi container
+    partitioned — mỗi container một thư mục containers/{container_id}/,
+                  đọc 1 graph chỉ chạm bytes của graph đó.
+    """
+
+    def __init__(self, data_dir: Path, layout: str):
+        self.dir        = data_dir
+        self.layout     = layout
+        self.lock       = threading.RLock()
+        self.flock      = FileLock(data_dir / ".lock")      # giữa các process
+        self.feed       = _ChangeFeed(data_dir / _FEED_FILE)
+        self.containers = _EntityIndex(data_dir / "containers.jsonl", "container_id", _TA_CONTAINER)
+        self.deleted    = _Tombstones(data_dir / _TOMBSTONES_FILE)
+        if layout == LAYOUT_FLAT:
+            self.sources = _EntityIndex(data_dir / "sources.jsonl", "source_id", _TA_SOURCE)
+            self.nodes   = _EntityIndex(data_dir / "nodes.jsonl",   "node_id",   _TA_NODE)
+            self.edges   = _EntityIndex(data_dir / "edges.jsonl",   "edge_id",   _TA_EDGE)
+        self.parts: dict[str, _Partition] = {}
+        self.dropped: dict[str, _Partition] = {}   # partition đã drop — chỉ đọc lịch sử
+        self.route: dict[str, str] = {}     # entity id → container_id (partitioned)
+        self.batch: _Batch | None = None    # != None khi đang trong FileStorage.batch()
+        # container_id → (edges version, tombstones version, Adjacency)
+        self.adjacency: dict[str, tuple[int, int, Adjacency]] = {}
+        # container_id → ((edges, nodes, tombstones version), {(node_id, hops, limit, def_chars): [Neighbor]})
+        self.neighborhoods: dict[str, tuple[tuple[int, int, int], dict]] = {}
+        # container_id → ((nodes, sources version), SearchIndex) — tombstone lọc lúc query
+        self.search: dict[str, tuple[tuple[int, int], SearchIndex]] = {}
+        self.refs = 0                        # số FileStorage đang mở dùng state này (_STATES)
+
+    @contextmanager
+    def writing(self):
+        """Lock cho thao tác ghi: threading lock + flock (reentrant). Caller refresh
+        index / tombstones trong block rồi mới sửa → không mất ghi của process khác."""
+        with self.lock, self.flock:
+            yield
+
+    @property
+    def parts_dir(self) -> Path:
+        return self.dir / _PARTITIONS_DIR
+
+    def partition(self, container_id: str) -> _Partition:
+        part = self.parts.get(container_id)
+        if part is None:
+            part = self.parts[container_id] = _Partition(self.parts_dir / container_id)
+        return part
+
+    def index(self, kind: str, container_id: str) -> _EntityIndex:
+        if self.layout == LAYOUT_FLAT:
+            return getattr(self, kind)
+        return getattr(self.partition(container_id), kind)
+
+    def candidates(self, kind: str, rid: str) -> list[_EntityIndex]:
+        """Các index có thể chứa rid — partition đã biết (route) trước, còn lại sau."""
+        if self.layout == LAYOUT_FLAT:
+            return [getattr(self, kind)]
+        known = self.route.get(rid)
+        order = ([known] if known else []) + [cid for cid in _partition_ids(self.dir) if cid != known]
+        return [getattr(self.partition(cid), kind) for cid in order]
+
+    def drop_partition(self, container_id: str) -> None:
+        """Tombstone cả thư mục partition bằng 1 lần rename. Dòng batch() đang chờ
+        của partition (vd. mốc _deleted) ghi xuống trước — flush sau không tạo lại thư mục."""
+        part = self.parts.pop(container_id, None)
+        if part is not None and self.batch is not None:
+            for index in (part.sources, part.nodes, part.edges):
+                self.batch.write(index)
+        self.dropped.pop(container_id, None)
+        part_dir = self.parts_dir / container_id
+        if part_dir.is_dir():
+            os.replace(part_dir, part_dir.with_name(container_id + _DELETED_SUFFIX))
+
+    def dropped_partition(self, container_id: str) -> _Partition | None:
+        """Partition đã drop của container (None nếu không có) — cho node_history / graph?at=."""
+        part = self.dropped.get(container_id)
+        if part is None:
+            part_dir = self.parts_dir / (container_id + _DELETED_SUFFIX)
+            if not part_dir.is_dir():
+                return None
+            part = self.dropped[container_id] = _Partition(part_dir)
+        return part
+
+    def purge_dropped_partitions(self) -> int:
+        """Bỏ log của partition đã drop. Dòng nodes / edges chuyển sang archive lịch sử
+        như compact ở flat → node_history / graph?at= của container đã xoá vẫn đọc được."""
+        purged = 0
+        for cid in _dropped_ids(self.dir):
+            part = self.dropped_partition(cid)
+            logs = [index for index in (part.sources, part.nodes, part.edges) if index.path.exists()]
+            for index in logs:
+                if index.history is not None:
+                    index.refresh()
+                    index.history.archive(set(index.records))
+                index.path.unlink()
+            purged += bool(logs)
+        return purged
+
+    @property
+    def entities(self) -> dict[str, _EntityIndex]:
+        out = {"containers": self.containers}
+        if self.layout == LAYOUT_FLAT:
+            out.update({kind: getattr(self, kind) for kind in _ENTITY_KINDS})
+        else:
+            for cid in _partition_ids(self.dir):
+                part = self.partition(cid)
+                out.update({f"{cid}/{kind}": getattr(part, kind) for kind in _ENTITY_KINDS})
+        return out
+
+
+def detect_layout(data_dir: Path) -> str:
+    """containers/ tồn tại → partitioned; có file flat → flat; dir mới → RKS_STORAGE_LAYOUT."""
+    if (data_dir / _PARTITIONS_DIR).is_dir():
+        return LAYOUT_PARTITIONED
+    if any((data_dir / f"{kind}.jsonl").exists() for kind in _ENTITY_KINDS):
+        return LAYOUT_FLAT
+    return os.environ.get("RKS_STORAGE_LAYOUT", LAYOUT_FLAT).strip() or LAYOUT_FLAT
+
+
+# Chỉ giữ state còn FileStorage mở (refs > 0): FileStorage cuối cùng của 1
+# data_dir close() (vd. session bị evict khỏi LRU pool) → bỏ cả index khỏi RAM.
+_STATES: dict[Path, _StoreState] = {}
+_STATES_LOCK = threading.Lock()
+
+
+def _acquire_state(data_dir: Path, layout: str | None) -> _StoreState:
+    key = data_dir.resolve()
+    with _STATES_LOCK:
+        state = _STATES.get(key)
+        if state is None or (layout and state.layout != layout):
+            state = _STATES[key] = _StoreState(key, layout or detect_layout(key))
+        state.refs += 1
+        return state
+
+
+def _release_state(state: _StoreState) -> None:
+    with _STATES_LOCK:
+        state.refs -= 1
+        if state.refs > 0:
+            return
+        if _STATES.get(state.dir) is state:
+            del _STATES[state.dir]
+    # Request đang chạy dở trên storage vừa close vẫn dùng được state (tự đứng riêng,
+    # FileLock mở lại fd khi cần); FileStorage mới của dir này load state mới từ đĩa
+    # — 2 state cùng dir trong 1 process đồng bộ qua flock + stat như 2 process.
+    with state.lock:
+        state.flock.close()
+
 
 class FileStorage(AbstractStorage):
-    """JSONL-based file storage.  One file per entity type.
+    """JSONL-based file storage.  One file per entity type (per container
+    when layout="partitioned").
     Strategy: append-only; latest record by ID wins on read.
     Deletions tracked via a tombstone set stored in a sidecar file.
+    Reads are served from a per-data_dir materialized index (see _StoreState).
     """
 
-    def __init__(self, data_dir: Path):
+    def __init__(self, data_dir: Path, layout: str | None = None):
+        super().__init__()
         data_dir.mkdir(parents=True, exist_ok=True)
         self._dir = data_dir
 
-        self._containers_path  = data_dir / "containers.jsonl"
-        self._sources_path     = data_dir / "sources.jsonl"
-        self._nodes_path       = data_dir / "nodes.jsonl"
-        self._edges_path       = data_dir / "edges.jsonl"
-        self._deleted_path     = data_dir / "deleted_ids.json"
+        self._state = _acquire_state(data_dir, layout)
+        self._closed = False
 
-        self._ta_container = TypeAdapter(KnowledgeContainer)
-        self._ta_source    = TypeAdapter(Source)
-        self._ta_node      = TypeAdapter(GraphNode)
-        self._ta_edge      = TypeAdapter(GraphEdge)
+    def close(self) -> None:
+        """Nhả state dùng chung; FileStorage cuối cùng của data_dir → index bị bỏ."""
+        if not self._closed:
+            self._closed = True
+            _release_state(self._state)
+            super().close()
 
-        self._deleted: set[str] = self._load_deleted()
+    @property
+    def layout(self) -> str:
+        return self._state.layout
 
     # ── internal helpers ──────────────────────────────────────────────────
 
-    def _load_deleted(self) -> set[str]:
-        if self._deleted_path.exists():
-            return set(json.loads(self._deleted_path.read_text(encoding="utf-8")))
-        return set()
+    @property
+    def _deleted(self) -> set[str]:
+        return self._state.deleted.ids
 
     def _save_deleted(self) -> None:
-        self._deleted_path.write_text(
-            json.dumps(list(self._deleted), ensure_ascii=False),
-            encoding="utf-8",
-        )
+        self._state.deleted.version += 1
+        if self._state.batch is not None:
+            self._state.batch.tombstones_dirty = True
+        else:
+            self._state.deleted.save()
 
-    def _read_jsonl(self, path: Path) -> list[dict]:
-        if not path.exists():
-            return []
-        rows = []
-        for line in path.read_text(encoding="utf-8").splitlines():
-            line = line.strip()
-            if line:
-                rows.append(json.loads(line))
-        return rows
+    def _fresh(self, index: _EntityIndex) -> _EntityIndex:
+        """Revalidate index + tombstones nếu file đã đổi bên ngoài process."""
+        index.refresh()
+        self._state.deleted.refresh()
+        return index
 
-    def _append(self, path: Path, obj: dict) -> None:
-        with path.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(obj, ensure_ascii=False, default=str) + "\n")
+    def _fresh_deleted(self) -> set[str]:
+        self._state.deleted.refresh()
+        return self._deleted
 
-    def _latest_by_id(self, rows: list[dict], id_field: str) -> dict[str, dict]:
-        """Return the most recent record per ID (last write wins)."""
-        out: dict[str, dict] = {}
-        for r in rows:
-            out[r[id_field]] = r
-        return out
+    def _write(self, index: _EntityIndex, text: str) -> None:
+        """Append vào file của index (hoặc buffer của batch). Caller giữ writing() và đã refresh index."""
+        if self._state.batch is not None:
+            pending = self._state.batch.lines.get(index)
+            if pending is None:
+                pending = self._state.batch.lines[index] = ["\n"] if index.torn else []
+            pending.append(text)
+        else:
+            index.path.parent.mkdir(parents=True, exist_ok=True)
+            with index.path.open("a", encoding="utf-8") as f:
+                f.write(("\n" if index.torn else "") + text)
+
+    def _append(self, index: _EntityIndex, obj: BaseModel) -> None:
+        with self._state.writing():
+            index.refresh()
+            self._write(index, _dump_line(obj))
+            before = index.version
+            index.apply(obj.model_copy())
+            if index.id_field in _SEARCH_DOCS:
+                self._search_apply(index, before, obj)
+            if self.layout == LAYOUT_PARTITIONED and index is not self._state.containers:
+                self._state.route[getattr(obj, index.id_field)] = obj.container_id
+            kind = _FEED_KINDS.get(index.id_field)
+            if kind:
+                self._state.feed.record(obj.container_id, kind, getattr(obj, index.id_field))
+                self._flush_feed()
 
-    def _live(self, records: dict[str, dict]) -> list[dict]:
-        """Filter out deleted IDs."""
-        return [v for k, v in records.items() if k not in self._deleted]
+    def _flush_feed(self) -> None:
+        """Ghi thay đổi vừa record vào feed.jsonl — sau dữ liệu; trong batch() thì lúc flush."""
+        if self._state.batch is None:
+            self._state.feed.flush()
+
+    def _record_deleted(self, kind: str, container_id: str, ids: Iterable[str]) -> None:
+        """Dòng _deleted (mốc xoá) vào log của nodes / edges — tombstone không có
+        thời điểm, lịch sử + graph?at= cần biết record mất từ lúc nào."""
+        now = datetime.utcnow().isoformat()
+        text = "".join(jsonio.dumps({_DELETED_KEY: rid, "at": now}).decode("utf-8") + "\n" for rid in ids)
+        if not text:
+            return
+        with self._state.writing():
+            index = self._state.index(kind, container_id)
+            index.refresh()
+            self._write(index, text)
+            if self._state.batch is None:
+                index.mark_synced()
+
+    def _get(self, kind: str, rid: str):
+        with self._state.lock:
+            if rid in self._fresh_deleted():
+                return None
+            for index in self._state.candidates(kind, rid):
+                index.refresh()
+                r = index.records.get(rid)
+                if r is not None:
+                    if self.layout == LAYOUT_PARTITIONED:
+                        self._state.route[rid] = r.container_id
+                    return r.model_copy()
+        return None
+
+    def _list(self, kind: str, container_id: str) -> list:
+        with self._state.lock:
+            index = self._fresh(self._state.index(kind, container_id))
+            return [
+                index.records[rid].model_copy()
+                for rid in index.ids_in(container_id)
+                if rid not in self._deleted
+            ]
+
+    def iter_records(self, kind: str, container_id: str, chunk: int = 1000) -> Iterator[list]:
+        """Chụp danh sách id 1 lần, mỗi khối lấy record hiện tại trong lock (record
+        bị xoá giữa chừng thì bỏ qua). Không model_copy — record dùng chung với
+        index, caller chỉ được đọc (serialize)."""
+        with self._state.lock:
+            index = self._fresh(self._state.index(kind, container_id))
+            ids = [rid for rid in index.ids_in(container_id) if rid not in self._deleted]
+        for start in range(0, len(ids), chunk):
+            with self._state.lock:
+                index = self._fresh(self._state.index(kind, container_id))
+                deleted = self._deleted
+                records = [index.records[rid] for rid in ids[start:start + chunk]
+                           if rid in index.records and rid not in deleted]
+            yield records
+
+    @contextmanager
+    def batch(self):
+        """Gom append + tombstone; flush 1 lần / file khi thoát block.
+        Index in-memory được cập nhật ngay nên read trong batch thấy dữ liệu mới.
+        Giữ lock suốt batch → các writer khác chờ, không xen dòng vào giữa."""
+        with self._state.writing():
+            if self._state.batch is not None:      # batch lồng nhau → gộp vào batch ngoài
+                yield self
+                return
+            self._state.batch = _Batch()
+            try:
+                yield self
+            finally:
+                pending, self._state.batch = self._state.batch, None
+                pending.flush(self._state.deleted, self._state.feed)
+
+    # ── COMPACTION ────────────────────────────────────────────────────────
+    # Log append-only phình theo lịch sử edit → định kỳ ghi lại mỗi file
+    # chỉ còn bản mới nhất của record sống, bỏ hẳn id đã tombstone.
+    # nodes / edges: dòng bị bỏ chuyển sang *.history.jsonl (xem _History).
+
+    def garbage_ratio(self) -> tuple[float, int]:
+        """Trả về (tỉ lệ dòng rác, tổng số dòng) trên toàn bộ entity files."""
+        with self._state.lock:
+            total = live = 0
+            for index in self._state.entities.values():
+                self._fresh(index)
+                total += index.rows_total
+                live  += sum(1 for rid in index.records if rid not in self._deleted)
+        return (1 - live / total if total else 0.0), total
+
+    def compact(self) -> dict:
+        """Rewrite mọi entity file về snapshot của record sống. Trả về thống kê."""
+        with self._state.writing():
+            stats: dict = {"rows_before": 0, "rows_after": 0, "tombstones_dropped": 0, "rows_archived": 0}
+            now = datetime.utcnow().isoformat()
+            for name, index in self._state.entities.items():
+                self._fresh(index)
+                if index.history is not None:
+                    stats["rows_archived"] += index.history.archive(self._deleted)
+                live = [obj for rid, obj in index.records.items() if rid not in self._deleted]
+                stats["rows_before"] += index.rows_total
+                stats["rows_after"]  += len(live)
+                index.rewrite(live, {"entity": name, "created_at": now, "rows": len(live)})
+            stats["partitions_purged"] = self._state.purge_dropped_partitions()
+            # Không xoá tombstone ngay khi dòng của nó vừa bị bỏ: request đang dở ở
+            # worker khác (đọc record trước lúc xoá) vẫn có thể append lại id đó sau
+            # compact. Id giữ thêm 1 lần compact — dòng append muộn bị lần đó bỏ —
+            # rồi mới rời sidecar.
+            tombstones = self._state.deleted
+            expired = tombstones.compacted & self._deleted
+            stats["tombstones_dropped"] = len(expired)
+            self._deleted.difference_update(expired)
+            tombstones.compacted = set(self._deleted)
+            self._save_deleted()
+            self._save_compact_stats(0.0, stats["rows_after"])
+        return stats
+
+    def maybe_compact(self, garbage_ratio: float, min_rows: int = 0) -> dict | None:
+        # Đo + compact trong 1 lần giữ lock: worker khác vừa compact xong thì ratio đã thấp
+        with self._state.writing():
+            ratio, total = self.garbage_ratio()
+            if total < min_rows or ratio < garbage_ratio:
+                self._save_compact_stats(ratio, total)
+                return None
+            return self.compact()
+
+    def _save_compact_stats(self, ratio: float, rows: int) -> None:
+        """Kết quả đo vừa xong + số byte đã tính của mỗi file → garbage_upper_bound
+        lần sau chỉ cần stat file. Caller giữ writing() và vừa refresh mọi index."""
+        stats = {"ratio": ratio, "rows": rows, "tombstones": len(self._deleted),
+                 "files": {name: index._offset for name, index in self._state.entities.items()}}
+        atomic_write_bytes(self._dir / _COMPACT_STATS, jsonio.dumps(stats))
 
     # ── CONTAINERS ────────────────────────────────────────────────────────
 
     def list_containers(self) -> list[KnowledgeContainer]:
-        rows = self._latest_by_id(self._read_jsonl(self._containers_path), "container_id")
-        live = self._live(rows)
-        result = [self._ta_container.validate_python(r) for r in live]
+        with self._state.lock:
+            idx = self._fresh(self._state.containers)
+            result = [c.model_copy() for cid, c in idx.records.items() if cid not in self._deleted]
         return sorted(result, key=lambda c: c.created_at)
 
     def upsert_container(self, c: KnowledgeContainer) -> None:
-        self._append(self._containers_path, c.model_dump(mode="json"))
+        self._append(self._state.containers, c)
 
     def get_container(self, container_id: str) -> KnowledgeContainer | None:
-        rows = self._latest_by_id(self._read_jsonl(self._containers_path), "container_id")
-        r = rows.get(container_id)
-        if r and container_id not in self._deleted:
-            return self._ta_container.validate_python(r)
+        with self._state.lock:
+            idx = self._fresh(self._state.containers)
+            r = idx.records.get(container_id)
+            if r is not None and container_id not in self._deleted:
+                return r.model_copy()
         return None
 
     def delete_container(self, container_id: str) -> None:
-        self._deleted.add(container_id)
-        # Also tombstone all children
-        for s in self.list_sources(container_id):
-            self._deleted.add(s.source_id)
-        for n in self.list_nodes(container_id):
-            self._deleted.add(n.node_id)
-        for e in self.list_edges(container_id):
-            self._deleted.add(e.edge_id)
-        self._save_deleted()
+        with self._state.writing():
+            self._state.deleted.refresh()
+            self._deleted.add(container_id)
+            # Mốc xoá (lịch sử) + change feed cho mọi node / edge — cả 2 layout
+            nodes = [n.node_id for n in self.list_nodes(container_id)]
+            edges = [e.edge_id for e in self.list_edges(container_id)]
+            self._record_deleted("nodes", container_id, nodes)
+            self._record_deleted("edges", container_id, edges)
+            feed = self._state.feed
+            for nid in nodes:
+                feed.record(container_id, "nodes", nid)
+            for edge_id in edges:
+                feed.record(container_id, "edges", edge_id)
+            if self.layout == LAYOUT_PARTITIONED:
+                # 1 directory tombstone thay vì tombstone từng child
+                self._state.drop_partition(container_id)
+            else:
+                # Also tombstone all children
+                for s in self.list_sources(container_id):
+                    self._deleted.add(s.source_id)
+                self._deleted.update(nodes, edges)
+            self._save_deleted()
+            self._flush_feed()
 
     # ── SOURCES ───────────────────────────────────────────────────────────
 
     def list_sources(self, container_id: str) -> list[Source]:
-        rows = self._latest_by_id(self._read_jsonl(self._sources_path), "source_id")
-        live = [self._ta_source.validate_python(v) for v in self._live(rows)]
-        return sorted([s for s in live if s.container_id == container_id], key=lambda s: s.created_at)
+        return sorted(self._list("sources", container_id), key=lambda s: s.created_at)
+
+    def get_source(self, source_id: str) -> Source | None:
+        return self._get("sources", source_id)
 
     def upsert_source(self, s: Source) -> None:
-        self._append(self._sources_path, s.model_dump(mode="json"))
+        self._append(self._state.index("sources", s.container_id), s)
 
     def delete_source(self, source_id: str) -> None:
-        self._deleted.add(source_id)
-        self._save_deleted()
+        with self._state.writing():
+            self._state.deleted.refresh()
+            self._deleted.add(source_id)
+            self._save_deleted()
 
     # ── NODES ─────────────────────────────────────────────────────────────
 
     def list_nodes(self, container_id: str) -> list[GraphNode]:
-        rows = self._latest_by_id(self._read_jsonl(self._nodes_path), "node_id")
-        live = [self._ta_node.validate_python(v) for v in self._live(rows)]
-        return sorted([n for n in live if n.container_id == container_id], key=lambda n: n.created_at)
+        return sorted(self._list("nodes", container_id), key=lambda n: n.created_at)
 
     def get_node(self, node_id: str) -> GraphNode | None:
-        rows = self._latest_by_id(self._read_jsonl(self._nodes_path), "node_id")
-        r = rows.get(node_id)
-        if r and node_id not in self._deleted:
-            return self._ta_node.validate_python(r)
-        return None
+        return self._get("nodes", node_id)
 
     def upsert_node(self, node: GraphNode) -> None:
-        self._append(self._nodes_path, node.model_dump(mode="json"))
+        self._append(self._state.index("nodes", node.container_id), node)
 
     def delete_node(self, node_id: str) -> None:
         """Delete node + all its edges."""
-        # Collect edges BEFORE marking as deleted (get_node checks _deleted)
-        node = self.get_node(node_id)
-        if node:
-            edges = self.list_edges(node.container_id)
-            for e in edges:
-                if e.source_node_id == node_id or e.target_node_id == node_id:
-                    self._deleted.add(e.edge_id)
-        self._deleted.add(node_id)
-        self._save_deleted()
+        with self._state.writing():
+            # Collect edges BEFORE marking as deleted (get_node checks _deleted)
+            node = self.get_node(node_id)
+            feed = self._state.feed
+            if node:
+                edges = [e.edge_id for e in self.adjacency(node.container_id).incident(node_id)]
+                self._record_deleted("edges", node.container_id, edges)
+                self._record_deleted("nodes", node.container_id, [node_id])
+                for edge_id in edges:
+                    self._deleted.add(edge_id)
+                    feed.record(node.container_id, "edges", edge_id)
+                feed.record(node.container_id, "nodes", node_id)
+            self._deleted.add(node_id)
+            self._save_deleted()
+            self._flush_feed()
 
     def delete_node_cascade(self, node_id: str) -> list[str]:
         """Delete node and all purely-downstream nodes (only 1 incoming edge from this node).
         Returns list of all deleted node_ids."""
-        node = self.get_node(node_id)
-        if not node:
-            return []
+        with self._state.writing():
+            node = self.get_node(node_id)
+            if not node:
+                return []
+            adj = self.adjacency(node.container_id)
+            to_delete = adj.cascade(node_id)
+            # 1 lượt tombstone node + edge chạm vào chúng, ghi sidecar 1 lần
+            edges = list(dict.fromkeys(e.edge_id for nid in to_delete for e in adj.incident(nid)))
+            self._record_deleted("nodes", node.container_id, to_delete)
+            self._record_deleted("edges", node.container_id, edges)
+            feed = self._state.feed
+            for nid in to_delete:
+                self._deleted.add(nid)
+                feed.record(node.container_id, "nodes", nid)
+            for edge_id in edges:
+                self._deleted.add(edge_id)
+                feed.record(node.container_id, "edges", edge_id)
+            self._save_deleted()
+            self._flush_feed()
+        return to_delete
 
-        all_nodes = self.list_nodes(node.container_id)
-        all_edges = self.list_edges(node.container_id)
+    # ── EDGES ─────────────────────────────────────────────────────────────
 
-        # Build incoming edge count per node
-        incoming: dict[str, list[str]] = {n.node_id: [] for n in all_nodes}
-        for e in all_edges:
-            if e.target_node_id in incoming:
-                incoming[e.target_node_id].append(e.source_node_id)
+    def list_edges(self, container_id: str) -> list[GraphEdge]:
+        return self._list("edges", container_id)
 
-        # BFS from node_id following outgoing edges
-        to_delete: list[str] = []
-        queue = [node_id]
-        visited: set[str] = set()
+    def get_edge(self, edge_id: str) -> GraphEdge | None:
+        return self._get("edges", edge_id)
 
-        while queue:
-            current = queue.pop(0)
-            if current in visited:
-                continue
-            visited.add(current)
-            to_delete.append(current)
+    def upsert_edge(self, edge: GraphEdge) -> None:
+        self._append(self._state.index("edges", edge.container_id), edge)
 
-            # Find children via outgoing edges
-            children = [e.target_node_id for e in all_edges if e.source_node_id == current]
-            for child in children:
-                # Only cascade-delete if this node is the ONLY parent
-                parents = incoming.get(child, [])
-                if len(parents) == 1 and parents[0] == current:
-                    queue.append(child)
+    def adjacency(self, container_id: str) -> Adjacency:
+        """Adjacency của container, cache tới khi edges hoặc tombstones đổi.
+        Edge trong Adjacency là object của index — chỉ đọc, không sửa."""
+        with self._state.lock:
+            index = self._fresh(self._state.index("edges", container_id))
+            cached = self._state.adjacency.get(container_id)
+            if cached and cached[0] == index.version and cached[1] == self._state.deleted.version:
+                return cached[2]
+            adj = Adjacency(
+                index.records[rid] for rid in index.ids_in(container_id) if rid not in self._deleted
+            )
+            self._state.adjacency[container_id] = (index.version, self._state.deleted.version, adj)
+            return adj
 
-        for nid in to_delete:
-            self.delete_node(nid)
+    def delete_edge(self, edge_id: str) -> None:
+        with self._state.writing():
+            edge = self._get("edges", edge_id)
+            if edge:
+                self._record_deleted("edges", edge.container_id, [edge_id])
+                self._state.feed.record(edge.container_id, "edges", edge_id)
+            self._deleted.add(edge_id)
+            self._save_deleted()
+            self._flush_feed()
 
-        return to_delete
+    def _node_record(self, node_id: str) -> GraphNode | None:
+        """Node trong index (không copy) — chỉ đọc. Caller giữ lock."""
+        if node_id in self._fresh_deleted():
+            return None
+        for index in self._state.candidates("nodes", node_id):
+            index.refresh()
+            r = index.records.get(node_id)
+            if r is not None:
+                if self.layout == LAYOUT_PARTITIONED:
+                    self._state.route[node_id] = r.container_id
+                return r
+        return None
 
-    # ── EDGES ─────────────────────────────────────────────────────────────
+    def get_neighborhood(self, node_id: str, hops: int = 1, limit: int = 8,
+                         def_chars: int = 120) -> list[Neighbor]:
+        """Như AbstractStorage.get_neighborhood, cache theo node; cả cache của
+        container bị bỏ khi edges / nodes / tombstones của nó đổi version."""
+        with self._state.lock:
+            node = self._node_record(node_id)
+            if node is None:
+                return []
+            cid   = node.container_id
+            adj   = self.adjacency(cid)
+            nodes = self._fresh(self._state.index("nodes", cid))
+            versions = (self._state.index("edges", cid).version, nodes.version, self._state.deleted.version)
+            cached = self._state.neighborhoods.get(cid)
+            if cached is None or cached[0] != versions:
+                cached = self._state.neighborhoods[cid] = (versions, {})
+            key = (node_id, hops, limit, def_chars)
+            result = cached[1].get(key)
+            if result is None:
+                deleted = self._deleted
+                lookup  = lambda nid: None if nid in deleted else nodes.records.get(nid)
+                result = cached[1][key] = neighborhood(adj.incident, lookup, node_id, hops, limit, def_chars)
+            return list(result)
 
-    def list_edges(self, container_id: str) -> list[GraphEdge]:
-        rows = self._latest_by_id(self._read_jsonl(self._edges_path), "edge_id")
-        live = [self._ta_edge.validate_python(v) for v in self._live(rows)]
-        return [e for e in live if e.container_id == container_id]
+    def node_degree(self, node_id: str) -> int:
+        with self._state.lock:
+            node = self._node_record(node_id)
+            return self.adjacency(node.container_id).degree(node_id) if node else 0
 
-    def get_edge(self, edge_id: str) -> GraphEdge | None:
-        rows = self._latest_by_id(self._read_jsonl(self._edges_path), "edge_id")
-        r = rows.get(edge_id)
-        if r and edge_id not in self._deleted:
-            return self._ta_edge.validate_python(r)
+    # ── SEARCH ────────────────────────────────────────────────────────────
+
+    def _search_versions(self, container_id: str) -> tuple[int, int]:
+        return (self._state.index("nodes", container_id).version,
+                self._state.index("sources", container_id).version)
+
+    def _search_apply(self, index: _EntityIndex, before: int, obj: BaseModel) -> None:
+        """Sau _append: index lại đúng record vừa ghi nếu SearchIndex của container
+        đang khớp version ngay trước lần ghi; lệch (file đổi từ ngoài…) → để
+        lần search sau build lại."""
+        cid = obj.container_id
+        cached = self._state.search.get(cid)
+        if cached is None:
+            return
+        now = self._search_versions(cid)
+        expected = (before, now[1]) if index.id_field == "node_id" else (now[0], before)
+        if cached[0] != expected:
+            del self._state.search[cid]
+            return
+        kind, doc = _SEARCH_DOCS[index.id_field]
+        cached[1].add(kind, getattr(obj, index.id_field), doc(obj))
+        self._state.search[cid] = (now, cached[1])
+
+    def search(self, query: str, container_id: str, limit: int = 20) -> list[SearchHit]:
+        """Như AbstractStorage.search trên SearchIndex in-memory của container.
+        Build 1 lần, sau đó cập nhật theo từng upsert; record đã xoá bị lọc qua tombstones."""
+        with self._state.lock:
+            nodes   = self._fresh(self._state.index("nodes", container_id))
+            sources = self._fresh(self._state.index("sources", container_id))
+            deleted = self._deleted
+            cached  = self._state.search.get(container_id)
+            if cached is None or cached[0] != (nodes.version, sources.version):
+                index = build_index(
+                    (nodes.records[rid] for rid in nodes.ids_in(container_id) if rid not in deleted),
+                    (sources.records[rid] for rid in sources.ids_in(container_id) if rid not in deleted),
+                )
+                cached = self._state.search[container_id] = ((nodes.version, sources.version), index)
+            return cached[1].search(query, limit, exclude=deleted)
+
+    # ── HISTORY ───────────────────────────────────────────────────────────
+    # Giữ lock ghi (cả flock): compact ở process khác không thay log chính
+    # giữa lúc sync offset và lúc seek đọc.
+
+    def node_history(self, node_id: str) -> list[NodeRevision] | None:
+        with self._state.writing():
+            candidates = self._state.candidates("nodes", node_id)
+            # Partition đang chứa node trước; node đã compact khỏi log → phải dò lịch sử
+            candidates.sort(key=lambda index: node_id not in self._fresh(index).records)
+            # Container đã xoá ở layout partitioned: lịch sử nằm trong thư mục đã drop
+            candidates += [self._state.dropped_partition(cid).nodes for cid in _dropped_ids(self._dir)]
+            for index in candidates:
+                index.refresh()
+                index.history.sync()
+                if node_id in index.history.entries:
+                    return _node_revisions(index.history.read(node_id))
         return None
 
-    def upsert_edge(self, edge: GraphEdge) -> None:
-        self._append(self._edges_path, edge.model_dump(mode="json"))
+    def graph_at(self, container_id: str, at: datetime) -> tuple[list[GraphNode], list[GraphEdge]]:
+        with self._state.writing():
+            nodes, edges = self._refresh_graph(container_id)
+            dropped = self._state.dropped_partition(container_id) if self.layout == LAYOUT_PARTITIONED else None
+            if dropped is not None and not nodes.path.parent.is_dir():
+                nodes, edges = dropped.nodes, dropped.edges
+                nodes.refresh()
+                edges.refresh()
+            nodes.history.sync()
+            edges.history.sync()
+            key = at.isoformat()
+            return _graph_snapshot(nodes.history.at(container_id, key), edges.history.at(container_id, key))
 
-    def delete_edge(self, edge_id: str) -> None:
-        self._deleted.add(edge_id)
-        self._save_deleted()
+    # ── CHANGE FEED ───────────────────────────────────────────────────────
+
+    def _refresh_graph(self, container_id: str) -> tuple[_EntityIndex, _EntityIndex]:
+        """Revalidate feed rồi mới tới nodes/edges của container: writer ghi dữ liệu
+        trước feed → mọi thay đổi feed biết đều đã có trong index."""
+        self._state.feed.refresh()
+        return (self._fresh(self._state.index("nodes", container_id)),
+                self._fresh(self._state.index("edges", container_id)))
+
+    def graph_revision(self, container_id: str) -> int:
+        with self._state.lock:
+            self._state.feed.refresh()
+            return self._state.feed.revision(container_id)
+
+    def graph_changes(self, container_id: str, since: int) -> dict | None:
+        with self._state.lock:
+            nodes, edges = self._refresh_graph(container_id)
+            changed = self._state.feed.since(container_id, since)
+            if changed is None:
+                return None
+            out = {"revision": self._state.feed.revision(container_id),
+                   "nodes": [], "edges": [], "deleted_nodes": [], "deleted_edges": []}
+            for kind, rid in changed:
+                index = nodes if kind == "nodes" else edges
+                r = index.records.get(rid)
+                if r is not None and rid not in self._deleted and r.container_id == container_id:
+                    out[kind].append(r.model_copy())
+                else:
+                    out[f"deleted_{kind}"].append(rid)
+            return out
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Backend selection
+# ─────────────────────────────────────────────────────────────────────────────
+
+BACKEND_FILE   = "file"
+BACKEND_SQLITE = "sqlite"
+
+SQLITE_FILENAME = "rks.sqlite3"
+
+
+def _backend_name(backend: str | None) -> str:
+    return (backend or os.environ.get("RKS_STORAGE_BACKEND", BACKEND_FILE)).strip().lower()
+
+
+def open_storage(data_dir: Path, backend: str | None = None) -> AbstractStorage:
+    """Mở storage của 1 user theo RKS_STORAGE_BACKEND (file | sqlite)."""
+    backend = _backend_name(backend)
+    if backend == BACKEND_SQLITE:
+        from .sqlite_storage import SqliteStorage
+        return SqliteStorage(db_path=data_dir / SQLITE_FILENAME)
+    if backend != BACKEND_FILE:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return FileStorage(data_dir=data_dir)
+
+
+def garbage_upper_bound(data_dir: Path) -> float:
+    """Cận trên tỉ lệ rác của FileStorage ở data_dir chỉ từ stat file + lần đo gần
+    nhất (compact_stats.json) — không đọc log, không build index, không lấy lock.
+    Byte append sau lần đo coi như toàn bản sửa (mỗi dòng mới biến 1 dòng cũ thành
+    rác), mỗi tombstone mới coi như 1 dòng sống thành rác. Chưa đo lần nào → 1.0."""
+    try:
+        measured = jsonio.loads((data_dir / _COMPACT_STATS).read_bytes())
+    except FileNotFoundError:
+        measured = {"ratio": 1.0, "rows": 0, "tombstones": 0, "files": {}}
+    except ValueError:
+        return 1.0
+    sidecar = data_dir / _TOMBSTONES_FILE
+    tombstones = len(_parse_tombstones(sidecar.read_bytes())[0]) if sidecar.exists() else 0
+    known = measured["files"]
+    size = base = appended = 0
+    for name, path in _entity_paths(data_dir, detect_layout(data_dir)).items():
+        sig = _stat_sig(path)
+        if sig is None:
+            continue
+        before = known.get(name, 0)
+        if sig[0] < before:
+            return 1.0          # file bị thay ngoài compact — không ước lượng được
+        size, base, appended = size + sig[0], base + before, appended + sig[0] - before
+    if not size:
+        return 0.0
+    row_bytes = sum(known.values()) / measured["rows"] if measured["rows"] else 0
+    garbage = (measured["ratio"] * base + appended
+               + max(0, tombstones - measured["tombstones"]) * row_bytes)
+    return min(1.0, garbage / size)
+
+
+def compaction_due(data_dir: Path, garbage_ratio: float, backend: str | None = None) -> bool:
+    """Đáng mở storage của data_dir để maybe_compact không — chỉ stat file.
+    SQLite: garbage_ratio() là PRAGMA, mở connection rẻ → có file DB là đủ."""
+    if _backend_name(backend) == BACKEND_SQLITE:
+        return (data_dir / SQLITE_FILENAME).exists()
+    return garbage_upper_bound(data_dir) >= garbage_ratio
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import json
+
+
+class BlockStreamParser:
+    """Parse dần JSON của clarify mode ({"summary": ..., "blocks": [{...}, ...]})
+    khi model còn đang stream text.
+
+    feed(text) trả về các sự kiện vừa hoàn chỉnh:
+      ("summary", str)  — khi chuỗi summary đã đóng
+      ("block", dict)   — mỗi object trong mảng blocks, ngay khi gặp '}' đóng
+    Mỗi ký tự chỉ được quét 1 lần → O(tổng độ dài), không re-parse buffer.
+    Text ngoài JSON (```json fence, lời dẫn) được bỏ qua.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._str_start = 0
+        self._last_str = ""            # raw string (chưa unescape) vừa đóng
+        self._pending_key: str | None = None
+        self._blocks_depth: int | None = None
+        self._obj_start: int | None = None
+        self._summary_sent = False
+
+    def feed(self, text: str) -> list[tuple[str, object]]:
+        self._buf += text
+        events: list[tuple[str, object]] = []
+        buf = self._buf
+        for i in range(self._pos, len(buf)):
+            ch = buf[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                    self._last_str = buf[self._str_start:i]
+                    if self._depth == 1 and self._pending_key == "summary" and not self._summary_sent:
+                        self._summary_sent = True
+                        events.append(("summary", json.loads(f'"{self._last_str}"')))
+                continue
+            if self._depth == 0 and ch != "{":
+                continue                        # chưa vào root object
+            if ch == '"':
+                self._in_str = True
+                self._str_start = i + 1
+            elif ch == ":" and self._depth == 1:
+                self._pending_key = self._last_str
+            elif ch == "," and self._depth == 1:
+                self._pending_key = None
+            elif ch in "{[":
+                if ch == "[" and self._depth == 1 and self._pending_key == "blocks":
+                    self._blocks_depth = 2
+                elif ch == "{" and self._blocks_depth == self._depth:
+                    self._obj_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if ch == "}" and self._obj_start is not None and self._depth == self._blocks_depth:
+                    try:
+                        events.append(("block", json.loads(buf[self._obj_start:i + 1])))
+                    except ValueError:
+                        pass
+                    self._obj_start = None
+                elif ch == "]" and self._blocks_depth is not None and self._depth == self._blocks_depth - 1:
+                    self._blocks_depth = None
+        self._pos = len(buf)
+        return events
@@ -0,0 +1,125 @@
+"""
+tokens.py — Đếm token + lắp prompt theo ngân sách token đầu vào.
+
+Tokenizer: tiktoken nếu được cài (optional, `pip install tiktoken`), không
+thì HeuristicTokenizer — ước lượng theo từ: từ ASCII ~4 ký tự / token, âm
+tiết có dấu tiếng Việt ~2 token, dấu câu 1 token. Tokenizer khác cắm qua
+RKS_TOKENIZER="module:factory" (factory(model) → object có `name` + `count`).
+
+PromptAssembler nhận từng section theo thứ tự ưu tiên: section bắt buộc
+(system prompt lõi, câu hỏi) luôn được giữ; section danh sách (neighbors,
+trích đoạn source, history…) lấy từng item tới khi hết ngân sách. usage()
+trả số token từng section để trả kèm response (theo dõi chi phí / độ trễ).
+"""
+from __future__ import annotations
+
+import importlib
+import math
+import os
+import re
+import threading
+from typing import Callable, Protocol, TypeVar
+
+PROMPT_BUDGET   = int(os.getenv("RKS_PROMPT_BUDGET", "6000"))
+MESSAGE_OVERHEAD = 4        # token định dạng chat cho mỗi message (role, phân cách)
+
+T = TypeVar("T")
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+
+class Tokenizer(Protocol):
+    name: str
+
+    def count(self, text: str) -> int: ...
+
+
+class HeuristicTokenizer:
+    name = "heuristic"
+
+    def count(self, text: str) -> int:
+        n = 0
+        for piece in _PIECE_RE.findall(text):
+            n += math.ceil(len(piece) / 4) if piece.isascii() else 2
+        return n
+
+
+class TiktokenTokenizer:
+    def __init__(self, model: str):
+        import tiktoken
+        try:
+            self._enc = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self._enc = tiktoken.get_encoding("o200k_base")
+        self.name = f"tiktoken:{self._enc.name}"
+
+    def count(self, text: str) -> int:
+        return len(self._enc.encode(text, disallowed_special=()))
+
+
+_TOKENIZERS: dict[str, Tokenizer] = {}
+_TOKENIZER_LOCK = threading.Lock()
+
+
+def get_tokenizer(model: str) -> Tokenizer:
+    """Tokenizer dùng chung theo model: RKS_TOKENIZER → tiktoken → heuristic."""
+    with _TOKENIZER_LOCK:
+        tok = _TOKENIZERS.get(model)
+        if tok is None:
+            spec = os.getenv("RKS_TOKENIZER", "")
+            if spec:
+                module, _, attr = spec.partition(":")
+                tok = getattr(importlib.import_module(module), attr or "tokenizer")(model)
+            else:
+                try:
+                    tok = TiktokenTokenizer(model)
+                except Exception:       # chưa cài (optional) / không tải được file encoding
+                    tok = HeuristicTokenizer()
+            _TOKENIZERS[model] = tok
+        return tok
+
+
+class PromptAssembler:
+    def __init__(self, tokenizer: Tokenizer, budget: int = PROMPT_BUDGET):
+        self.tokenizer = tokenizer
+        self.budget = budget
+        self.used = 0
+        self._sections: dict[str, dict] = {}
+
+    @property
+    def remaining(self) -> int:
+        return self.budget - self.used
+
+    def require(self, name: str, text: str, overhead: int = MESSAGE_OVERHEAD) -> None:
+        """Section bắt buộc — luôn tính vào, kể cả khi vượt ngân sách."""
+        tokens = self.tokenizer.count(text) + overhead
+        self.used += tokens
+        self._sections[name] = {"tokens": tokens}
+
+    def fit(self, name: str, items: list[T], render: Callable[[T], str],
+            header: str = "", overhead: int = 0, contiguous: bool = False) -> list[T]:
+        """Giữ các item (theo thứ tự ưu tiên) vừa ngân sách còn lại.
+        header + overhead chỉ tính khi có ít nhất 1 item; overhead tính cho mỗi item.
+        contiguous → dừng ở item đầu tiên không vừa (history phải liền mạch)."""
+        kept: list[T] = []
+        tokens = 0
+        fixed = self.tokenizer.count(header) if header else 0
+        for item in items:
+            cost = self.tokenizer.count(render(item)) + overhead + (fixed if not kept else 0)
+            if self.used + tokens + cost > self.budget:
+                if contiguous:
+                    break
+                continue
+            kept.append(item)
+            tokens += cost
+        self.used += tokens
+        self._sections[name] = {"tokens": tokens, "kept": len(kept), "dropped": len(items) - len(kept)}
+        return kept
+
+    def usage(self) -> dict:
+        return {
+            "tokenizer": self.tokenizer.name,
+            "budget": self.budget,
+            "input": self.used,
+            "sections": self._sections,
+        }
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# `rks` / `webapp` import được khi chạy pytest từ bất kỳ thư mục nào
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
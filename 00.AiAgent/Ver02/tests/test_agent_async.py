@@ -0,0 +1,74 @@
+"""Async path của CognitiveAgent không chặn event loop khi storage đang bị giữ lock."""
+import asyncio
+import threading
+
+import pytest
+
+from rks.agent import CognitiveAgent
+from rks.models import ExploreRequest, GraphNode, KnowledgeContainer
+from rks.storage import FileStorage
+
+HOLD_S = 0.3
+
+
+@pytest.fixture
+def agent(tmp_path, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)     # mock path — không gọi LLM thật
+    storage = FileStorage(tmp_path)
+    kc = KnowledgeContainer(title="KC")
+    storage.upsert_container(kc)
+    storage.upsert_node(GraphNode(container_id=kc.container_id, title="a", node_id="N_a"))
+    yield CognitiveAgent(storage)
+    storage.close()
+
+
+def _hold_storage_lock(storage: FileStorage) -> None:
+    """Thread khác giữ lock ghi (như compaction / batch) trong HOLD_S giây."""
+    held = threading.Event()
+
+    def hold():
+        with storage._state.writing():
+            held.set()
+            threading.Event().wait(HOLD_S)
+
+    threading.Thread(target=hold, daemon=True).start()
+    assert held.wait(5)
+
+
+async def _ticks_while(coro) -> tuple[object, int]:
+    """Chạy coro, đếm số lần loop kịp chạy coroutine khác (mỗi 10 ms) trong lúc chờ."""
+    task = asyncio.ensure_future(coro)
+    ticks = 0
+    while not task.done():
+        await asyncio.sleep(0.01)
+        ticks += 1
+    return task.result(), ticks
+
+
+@pytest.mark.parametrize("mode", ["clarify", "expand"])
+def test_explore_async_does_not_block_loop(agent, mode):
+    _hold_storage_lock(agent.storage)
+    req = ExploreRequest(node_id="N_a", container_id="", mode=mode, message="?")
+    resp, ticks = asyncio.run(_ticks_while(agent.explore_async(req)))
+    assert "Demo" in resp.reply
+    assert ticks >= 10
+
+
+def test_explore_stream_does_not_block_loop(agent):
+    _hold_storage_lock(agent.storage)
+    req = ExploreRequest(node_id="N_a", container_id="", mode="expand", message="?")
+
+    async def collect():
+        return [event async for event in agent.explore_stream(req)]
+
+    events, ticks = asyncio.run(_ticks_while(collect()))
+    assert events[-1][0] == "done"
+    assert ticks >= 10
+
+
+def test_auto_document_async_does_not_block_loop(agent):
+    _hold_storage_lock(agent.storage)
+    result, ticks = asyncio.run(_ticks_while(agent.auto_document_node_async("N_a")))
+    assert result["node"].version == 2
+    assert agent.storage.get_node("N_a").version == 2
+    assert ticks >= 10
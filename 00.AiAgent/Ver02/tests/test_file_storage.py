@@ -0,0 +1,164 @@
+"""Hành vi riêng của FileStorage (state dùng chung / đa process) — parity giữa backend ở test_storage_parity.py."""
+import pytest
+
+from rks import storage as storage_mod
+from rks.models import GraphNode, KnowledgeContainer
+from rks.storage import FileStorage, compaction_due, garbage_upper_bound
+
+
+def _seed(store: FileStorage) -> GraphNode:
+    kc = KnowledgeContainer(title="KC")
+    store.upsert_container(kc)
+    node = GraphNode(container_id=kc.container_id, title="a")
+    store.upsert_node(node)
+    return node
+
+
+def test_state_released_when_last_storage_closes(tmp_path):
+    key = tmp_path.resolve()
+    first, second = FileStorage(tmp_path), FileStorage(tmp_path)
+    assert first._state is second._state
+    node = _seed(first)
+
+    first.close()
+    first.close()                                   # close 2 lần không nhả ref của instance khác
+    assert storage_mod._STATES[key] is second._state
+    second.close()
+    assert key not in storage_mod._STATES
+
+    reopened = FileStorage(tmp_path)
+    assert reopened._state is not second._state
+    assert reopened.get_node(node.node_id) == node
+    reopened.close()
+
+
+def test_closed_storage_keeps_working_beside_new_state(tmp_path):
+    """Request đang chạy trên storage vừa bị evict: vẫn đọc / ghi đúng, và state mới của
+    cùng data_dir thấy thay đổi của nó qua đĩa (flock + stat như giữa 2 process)."""
+    old = FileStorage(tmp_path)
+    node = _seed(old)
+    old.close()
+    new = FileStorage(tmp_path)
+
+    edited = node.model_copy(update={"title": "b", "version": 2})
+    old.upsert_node(edited)
+    assert new.get_node(node.node_id) == edited
+    new.delete_node(node.node_id)
+    assert old.get_node(node.node_id) is None
+    new.close()
+
+
+def test_garbage_upper_bound_from_file_stats(tmp_path):
+    store = FileStorage(tmp_path)
+    node = _seed(store)
+    assert garbage_upper_bound(tmp_path) == 1.0      # chưa đo lần nào → phải mở để đo
+
+    assert store.maybe_compact(0.5) is None
+    measured, _ = store.garbage_ratio()
+    assert garbage_upper_bound(tmp_path) == pytest.approx(measured)
+    assert not compaction_due(tmp_path, 0.5, "file")
+
+    for version in range(2, 12):                     # 10 bản sửa → log chủ yếu là rác
+        node = node.model_copy(update={"version": version})
+        store.upsert_node(node)
+    assert store.garbage_ratio()[0] <= garbage_upper_bound(tmp_path)
+    assert compaction_due(tmp_path, 0.5, "file")
+
+    store.compact()
+    assert garbage_upper_bound(tmp_path) == 0.0
+    store.delete_node(node.node_id)                  # tombstone mới cũng tính là rác
+    assert garbage_upper_bound(tmp_path) > 0.0
+    store.close()
+
+
+def test_compaction_check_does_not_load_idle_store(tmp_path):
+    store = FileStorage(tmp_path)
+    _seed(store)
+    store.maybe_compact(0.5)
+    store.close()
+    assert not compaction_due(tmp_path, 0.5, "file")
+    assert tmp_path.resolve() not in storage_mod._STATES
+
+
+def test_change_feed_shared_between_states(tmp_path):
+    """2 state cùng data_dir (như 2 worker): revision / since của bên này bên kia trả được delta."""
+    first = FileStorage(tmp_path)
+    node = _seed(first)
+    first.close()                                   # state của first đứng riêng, như process khác
+    second = FileStorage(tmp_path)
+    assert first._state is not second._state
+    cid = node.container_id
+    since = first.graph_revision(cid)
+    assert second.graph_revision(cid) == since
+
+    edited = node.model_copy(update={"title": "b", "version": 2})
+    second.upsert_node(edited)
+    changes = first.graph_changes(cid, since)
+    assert changes["revision"] == second.graph_revision(cid) > since
+    assert changes["nodes"] == [edited]
+
+    first.delete_node(node.node_id)
+    changes = second.graph_changes(cid, changes["revision"])
+    assert changes["deleted_nodes"] == [node.node_id]
+    assert first.graph_changes(cid, since)["deleted_nodes"] == [node.node_id]
+    second.close()
+
+
+def test_change_feed_trimmed_on_disk(tmp_path):
+    store = FileStorage(tmp_path)
+    node = _seed(store)
+    cid = node.container_id
+    store._state.feed.max_entries = 3
+    old = store.graph_revision(cid)
+    for version in range(2, 12):
+        node = node.model_copy(update={"version": version})
+        store.upsert_node(node)
+    recent = store.graph_revision(cid) - 2
+    store.close()
+    assert len((tmp_path / "feed.jsonl").read_text().splitlines()) <= 1 + 2 * 3
+
+    reopened = FileStorage(tmp_path)                # đọc header + log từ đĩa
+    assert reopened.graph_changes(cid, old) is None
+    assert reopened.graph_changes(cid, recent)["nodes"] == [node]
+    assert reopened.graph_revision(cid) == recent + 2
+    reopened.close()
+
+
+def test_compact_keeps_tombstones_for_late_writers(tmp_path):
+    """Worker khác đọc node trước lúc xoá, ghi lại sau compact → node không sống lại."""
+    store = FileStorage(tmp_path)
+    node = _seed(store)
+    stale = store.get_node(node.node_id)
+    store.delete_node(node.node_id)
+
+    assert store.compact()["tombstones_dropped"] == 0
+    store.upsert_node(stale)                        # ghi muộn của request đang dở
+    assert store.get_node(node.node_id) is None
+
+    assert store.compact()["tombstones_dropped"] == 1   # dòng ghi muộn bị bỏ cùng lúc
+    assert store.get_node(node.node_id) is None
+    assert node.node_id not in storage_mod._parse_tombstones((tmp_path / "deleted_ids.json").read_bytes())[0]
+    store.close()
+
+
+def test_tombstones_read_legacy_list(tmp_path):
+    store = FileStorage(tmp_path)
+    node = _seed(store)
+    store.close()
+    (tmp_path / "deleted_ids.json").write_text(f'["{node.node_id}"]')
+    reopened = FileStorage(tmp_path)
+    assert reopened.get_node(node.node_id) is None
+    reopened.close()
+
+
+def test_drop_partition_in_batch_keeps_history(tmp_path):
+    """delete_container trong batch(): dòng chờ của partition vào thư mục đã drop,
+    flush không tạo lại partition."""
+    store = FileStorage(tmp_path, layout=storage_mod.LAYOUT_PARTITIONED)
+    node = _seed(store)
+    with store.batch():
+        store.upsert_node(node.model_copy(update={"title": "a2", "version": 2}))
+        store.delete_container(node.container_id)
+    assert storage_mod._partition_ids(tmp_path) == []
+    assert [r.node.title if r.node else None for r in store.node_history(node.node_id)] == ["a", "a2", None]
+    store.close()
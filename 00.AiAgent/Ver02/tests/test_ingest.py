@@ -0,0 +1,44 @@
+"""SourceIngestor.resolve chỉ nhận file trong thư mục cho phép."""
+import pytest
+
+from rks.ingest import SourceIngestor
+from rks.models import Source, SourceType
+from rks.storage import FileStorage
+
+
+@pytest.fixture
+def ingestor(tmp_path, monkeypatch):
+    monkeypatch.delenv("RKS_INGEST_ROOTS", raising=False)
+    user_dir = tmp_path / "user"
+    storage = FileStorage(user_dir)
+    yield SourceIngestor(storage, user_dir)
+    storage.close()
+
+
+def _pdf(path, container_id="KC_x") -> Source:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"%PDF-1.4\n")
+    return Source(container_id=container_id, type=SourceType.PDF, label="doc", path_or_url=str(path))
+
+
+def test_default_root_is_user_uploads(ingestor, tmp_path):
+    inside = tmp_path / "user" / "uploads" / "a.pdf"
+    assert ingestor.resolve(_pdf(inside)) == inside.resolve()
+    relative = _pdf(inside).model_copy(update={"path_or_url": "uploads/a.pdf"})
+    assert ingestor.resolve(relative) == inside.resolve()
+
+    with pytest.raises(ValueError):
+        ingestor.resolve(_pdf(tmp_path / "elsewhere" / "secret.pdf"))
+    with pytest.raises(ValueError):                 # ../ thoát khỏi uploads
+        ingestor.resolve(relative.model_copy(update={"path_or_url": "uploads/../../elsewhere/secret.pdf"}))
+
+
+def test_configured_roots_replace_default(tmp_path, monkeypatch):
+    shared = tmp_path / "shared"
+    monkeypatch.setenv("RKS_INGEST_ROOTS", str(shared))
+    storage = FileStorage(tmp_path / "user")
+    ingestor = SourceIngestor(storage, tmp_path / "user")
+    assert ingestor.resolve(_pdf(shared / "a.pdf")) == (shared / "a.pdf").resolve()
+    with pytest.raises(ValueError):
+        ingestor.resolve(_pdf(tmp_path / "user" / "uploads" / "b.pdf"))
+    storage.close()
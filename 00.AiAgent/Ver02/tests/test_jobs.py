@@ -0,0 +1,108 @@
+"""JobQueue / JobContext không chặn event loop khi flock của JobStore đang bị giữ."""
+import asyncio
+import threading
+
+import pytest
+
+from rks.agent import CognitiveAgent
+from rks.filelock import FileLock
+from rks.jobs import JobQueue, JobStore, auto_document_handlers
+from rks.models import GraphNode, JobState, KnowledgeContainer, NodeState
+from rks.storage import FileStorage
+
+HOLD_S = 0.3
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(tmp_path / "jobs.jsonl")
+
+
+def _hold_flock(store: JobStore) -> None:
+    """Thread khác (như worker process khác) giữ flock của jobs.jsonl trong HOLD_S giây."""
+    held = threading.Event()
+
+    def hold():
+        with FileLock(store._flock.path):          # fd riêng → flock chặn như giữa 2 process
+            held.set()
+            threading.Event().wait(HOLD_S)
+
+    threading.Thread(target=hold, daemon=True).start()
+    assert held.wait(5)
+
+
+async def _ticks_while(coro) -> tuple[object, int]:
+    task = asyncio.ensure_future(coro)
+    ticks = 0
+    while not task.done():
+        await asyncio.sleep(0.01)
+        ticks += 1
+    return task.result(), ticks
+
+
+def test_job_saves_do_not_block_loop(store):
+    async def handler(ctx):
+        await ctx.set_total(2)
+        _hold_flock(store)                          # lần save tiến độ phải chờ flock
+        await ctx.item_done()
+        await ctx.item_done()
+        return {"ok": True}
+
+    async def scenario():
+        queue = JobQueue(lambda user: store, {"demo": handler}, workers=1)
+        _hold_flock(store)
+        job, ticks = await _ticks_while(queue.submit("u", "demo", {}))
+        assert ticks >= 10
+        while (await queue.get("u", job.job_id)).state not in (JobState.DONE, JobState.ERROR):
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        return job.job_id
+
+    job_id = asyncio.run(scenario())
+    done = store.get(job_id)
+    assert done.state == JobState.DONE and done.done == 2 and done.result == {"ok": True}
+
+
+def test_cancel_queued_job_does_not_block_loop(store):
+    async def scenario():
+        queue = JobQueue(lambda user: store, {"demo": lambda ctx: None}, workers=1)
+        queue._ensure_started()
+        queue._tasks[0].cancel()                    # không worker nào lấy job → job nằm QUEUED
+        job = await queue.submit("u", "demo", {})
+        _hold_flock(store)
+        cancelled, ticks = await _ticks_while(queue.cancel("u", job.job_id))
+        await queue.stop()
+        return cancelled, ticks
+
+    cancelled, ticks = asyncio.run(scenario())
+    assert ticks >= 10
+    assert cancelled.state == JobState.CANCELLED
+    assert store.get(cancelled.job_id).state == JobState.CANCELLED
+
+
+def test_single_node_job_skips_documented_node(tmp_path, store, monkeypatch):
+    """Job chạy lại (restart) trên node đã document → không gọi LLM, không ghi đè."""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    storage = FileStorage(tmp_path / "data")
+    kc = KnowledgeContainer(title="KC")
+    storage.upsert_container(kc)
+    storage.upsert_node(GraphNode(container_id=kc.container_id, title="a", node_id="N_a"))
+    agent = CognitiveAgent(storage)
+    handlers = auto_document_handlers(lambda user: agent)
+
+    async def run_job():
+        queue = JobQueue(lambda user: store, handlers, workers=1)
+        job = await queue.submit("u", "auto_document", {"node_id": "N_a"})
+        while (await queue.get("u", job.job_id)).state not in (JobState.DONE, JobState.ERROR):
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        return store.get(job.job_id)
+
+    first = asyncio.run(run_job())
+    documented = storage.get_node("N_a")
+    assert documented.state != NodeState.EXPLORE and "skipped" not in first.result
+
+    again = asyncio.run(run_job())
+    assert again.state == JobState.DONE and again.result["skipped"]
+    assert storage.get_node("N_a") == documented
+    storage.close()
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+from rks.pool import LRURegistry
+
+
+def test_lru_eviction_calls_on_evict():
+    evicted = []
+    reg = LRURegistry(2, on_evict=evicted.append)
+    reg.get("a", lambda: "A")
+    reg.get("b", lambda: "B")
+    reg.get("a", lambda: "A2")            # hit → a thành mới nhất
+    reg.get("c", lambda: "C")
+    assert evicted == ["B"]
+    assert reg.values() == ["A", "C"]
+
+
+def test_slow_factory_does_not_block_other_keys():
+    reg = LRURegistry(8)
+    reg.get("warm", lambda: "W")
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "S"
+
+    t = threading.Thread(target=reg.get, args=("cold", slow))
+    t.start()
+    assert started.wait(5)
+    t0 = time.perf_counter()
+    assert reg.get("warm", lambda: "X") == "W"            # hit không chờ cold open
+    assert reg.get("other", lambda: "O") == "O"           # miss key khác cũng không chờ
+    assert time.perf_counter() - t0 < 1
+    release.set()
+    t.join()
+    assert reg.peek("cold") == "S"
+
+
+def test_same_key_built_once():
+    reg = LRURegistry(8)
+    calls = []
+    gate = threading.Barrier(4)
+
+    def factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    results = []
+
+    def worker():
+        gate.wait()
+        results.append(reg.get("k", factory))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert len({id(r) for r in results}) == 1
+
+
+def test_failed_factory_is_retried():
+    reg = LRURegistry(8)
+
+    def boom():
+        raise RuntimeError("open failed")
+
+    with pytest.raises(RuntimeError):
+        reg.get("k", boom)
+    assert reg.get("k", lambda: "ok") == "ok"
@@ -0,0 +1,37 @@
+"""Hành vi riêng của SqliteStorage — parity giữa backend ở test_storage_parity.py."""
+import sqlite3
+import threading
+
+import pytest
+
+from rks.models import KnowledgeContainer
+from rks.sqlite_storage import SqliteStorage
+from rks.storage import SQLITE_FILENAME
+
+
+def test_close_closes_connections_of_every_thread(tmp_path):
+    db = tmp_path / SQLITE_FILENAME
+    store = SqliteStorage(db_path=db)
+    store.upsert_container(KnowledgeContainer(title="KC"))
+    conns = []
+
+    def read():                                     # như threadpool của FastAPI / to_thread
+        store.list_containers()
+        conns.append(store._conn())
+
+    threads = [threading.Thread(target=read) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    conns.append(store._conn())
+    assert len(set(map(id, conns))) == 4
+
+    store.close()
+    for conn in conns:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+    assert not db.with_name(db.name + "-wal").exists()
+
+    assert [c.title for c in store.list_containers()] == ["KC"]      # dùng tiếp → connection mới
+    store.close()
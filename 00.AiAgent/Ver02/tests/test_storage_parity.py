@@ -0,0 +1,362 @@
+"""
+Parity giữa các backend AbstractStorage: cùng kịch bản, cùng kết quả trên
+FileStorage (flat + partitioned) và SqliteStorage.
+
+  python -m pytest tests/test_storage_parity.py
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from rks.models import GraphEdge, GraphNode, KnowledgeContainer, RelationType, Source
+from rks.sqlite_storage import SqliteStorage
+from rks.storage import LAYOUT_FLAT, LAYOUT_PARTITIONED, SQLITE_FILENAME, FileStorage
+
+BACKENDS = ["file-flat", "file-partitioned", "sqlite"]
+T0 = datetime(2024, 1, 1, 8, 0, 0)
+
+
+def _open(backend: str, data_dir):
+    if backend == "sqlite":
+        return SqliteStorage(db_path=data_dir / SQLITE_FILENAME)
+    return FileStorage(data_dir, layout=LAYOUT_FLAT if backend == "file-flat" else LAYOUT_PARTITIONED)
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request) -> str:
+    return request.param
+
+
+@pytest.fixture
+def opened():
+    stores = []
+    yield stores
+    for s in stores:
+        s.close()
+
+
+@pytest.fixture
+def store(backend, tmp_path, opened):
+    opened.append(_open(backend, tmp_path))
+    return opened[-1]
+
+
+@pytest.fixture
+def reopen(backend, tmp_path, opened):
+    """Đóng instance đang dùng rồi mở lại cùng data dir — đọc lại từ đĩa."""
+    def _reopen(store):
+        store.close()
+        opened.append(_open(backend, tmp_path))
+        return opened[-1]
+    return _reopen
+
+
+def _at(seconds: int) -> datetime:
+    return T0 + timedelta(seconds=seconds)
+
+
+def _container(store, title="KC", seconds=0) -> KnowledgeContainer:
+    c = KnowledgeContainer(title=title, created_at=_at(seconds), updated_at=_at(seconds))
+    store.upsert_container(c)
+    return c
+
+
+def _node(store, cid, title, seconds) -> GraphNode:
+    n = GraphNode(container_id=cid, title=title, definition=f"định nghĩa {title}",
+                  created_at=_at(seconds), updated_at=_at(seconds))
+    store.upsert_node(n)
+    return n
+
+
+def _edge(store, cid, a, b, relation=RelationType.PART_OF, seconds=0) -> GraphEdge:
+    e = GraphEdge(container_id=cid, source_node_id=a.node_id, target_node_id=b.node_id,
+                  relation_type=relation, created_at=_at(seconds))
+    store.upsert_edge(e)
+    return e
+
+
+def _ids(records, field) -> list[str]:
+    return [getattr(r, field) for r in records]
+
+
+# ── Containers ───────────────────────────────────────────────────────────
+
+def test_container_crud(store):
+    b = _container(store, "B", seconds=20)
+    a = _container(store, "A", seconds=10)
+    assert _ids(store.list_containers(), "container_id") == [a.container_id, b.container_id]
+    assert store.get_container(a.container_id) == a
+    assert store.get_container("KC_missing") is None
+
+    store.upsert_container(a.model_copy(update={"title": "A2"}))
+    assert store.get_container(a.container_id).title == "A2"
+    assert len(store.list_containers()) == 2
+
+
+def test_delete_container_removes_children(store):
+    kc, other = _container(store, "KC"), _container(store, "other", seconds=1)
+    s = Source(container_id=kc.container_id, label="doc")
+    store.upsert_source(s)
+    a, b = _node(store, kc.container_id, "a", 1), _node(store, kc.container_id, "b", 2)
+    e = _edge(store, kc.container_id, a, b)
+    keep = _node(store, other.container_id, "keep", 3)
+
+    store.delete_container(kc.container_id)
+
+    assert store.get_container(kc.container_id) is None
+    assert _ids(store.list_containers(), "container_id") == [other.container_id]
+    assert store.list_sources(kc.container_id) == []
+    assert store.list_nodes(kc.container_id) == []
+    assert store.list_edges(kc.container_id) == []
+    assert store.get_source(s.source_id) is None
+    assert store.get_node(a.node_id) is None
+    assert store.get_edge(e.edge_id) is None
+    assert store.get_node(keep.node_id) == keep
+
+
+# ── Sources ──────────────────────────────────────────────────────────────
+
+def test_source_crud(store):
+    kc = _container(store)
+    late = Source(container_id=kc.container_id, label="late", created_at=_at(20))
+    early = Source(container_id=kc.container_id, label="early", created_at=_at(10))
+    store.upsert_source(late)
+    store.upsert_source(early)
+    assert _ids(store.list_sources(kc.container_id), "source_id") == [early.source_id, late.source_id]
+    assert store.get_source(late.source_id) == late
+
+    store.upsert_source(late.model_copy(update={"notes": "ghi chú"}))
+    assert store.get_source(late.source_id).notes == "ghi chú"
+
+    store.delete_source(early.source_id)
+    assert store.get_source(early.source_id) is None
+    assert _ids(store.list_sources(kc.container_id), "source_id") == [late.source_id]
+
+
+# ── Nodes / edges / graph ────────────────────────────────────────────────
+
+def test_node_crud_and_ordering(store):
+    kc = _container(store)
+    c = _node(store, kc.container_id, "c", 30)
+    a = _node(store, kc.container_id, "a", 10)
+    b = _node(store, kc.container_id, "b", 20)
+    assert _ids(store.list_nodes(kc.container_id), "title") == ["a", "b", "c"]
+    assert store.get_node(b.node_id) == b
+
+    edited = a.model_copy(update={"definition": "mới", "version": 2})
+    store.upsert_node(edited)
+    assert store.get_node(a.node_id) == edited
+    assert _ids(store.list_nodes(kc.container_id), "title") == ["a", "b", "c"]
+
+    store.delete_node(c.node_id)
+    assert store.get_node(c.node_id) is None
+    assert _ids(store.list_nodes(kc.container_id), "title") == ["a", "b"]
+
+
+def test_graph_is_scoped_to_container(store):
+    kc, other = _container(store, "KC"), _container(store, "other", seconds=1)
+    a, b = _node(store, kc.container_id, "a", 1), _node(store, kc.container_id, "b", 2)
+    x, y = _node(store, other.container_id, "x", 3), _node(store, other.container_id, "y", 4)
+    e = _edge(store, kc.container_id, a, b)
+    _edge(store, other.container_id, x, y)
+
+    assert _ids(store.list_nodes(kc.container_id), "node_id") == [a.node_id, b.node_id]
+    assert store.list_edges(kc.container_id) == [e]
+    assert store.get_edge(e.edge_id) == e
+
+
+def test_delete_node_removes_incident_edges(store):
+    kc = _container(store)
+    a, b, c = (_node(store, kc.container_id, t, i) for i, t in enumerate("abc"))
+    ab, bc = _edge(store, kc.container_id, a, b), _edge(store, kc.container_id, b, c)
+    ac = _edge(store, kc.container_id, a, c)
+
+    store.delete_node(b.node_id)
+
+    assert store.get_edge(ab.edge_id) is None
+    assert store.get_edge(bc.edge_id) is None
+    assert store.list_edges(kc.container_id) == [ac]
+
+
+def test_delete_edge(store):
+    kc = _container(store)
+    a, b = _node(store, kc.container_id, "a", 1), _node(store, kc.container_id, "b", 2)
+    e = _edge(store, kc.container_id, a, b)
+    store.delete_edge(e.edge_id)
+    assert store.get_edge(e.edge_id) is None
+    assert store.list_edges(kc.container_id) == []
+    assert store.node_degree(a.node_id) == 0
+
+
+def test_neighbors(store):
+    kc = _container(store)
+    root, child, parent, far = (_node(store, kc.container_id, t, i)
+                                for i, t in enumerate(["root", "child", "parent", "far"]))
+    _edge(store, kc.container_id, root, child, RelationType.CAUSES)
+    _edge(store, kc.container_id, parent, root, RelationType.REQUIRES)
+    _edge(store, kc.container_id, child, far, RelationType.PART_OF)
+
+    one_hop = store.get_neighborhood(root.node_id, hops=1)
+    assert {(n.node_id, n.relation_type, n.direction, n.hop) for n in one_hop} == {
+        (child.node_id, "CAUSES", "out", 1),
+        (parent.node_id, "REQUIRES", "in", 1),
+    }
+    two_hops = store.get_neighborhood(root.node_id, hops=2)
+    assert (far.node_id, 2) in {(n.node_id, n.hop) for n in two_hops}
+    assert len(store.get_neighborhood(root.node_id, hops=2, limit=1)) == 1
+    assert store.get_neighborhood("N_missing") == []
+
+    assert store.node_degree(root.node_id) == 2
+    assert store.node_degree(far.node_id) == 1
+    assert store.node_degree("N_missing") == 0
+
+
+def test_delete_node_cascade(store):
+    """root → only (chỉ 1 parent) → grand; root → shared ← other (2 parent)."""
+    kc = _container(store)
+    root, only, grand, shared, other = (_node(store, kc.container_id, t, i)
+                                        for i, t in enumerate(["root", "only", "grand", "shared", "other"]))
+    _edge(store, kc.container_id, root, only)
+    _edge(store, kc.container_id, only, grand)
+    _edge(store, kc.container_id, root, shared)
+    kept_edge = _edge(store, kc.container_id, other, shared)
+
+    deleted = store.delete_node_cascade(root.node_id)
+
+    assert sorted(deleted) == sorted([root.node_id, only.node_id, grand.node_id])
+    assert _ids(store.list_nodes(kc.container_id), "node_id") == [shared.node_id, other.node_id]
+    assert store.list_edges(kc.container_id) == [kept_edge]
+    assert store.node_degree(shared.node_id) == 1
+    assert store.delete_node_cascade(root.node_id) == []
+
+
+# ── Tombstone / compact ──────────────────────────────────────────────────
+
+def test_compact_round_trip(store, reopen):
+    kc, gone = _container(store, "KC"), _container(store, "gone", seconds=1)
+    s = Source(container_id=kc.container_id, label="doc", created_at=_at(1))
+    dropped = Source(container_id=kc.container_id, label="dropped", created_at=_at(2))
+    store.upsert_source(s)
+    store.upsert_source(dropped)
+    a, b, c = (_node(store, kc.container_id, t, i) for i, t in enumerate("abc"))
+    _edge(store, kc.container_id, a, b)
+    bc = _edge(store, kc.container_id, b, c)
+    _node(store, gone.container_id, "x", 5)
+    for version in range(2, 6):                        # bản cũ → dòng rác trong log
+        a = a.model_copy(update={"version": version, "definition": f"v{version}"})
+        store.upsert_node(a)
+    store.delete_node(c.node_id)
+    store.delete_source(dropped.source_id)
+    store.delete_container(gone.container_id)
+
+    def snapshot(st):
+        return (st.list_containers(), st.list_sources(kc.container_id), st.list_nodes(kc.container_id),
+                st.list_edges(kc.container_id), st.list_nodes(gone.container_id))
+
+    before = snapshot(store)
+    store.compact()
+    assert snapshot(store) == before
+
+    store = reopen(store)
+    assert snapshot(store) == before
+    assert store.get_node(a.node_id).definition == "v5"
+    assert store.get_node(c.node_id) is None
+    assert store.get_edge(bc.edge_id) is None
+    assert store.get_source(dropped.source_id) is None
+    assert store.get_container(gone.container_id) is None
+
+    # Ghi sau compact vẫn đúng, và vẫn còn sau khi mở lại
+    d = _node(store, kc.container_id, "d", 9)
+    store.compact()
+    store = reopen(store)
+    assert _ids(store.list_nodes(kc.container_id), "title") == ["a", "b", "d"]
+    assert store.get_node(d.node_id) == d
+
+
+def test_batch_matches_single_writes(store, reopen):
+    kc = _container(store)
+    with store.batch():
+        a = _node(store, kc.container_id, "a", 1)
+        b = _node(store, kc.container_id, "b", 2)
+        e = _edge(store, kc.container_id, a, b)
+        assert store.get_node(b.node_id) == b           # đọc trong batch thấy bản mới
+    store = reopen(store)
+    assert _ids(store.list_nodes(kc.container_id), "node_id") == [a.node_id, b.node_id]
+    assert store.list_edges(kc.container_id) == [e]
+
+
+# ── Change feed ──────────────────────────────────────────────────────────
+
+def test_graph_changes(store):
+    kc = _container(store)
+    a = _node(store, kc.container_id, "a", 1)
+    since = store.graph_revision(kc.container_id)
+    b = _node(store, kc.container_id, "b", 2)
+    e = _edge(store, kc.container_id, a, b)
+    store.delete_node(a.node_id)
+
+    changes = store.graph_changes(kc.container_id, since)
+    assert changes["revision"] == store.graph_revision(kc.container_id) > since
+    assert _ids(changes["nodes"], "node_id") == [b.node_id]
+    assert changes["deleted_nodes"] == [a.node_id]
+    assert changes["deleted_edges"] == [e.edge_id]
+    assert store.graph_changes(kc.container_id, changes["revision"])["nodes"] == []
+    assert store.graph_changes(kc.container_id, changes["revision"] + 10**9) is None
+
+
+# ── Embedding ────────────────────────────────────────────────────────────
+
+def test_similar_nodes_cache_follows_graph(store):
+    kc = _container(store)
+    a = _node(store, kc.container_id, "mạng nơ-ron", 1)
+    b = _node(store, kc.container_id, "cơ sở dữ liệu", 2)
+    assert store.similar_nodes(kc.container_id, "cơ sở dữ liệu", k=1)[0].node_id == b.node_id
+    store.delete_node(b.node_id)                             # cache cập nhật theo change feed
+    assert b.node_id not in [s.node_id for s in store.similar_nodes(kc.container_id, "cơ sở dữ liệu", k=5)]
+    store.close()
+    assert store._embeddings[1] == {}                        # close() bỏ cache
+
+
+# ── Layout + lịch sử ─────────────────────────────────────────────────────
+
+def test_layout_positions_not_in_history(store):
+    kc = _container(store)
+    a = _node(store, kc.container_id, "a", 1)
+    b = _node(store, kc.container_id, "b", 2)
+    _edge(store, kc.container_id, a, b)
+    assert store.ensure_layout(kc.container_id) == 2
+    assert store.ensure_layout(kc.container_id) == 0        # graph chưa đổi → không ghi lại
+    assert store._layout[1] == {kc.container_id: store.graph_revision(kc.container_id)}
+    placed = store.get_node(a.node_id)
+    assert placed.x is not None and placed.y is not None
+    assert (placed.version, placed.updated_at) == (a.version, a.updated_at)
+
+    store.set_node_positions(kc.container_id, {a.node_id: (5.0, 7.0)})
+    edited = store.get_node(a.node_id).model_copy(update={"title": "a2", "version": 2, "updated_at": _at(3)})
+    store.upsert_node(edited)
+    history = store.node_history(a.node_id)
+    assert [r.node for r in history] == [a, edited]          # chỉ đổi x/y → không thành revision
+
+
+def test_delete_container_in_changes_and_history(store):
+    kc = _container(store)
+    a = _node(store, kc.container_id, "a", 1)
+    b = _node(store, kc.container_id, "b", 2)
+    e = _edge(store, kc.container_id, a, b, seconds=2)
+    since = store.graph_revision(kc.container_id)
+
+    store.delete_container(kc.container_id)
+
+    changes = store.graph_changes(kc.container_id, since)
+    assert sorted(changes["deleted_nodes"]) == sorted([a.node_id, b.node_id])
+    assert changes["deleted_edges"] == [e.edge_id]
+    assert changes["nodes"] == changes["edges"] == []
+    history = store.node_history(a.node_id)
+    assert history[0].node == a and history[-1].deleted
+    nodes, edges = store.graph_at(kc.container_id, _at(5))
+    assert _ids(nodes, "node_id") == [a.node_id, b.node_id] and edges == [e]
+
+    store.compact()                                       # lịch sử còn sau compact
+    assert [r.node for r in store.node_history(b.node_id)][0] == b
+    nodes, _ = store.graph_at(kc.container_id, _at(5))
+    assert _ids(nodes, "node_id") == [a.node_id, b.node_id]
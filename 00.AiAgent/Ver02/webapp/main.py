@@ -1,31 +1,46 @@
 from __future__ import annotations
 
+import asyncio
 import base64
+import logging
 import os
 import secrets
+import threading
+import zlib
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from pathlib import Path
 
 from dotenv import load_dotenv
 from fastapi import Depends, FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.routing import APIRoute
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request
 from starlette.responses import Response
 
 load_dotenv()
 
+from rks import bundle, jsonio
 from rks.agent import CognitiveAgent
+from rks.ingest import SourceIngestor, shutdown_pool
+from rks.jobs import JobQueue, JobStore, auto_document_handlers
+from rks.llm_cache import LLMCache
+from rks.metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware
 from rks.models import (
     ContainerCreate,
     EdgeCreate,
     ExploreRequest,
     GraphEdge,
     GraphNode,
+    JobCreate,
     KnowledgeContainer,
     NodeCreate,
     NodeDocument,
+    NodePositions,
     NodeState,
     NodeType,
     RelationType,
@@ -33,7 +48,20 @@ from rks.models import (
     SourceCreate,
     SourceType,
 )
-from rks.storage import FileStorage
+from rks.pool import LRURegistry
+from rks.profiling import RequestProfiler, profiled
+from rks.projection import (
+    EDGES,
+    NODES,
+    SKELETON_EDGE_FIELDS,
+    SKELETON_NODE_FIELDS,
+    SOURCES,
+    dump_graph,
+    dump_list,
+    paginate,
+    parse_fields,
+)
+from rks.storage import AbstractStorage, compaction_due, open_storage
 
 
 class _ContainerUpdate(BaseModel):
@@ -41,8 +69,79 @@ class _ContainerUpdate(BaseModel):
     description: str = ""
 
 
+class FastJSONResponse(Response):
+    """JSON qua rks.jsonio (orjson nếu có). Nhận bytes đã serialize sẵn hoặc object
+    bất kỳ (model, dict chứa model, …). Route trả thẳng instance này thì FastAPI
+    bỏ qua jsonable_encoder — object chỉ serialize đúng 1 lần."""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return content if isinstance(content, bytes) else jsonio.dumps(content)
+
+
+class _ProfiledRoute(APIRoute):
+    """Endpoint chạy dưới profiler khi middleware chọn profile request đó. Bọc
+    dependant.call (không phải endpoint) để FastAPI vẫn đọc signature gốc."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, endpoint, **kwargs)
+        self.dependant.call = profiled(self.dependant.call)
+
+
+def _json_list(body: bytes, next_cursor: str | None) -> Response:
+    """List đã serialize sẵn; body vẫn là JSON array như cũ, cursor trang sau ở header."""
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return FastJSONResponse(body, headers=headers)
+
+
 def create_app() -> FastAPI:
-    app = FastAPI(title="Cognitive Graph Agent v1.0")
+    base_dir  = Path(__file__).resolve().parent
+    data_base = Path(os.environ.get("RKS_DATA_DIR") or base_dir.parent / "data")
+
+    # ── Log compaction ─────────────────────────────────────────────────
+    # Chạy nền định kỳ: user nào có tỉ lệ dòng rác ≥ RKS_COMPACT_GARBAGE_RATIO
+    # thì rewrite JSONL về snapshot record sống. RKS_COMPACT_INTERVAL=0 → tắt.
+    compact_ratio    = float(os.environ.get("RKS_COMPACT_GARBAGE_RATIO", "0.5"))
+    compact_min_rows = int(os.environ.get("RKS_COMPACT_MIN_ROWS", "200"))
+    compact_interval = float(os.environ.get("RKS_COMPACT_INTERVAL", "600"))
+
+    # User chỉ được mở (load index, lấy flock) khi cận trên tỉ lệ rác tính từ stat
+    # file đã vượt ngưỡng; mở xong close ngay — user không có session sống không
+    # giữ index trong RAM (user idle nhiều tháng không bao giờ bị load).
+    def _compact_all_users() -> None:
+        users_dir = data_base / "users"
+        if not users_dir.exists():
+            return
+        for user_dir in users_dir.iterdir():
+            if not user_dir.is_dir() or not compaction_due(user_dir, compact_ratio):
+                continue
+            storage = open_storage(user_dir)
+            try:
+                storage.maybe_compact(compact_ratio, compact_min_rows)
+            finally:
+                storage.close()
+
+    async def _compaction_loop() -> None:
+        while True:
+            await asyncio.sleep(compact_interval)
+            try:
+                await asyncio.to_thread(_compact_all_users)
+            except Exception:
+                logging.getLogger(__name__).exception("[compaction] lỗi")
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        task = asyncio.create_task(_compaction_loop()) if compact_interval > 0 else None
+        await _resume_jobs()
+        yield
+        if task:
+            task.cancel()
+        await jobs.stop()
+        shutdown_pool()
+
+    app = FastAPI(title="Cognitive Graph Agent v1.0", lifespan=lifespan,
+                  default_response_class=FastJSONResponse)
+    app.router.route_class = _ProfiledRoute
 
     # ── HTTP Basic Auth ────────────────────────────────────────────────
     # Chỉ bật khi APP_PASSWORD được set trong .env / environment.
@@ -70,8 +169,11 @@ def create_app() -> FastAPI:
                 headers={"WWW-Authenticate": 'Basic realm="Cognitive Graph Agent"'},
             )
 
-    base_dir  = Path(__file__).resolve().parent
-    data_base = base_dir.parent / "data"
+    # ── Metrics + profiler ─────────────────────────────────────────────
+    # Thêm sau basic auth → middleware ngoài cùng, đo cả request bị 401.
+    # Profile request chậm ghi vào RKS_PROFILE_DIR (mặc định data/profiles).
+    profiler = RequestProfiler(Path(os.environ.get("RKS_PROFILE_DIR") or data_base / "profiles"))
+    app.add_middleware(MetricsMiddleware, profiler=profiler)
 
     templates = Jinja2Templates(directory=str(base_dir / "templates"))
     app.mount("/static", StaticFiles(directory=str(base_dir / "static")), name="static")
@@ -79,17 +181,66 @@ def create_app() -> FastAPI:
     # ── Per-user dependency chain ──────────────────────────────────────────
     # get_current_user → get_storage → get_agent
     # Mỗi request tự động nhận đúng storage của user đang đăng nhập.
+    # (storage, agent) của mỗi user được giữ trong LRU pool toàn process —
+    # request sau chỉ tốn 1 lần lookup dict. RKS_POOL_SIZE = số user tối đa.
+    # LLM response cache dùng chung mọi user (key = hash prompt đầy đủ).
+    # RKS_LLM_CACHE_MAX_MB=0 → tắt.
+    cache_mb  = float(os.environ.get("RKS_LLM_CACHE_MAX_MB", "64"))
+    llm_cache = LLMCache(
+        Path(os.environ.get("RKS_LLM_CACHE_DIR") or data_base / "llm_cache"),
+        ttl=float(os.environ.get("RKS_LLM_CACHE_TTL", str(7 * 24 * 3600))),
+        max_bytes=int(cache_mb * 1024 * 1024),
+    ) if cache_mb > 0 else None
+
+    sessions: LRURegistry[tuple[AbstractStorage, CognitiveAgent]] = LRURegistry(
+        int(os.environ.get("RKS_POOL_SIZE", "64")),
+        on_evict=lambda session: session[0].close(),
+    )
+
+    def _session(user: str) -> tuple[AbstractStorage, CognitiveAgent]:
+        def create():
+            user_dir = data_base / "users" / user
+            storage = open_storage(user_dir)
+            ingestor = SourceIngestor(storage, user_dir)
+            return storage, CognitiveAgent(storage=storage, cache=llm_cache, ingestor=ingestor)
+        return sessions.get(user, create)
 
     def get_current_user(request: Request) -> str:
         """Trả về username từ Basic Auth header hoặc 'default' (local mode)."""
         return getattr(request.state, "username", "default")
 
-    def get_storage(user: str = Depends(get_current_user)) -> FileStorage:
-        """Tạo FileStorage trỏ vào data/users/{username}/ — mỗi user cách ly hoàn toàn."""
-        return FileStorage(data_dir=data_base / "users" / user)
+    def get_storage(user: str = Depends(get_current_user)) -> AbstractStorage:
+        """Storage trỏ vào data/users/{username}/ — mỗi user cách ly hoàn toàn."""
+        return _session(user)[0]
+
+    def get_agent(user: str = Depends(get_current_user)) -> CognitiveAgent:
+        return _session(user)[1]
+
+    def get_ingestor(user: str = Depends(get_current_user)) -> SourceIngestor:
+        return _session(user)[1].ingestor
+
+    # ── Background jobs ────────────────────────────────────────────────────
+    # Job state: data/users/{username}/jobs.jsonl. Worker chạy trên event loop
+    # của server; job dở dang lúc restart được chạy lại khi app khởi động.
+    job_stores: dict[str, JobStore] = {}
+    job_stores_lock = threading.Lock()      # JobQueue mở store trong thread (to_thread)
 
-    def get_agent(storage: FileStorage = Depends(get_storage)) -> CognitiveAgent:
-        return CognitiveAgent(storage=storage)
+    def _job_store(user: str) -> JobStore:
+        with job_stores_lock:
+            store = job_stores.get(user)
+            if store is None:
+                store = job_stores[user] = JobStore(data_base / "users" / user / "jobs.jsonl")
+            return store
+
+    jobs = JobQueue(_job_store, auto_document_handlers(lambda user: _session(user)[1]),
+                    lease_dir=data_base / "workers")
+
+    async def _resume_jobs() -> None:
+        users_dir = data_base / "users"
+        if users_dir.exists():
+            for user_dir in users_dir.iterdir():
+                if (user_dir / "jobs.jsonl").exists():
+                    await jobs.resume(user_dir.name)
 
     # ────────────────────────────────────────────────────────────
     # MAIN PAGE
@@ -110,19 +261,19 @@ def create_app() -> FastAPI:
     # ────────────────────────────────────────────────────────────
 
     @app.get("/api/containers")
-    def list_containers(storage: FileStorage = Depends(get_storage)):
-        return storage.list_containers()
+    def list_containers(storage: AbstractStorage = Depends(get_storage)):
+        return FastJSONResponse(storage.list_containers())
 
     @app.post("/api/containers", status_code=201)
     def create_container(body: ContainerCreate,
-                         storage: FileStorage = Depends(get_storage),
+                         storage: AbstractStorage = Depends(get_storage),
                          user: str = Depends(get_current_user)):
         c = KnowledgeContainer(user_id=user, title=body.title.strip(), description=body.description.strip())
         storage.upsert_container(c)
         return c
 
     @app.delete("/api/containers/{container_id}")
-    def delete_container(container_id: str, storage: FileStorage = Depends(get_storage)):
+    def delete_container(container_id: str, storage: AbstractStorage = Depends(get_storage)):
         c = storage.get_container(container_id)
         if not c:
             raise HTTPException(404, "Container not found")
@@ -131,7 +282,7 @@ def create_app() -> FastAPI:
 
     @app.patch("/api/containers/{container_id}")
     def update_container(container_id: str, body: _ContainerUpdate,
-                         storage: FileStorage = Depends(get_storage)):
+                         storage: AbstractStorage = Depends(get_storage)):
         c = storage.get_container(container_id)
         if not c:
             raise HTTPException(404, "Container not found")
@@ -141,17 +292,64 @@ def create_app() -> FastAPI:
         storage.upsert_container(c)
         return c
 
+    @app.get("/api/containers/{container_id}/export")
+    def export_container(container_id: str, gzip: bool = False,
+                         storage: AbstractStorage = Depends(get_storage)):
+        """Bundle NDJSON (rks/bundle.py) stream theo khối — RAM không phụ thuộc
+        kích thước container. gzip=true → nén khi stream (.ndjson.gz)."""
+        c = storage.get_container(container_id)
+        if not c:
+            raise HTTPException(404, "Container not found")
+        body = bundle.export_lines(storage, c)
+        filename = f"{container_id}.ndjson"
+        if gzip:
+            body, filename = bundle.gzip_stream(body), filename + ".gz"
+        return StreamingResponse(body, media_type=bundle.MEDIA_TYPE_GZIP if gzip else bundle.MEDIA_TYPE,
+                                 headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+    @app.post("/api/containers/import", status_code=201)
+    async def import_container(request: Request, title: str | None = None,
+                               storage: AbstractStorage = Depends(get_storage),
+                               user: str = Depends(get_current_user)):
+        """Body = bundle từ /export (NDJSON, gzip tự nhận). Tạo container MỚI với
+        id mới cho mọi record; đọc + ghi theo lô, lỗi giữa chừng → xoá phần đã ghi."""
+        reader = bundle.BundleReader()
+        importer = bundle.BundleImporter(storage, user, title)
+        try:
+            async for chunk in request.stream():
+                for batch in reader.feed(chunk):
+                    await run_in_threadpool(importer.add, batch)
+            for batch in reader.close():
+                await run_in_threadpool(importer.add, batch)
+            result = importer.finish()
+            await run_in_threadpool(storage.ensure_layout, result["container"].container_id)
+        except bundle.BundleError as e:
+            await run_in_threadpool(importer.abort)
+            raise HTTPException(400, str(e))
+        except Exception:
+            await run_in_threadpool(importer.abort)
+            raise
+        return result
+
     # ────────────────────────────────────────────────────────────
     # SOURCES
     # ────────────────────────────────────────────────────────────
 
     @app.get("/api/containers/{container_id}/sources")
-    def list_sources(container_id: str, storage: FileStorage = Depends(get_storage)):
-        return storage.list_sources(container_id)
+    def list_sources(container_id: str, fields: str | None = None,
+                     limit: int | None = None, cursor: str | None = None,
+                     storage: AbstractStorage = Depends(get_storage)):
+        try:
+            wanted = parse_fields(fields, Source, "source_id")
+            page = paginate(storage.list_sources(container_id), "source_id", cursor, limit)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        return _json_list(dump_list(SOURCES, page.items, wanted), page.next_cursor)
 
     @app.post("/api/containers/{container_id}/sources", status_code=201)
     def create_source(container_id: str, body: SourceCreate,
-                      storage: FileStorage = Depends(get_storage)):
+                      storage: AbstractStorage = Depends(get_storage),
+                      ingestor: SourceIngestor = Depends(get_ingestor)):
         if not storage.get_container(container_id):
             raise HTTPException(404, "Container not found")
         s = Source(
@@ -162,29 +360,141 @@ def create_app() -> FastAPI:
             notes=body.notes.strip(),
         )
         storage.upsert_source(s)
+        if s.type == SourceType.PDF:
+            try:
+                ingestor.start(s)           # file không đọc được → source vẫn tạo, ingest lại sau
+            except ValueError:
+                pass
         return s
 
     @app.delete("/api/sources/{source_id}")
-    def delete_source(source_id: str, storage: FileStorage = Depends(get_storage)):
+    def delete_source(source_id: str, storage: AbstractStorage = Depends(get_storage)):
         storage.delete_source(source_id)
         return {"ok": True}
 
+    @app.post("/api/sources/{source_id}/ingest", status_code=202)
+    def ingest_source(source_id: str, force: bool = False,
+                      storage: AbstractStorage = Depends(get_storage),
+                      ingestor: SourceIngestor = Depends(get_ingestor)):
+        """Extract + chunk PDF nền; file đã parse (cùng sha256) → dùng lại chunks. force → parse lại."""
+        source = storage.get_source(source_id)
+        if not source:
+            raise HTTPException(404, "Source not found")
+        try:
+            return ingestor.start(source, force=force)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+
+    @app.get("/api/sources/{source_id}/ingest")
+    def ingest_progress(source_id: str, storage: AbstractStorage = Depends(get_storage),
+                        ingestor: SourceIngestor = Depends(get_ingestor)):
+        """Tiến độ ingest: state, pages_done / pages_total, số chunk."""
+        source = storage.get_source(source_id)
+        if not source:
+            raise HTTPException(404, "Source not found")
+        return ingestor.status(source)
+
     # ────────────────────────────────────────────────────────────
     # GRAPH NODES
     # ────────────────────────────────────────────────────────────
 
     @app.get("/api/containers/{container_id}/graph")
-    def get_graph(container_id: str, storage: FileStorage = Depends(get_storage)):
-        """Trả về toàn bộ nodes + edges của container (cho Mindmap)."""
+    def get_graph(container_id: str, request: Request, view: str = "full",
+                  fields: str | None = None, limit: int | None = None, cursor: str | None = None,
+                  at: datetime | None = None,
+                  storage: AbstractStorage = Depends(get_storage)):
+        """Trả về nodes + edges của container (cho Mindmap).
+        view=skeleton → chỉ field cần vẽ canvas; fields= → chọn field node tuỳ ý.
+        limit/cursor → phân trang theo node, mỗi trang kèm các edge xuất phát từ node
+        trong trang (mỗi edge xuất hiện đúng 1 lần qua các trang).
+        ETag = revision graph (+ hình dạng response) → If-None-Match khớp trả 304.
+        Chỉ đọc: x/y được đặt lúc ghi (tạo node / edge, import) — node còn thiếu x/y
+        (data cũ) client tự đặt tạm, POST /layout để lưu.
+        at= (ISO datetime) → graph như lúc đó, đọc từ lịch sử; không ETag."""
+        if view not in ("full", "skeleton"):
+            raise HTTPException(400, "view must be 'full' or 'skeleton'")
+        if not storage.get_container(container_id):
+            raise HTTPException(404, "Container not found")
+        try:
+            node_fields = parse_fields(fields, GraphNode, "node_id")
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        edge_fields = None
+        if view == "skeleton":
+            node_fields = node_fields or SKELETON_NODE_FIELDS
+            edge_fields = SKELETON_EDGE_FIELDS
+        # Đọc revision TRƯỚC data: ghi xen giữa chỉ làm client nhận lại change đó lần sau
+        revision = storage.graph_revision(container_id)
+        if at is None:
+            etag = f'"g{revision}"'
+            if node_fields or limit is not None or cursor:
+                shape = f"{view}|{','.join(sorted(node_fields or ()))}|{limit}|{cursor}"
+                etag = f'"g{revision}-{zlib.crc32(shape.encode()):08x}"'
+            headers = {"ETag": etag, "Cache-Control": "no-cache"}
+            if request.headers.get("if-none-match") == etag:
+                return Response(status_code=304, headers=headers)
+            nodes, edges = storage.list_nodes(container_id), storage.list_edges(container_id)
+        else:
+            headers = {"Cache-Control": "no-cache"}
+            if at.tzinfo is not None:            # mốc lưu là UTC naive
+                at = at.astimezone(timezone.utc).replace(tzinfo=None)
+            nodes, edges = storage.graph_at(container_id, at)
+        try:
+            page = paginate(nodes, "node_id", cursor, limit)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        if limit is not None or cursor:
+            page_ids = {n.node_id for n in page.items}
+            edges = [e for e in edges if e.source_node_id in page_ids]
+        body = dump_graph(dump_list(NODES, page.items, node_fields),
+                          dump_list(EDGES, edges, edge_fields),
+                          revision, page.next_cursor)
+        return FastJSONResponse(body, headers=headers)
+
+    @app.get("/api/containers/{container_id}/changes")
+    def get_graph_changes(container_id: str, since: int,
+                          storage: AbstractStorage = Depends(get_storage)):
+        """Delta của graph sau revision `since`. reset=true → client tải lại /graph."""
+        if not storage.get_container(container_id):
+            raise HTTPException(404, "Container not found")
+        changes = storage.graph_changes(container_id, since)
+        if changes is None:
+            return {"reset": True, "revision": storage.graph_revision(container_id)}
+        return FastJSONResponse({"reset": False, **changes})
+
+    @app.post("/api/containers/{container_id}/layout")
+    def relayout(container_id: str, reset: bool = False,
+                 storage: AbstractStorage = Depends(get_storage)):
+        """Đặt vị trí node chưa có x/y; reset=true → tính lại layout cả container."""
         if not storage.get_container(container_id):
             raise HTTPException(404, "Container not found")
-        nodes = storage.list_nodes(container_id)
-        edges = storage.list_edges(container_id)
-        return {"nodes": nodes, "edges": edges}
+        laid_out = storage.ensure_layout(container_id, reset=reset)
+        return {"laid_out": laid_out, "revision": storage.graph_revision(container_id)}
+
+    @app.put("/api/containers/{container_id}/layout")
+    def save_positions(container_id: str, body: NodePositions,
+                       storage: AbstractStorage = Depends(get_storage)):
+        """Lưu vị trí node người dùng kéo thả — layout incremental sau đó giữ nguyên."""
+        if not storage.get_container(container_id):
+            raise HTTPException(404, "Container not found")
+        saved = storage.set_node_positions(container_id, body.positions)
+        return {"saved": saved, "revision": storage.graph_revision(container_id)}
+
+    @app.get("/api/containers/{container_id}/nodes")
+    def list_nodes(container_id: str, fields: str | None = None,
+                   limit: int | None = None, cursor: str | None = None,
+                   storage: AbstractStorage = Depends(get_storage)):
+        """List node (không kèm edge). Trang kế tiếp: header X-Next-Cursor."""
+        try:
+            wanted = parse_fields(fields, GraphNode, "node_id")
+            page = paginate(storage.list_nodes(container_id), "node_id", cursor, limit)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        return _json_list(dump_list(NODES, page.items, wanted), page.next_cursor)
 
     @app.post("/api/containers/{container_id}/nodes", status_code=201)
     def create_node(container_id: str, body: NodeCreate,
-                    storage: FileStorage = Depends(get_storage)):
+                    storage: AbstractStorage = Depends(get_storage)):
         if not storage.get_container(container_id):
             raise HTTPException(404, "Container not found")
         node = GraphNode(
@@ -194,46 +504,75 @@ def create_app() -> FastAPI:
             state=body.state,
         )
         storage.upsert_node(node)
-        return node
+        storage.ensure_layout(container_id)         # layout lúc ghi — GET /graph chỉ đọc
+        return storage.get_node(node.node_id)
 
     @app.get("/api/nodes/{node_id}")
     def get_node(node_id: str,
-                 storage: FileStorage = Depends(get_storage),
+                 storage: AbstractStorage = Depends(get_storage),
                  agent: CognitiveAgent = Depends(get_agent)):
         node = storage.get_node(node_id)
         if not node:
             raise HTTPException(404, "Node not found")
         ok, missing = agent.can_activate(node)
-        edges = storage.list_edges(node.container_id)
-        connected_edges = [e for e in edges if e.source_node_id == node_id or e.target_node_id == node_id]
-        return {
+        return FastJSONResponse({
             "node": node,
             "can_activate": ok,
             "missing_fields": missing,
-            "edge_count": len(connected_edges),
-        }
+            "edge_count": storage.node_degree(node_id),
+        })
+
+    @app.get("/api/nodes/{node_id}/history")
+    def get_node_history(node_id: str, storage: AbstractStorage = Depends(get_storage)):
+        """Mọi revision của node (cũ → mới), kể cả sau compact và lần xoá (deleted=true).
+        Bản chỉ khác vị trí canvas gộp vào revision nội dung liền trước."""
+        history = storage.node_history(node_id)
+        if history is None:
+            raise HTTPException(404, "Node not found")
+        return FastJSONResponse(history)
+
+    @app.get("/api/nodes/{node_id}/neighborhood")
+    def get_neighborhood(node_id: str, hops: int = 1, limit: int = 20,
+                         storage: AbstractStorage = Depends(get_storage)):
+        """Node lân cận ≤ hops bước (cả 2 chiều) kèm relation — không load cả graph."""
+        if not storage.get_node(node_id):
+            raise HTTPException(404, "Node not found")
+        hops, limit = max(1, min(hops, 3)), max(1, min(limit, 200))
+        neighbors = storage.get_neighborhood(node_id, hops=hops, limit=limit)
+        return FastJSONResponse({"neighbors": [nb._asdict() for nb in neighbors]})
+
+    # ────────────────────────────────────────────────────────────
+    # SEARCH
+    # ────────────────────────────────────────────────────────────
+
+    @app.get("/api/search")
+    def search(q: str, container_id: str, limit: int = 20,
+               storage: AbstractStorage = Depends(get_storage)):
+        """Full-text search trên node documents + source của 1 container (không phân biệt dấu)."""
+        if not storage.get_container(container_id):
+            raise HTTPException(404, "Container not found")
+        hits = storage.search(q, container_id, limit=max(1, min(limit, 100)))
+        return FastJSONResponse({"results": [h._asdict() for h in hits]})
 
     @app.patch("/api/nodes/{node_id}/document")
     def update_node_document(node_id: str, body: NodeDocument,
-                             storage: FileStorage = Depends(get_storage),
+                             storage: AbstractStorage = Depends(get_storage),
                              agent: CognitiveAgent = Depends(get_agent)):
         try:
             node = agent.update_node_document(node_id, body)
         except KeyError:
             raise HTTPException(404, "Node not found")
         ok, missing = agent.can_activate(node)
-        edges = storage.list_edges(node.container_id)
-        edge_count = sum(1 for e in edges if e.source_node_id == node_id or e.target_node_id == node_id)
-        return {
+        return FastJSONResponse({
             "node": node,
             "can_activate": ok,
             "missing_fields": missing,
-            "edge_count": edge_count,
-        }
+            "edge_count": storage.node_degree(node_id),
+        })
 
     @app.delete("/api/nodes/{node_id}")
     def delete_node(node_id: str, cascade: bool = True,
-                    storage: FileStorage = Depends(get_storage)):
+                    storage: AbstractStorage = Depends(get_storage)):
         node = storage.get_node(node_id)
         if not node:
             raise HTTPException(404, "Node not found")
@@ -250,18 +589,19 @@ def create_app() -> FastAPI:
 
     @app.post("/api/edges", status_code=201)
     def create_edge(body: EdgeCreate,
-                    storage: FileStorage = Depends(get_storage),
+                    storage: AbstractStorage = Depends(get_storage),
                     agent: CognitiveAgent = Depends(get_agent)):
         src = storage.get_node(body.source_node_id)
         tgt = storage.get_node(body.target_node_id)
         if not src or not tgt:
             raise HTTPException(404, "Source or target node not found")
         edge = agent.create_edge(body)
+        storage.ensure_layout(edge.container_id)
         return edge
 
     @app.patch("/api/edges/{edge_id}")
     def update_edge(edge_id: str, body: dict,
-                    storage: FileStorage = Depends(get_storage)):
+                    storage: AbstractStorage = Depends(get_storage)):
         edge = storage.get_edge(edge_id)
         if not edge:
             raise HTTPException(404, "Edge not found")
@@ -274,7 +614,7 @@ def create_app() -> FastAPI:
         return edge
 
     @app.delete("/api/edges/{edge_id}")
-    def delete_edge(edge_id: str, storage: FileStorage = Depends(get_storage)):
+    def delete_edge(edge_id: str, storage: AbstractStorage = Depends(get_storage)):
         storage.delete_edge(edge_id)
         return {"ok": True}
 
@@ -282,43 +622,111 @@ def create_app() -> FastAPI:
     # EXPLORE (AI Chat)
     # ────────────────────────────────────────────────────────────
 
+    # Route LLM là async: request chờ LLM chỉ giữ 1 coroutine, không chiếm
+    # threadpool worker của các route đọc graph (sync).
+
     @app.post("/api/explore")
-    def explore(body: ExploreRequest,
-                agent: CognitiveAgent = Depends(get_agent)):
-        return agent.explore(body)
+    async def explore(body: ExploreRequest,
+                      agent: CognitiveAgent = Depends(get_agent)):
+        return await agent.explore_async(body)
+
+    @app.post("/api/explore/stream")
+    async def explore_stream(body: ExploreRequest,
+                             agent: CognitiveAgent = Depends(get_agent)):
+        """Như /api/explore nhưng trả Server-Sent Events: summary/block/delta
+        ngay khi model sinh ra, cuối cùng `done` mang ExploreResponse đầy đủ."""
+        async def events():
+            async for event, data in agent.explore_stream(body):
+                yield f"event: {event}\ndata: {jsonio.dumps(data).decode()}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
     @app.post("/api/nodes/{node_id}/auto-document")
-    def auto_document(node_id: str,
-                      storage: FileStorage = Depends(get_storage),
-                      agent: CognitiveAgent = Depends(get_agent)):
-        """AI tự động điền definition/mechanism/boundary/assumptions."""
+    async def auto_document(node_id: str, no_cache: bool = False, background: bool = False,
+                            user: str = Depends(get_current_user),
+                            storage: AbstractStorage = Depends(get_storage),
+                            agent: CognitiveAgent = Depends(get_agent)):
+        """AI tự động điền definition/mechanism/boundary/assumptions.
+        background=true → xếp job (202), theo dõi qua GET /api/jobs/{job_id}."""
+        if background:
+            if not await run_in_threadpool(storage.get_node, node_id):
+                raise HTTPException(404, "Node not found")
+            job = await jobs.submit(user, "auto_document", {"node_id": node_id, "no_cache": no_cache})
+            return FastJSONResponse(job, status_code=202)
         try:
-            result = agent.auto_document_node(node_id)
+            result = await agent.auto_document_node_async(node_id, no_cache)
         except KeyError:
             raise HTTPException(404, "Node not found")
         node = result["node"]
         ok, missing = agent.can_activate(node)
-        edges = storage.list_edges(node.container_id)
-        edge_count = sum(1 for e in edges if e.source_node_id == node_id or e.target_node_id == node_id)
         return {
             "node": node,
             "can_activate": ok,
             "missing_fields": missing,
-            "edge_count": edge_count,
+            "edge_count": await run_in_threadpool(storage.node_degree, node_id),
             "suggested_nodes": result["suggested_nodes"],
+            "token_usage": result.get("token_usage"),
         }
 
+    @app.post("/api/containers/{container_id}/auto-document", status_code=202)
+    async def auto_document_container(container_id: str, no_cache: bool = False,
+                                      user: str = Depends(get_current_user),
+                                      storage: AbstractStorage = Depends(get_storage)):
+        """Job nền: auto-document mọi node EXPLORE của container (song song, có rate limit)."""
+        if not await run_in_threadpool(storage.get_container, container_id):
+            raise HTTPException(404, "Container not found")
+        return await jobs.submit(user, "auto_document_container",
+                           {"container_id": container_id, "no_cache": no_cache})
+
+    # ────────────────────────────────────────────────────────────
+    # JOBS
+    @app.post("/api/jobs", status_code=202)
+    async def submit_job(body: JobCreate, user: str = Depends(get_current_user)):
+        try:
+            return await jobs.submit(user, body.kind, body.params)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+
+    @app.get("/api/jobs")
+    async def list_jobs(limit: int = 50, user: str = Depends(get_current_user)):
+        return await jobs.list(user, max(1, min(limit, 200)))
+
+    @app.get("/api/jobs/{job_id}")
+    async def get_job(job_id: str, user: str = Depends(get_current_user)):
+        job = await jobs.get(user, job_id)
+        if job is None:
+            raise HTTPException(404, "Job not found")
+        return job
+
+    @app.post("/api/jobs/{job_id}/cancel")
+    async def cancel_job(job_id: str, user: str = Depends(get_current_user)):
+        job = await jobs.cancel(user, job_id)
+        if job is None:
+            raise HTTPException(404, "Job not found")
+        return job
+
     # ────────────────────────────────────────────────────────────
     # CONFIRM SUGGESTED NODE (từ Explore Expand mode)
     # ────────────────────────────────────────────────────────────
 
-    @app.post("/api/nodes/{node_id}/confirm-suggested", status_code=201)
-    def confirm_suggested(node_id: str, body: dict,
-                          storage: FileStorage = Depends(get_storage)):
-        """Tạo node mới từ AI suggestion và tạo edge nối về node gốc."""
-        parent = storage.get_node(node_id)
-        if not parent:
-            raise HTTPException(404, "Parent node not found")
+    def _add_suggested(storage: AbstractStorage, parent: GraphNode, body: dict) -> dict:
+        relation = RelationType(body.get("relation_type", RelationType.PART_OF))
+        # Suggestion trùng node đã có (agent gắn existing_node_id) → chỉ nối edge
+        existing = storage.get_node(body["existing_node_id"]) if body.get("existing_node_id") else None
+        if existing is not None and existing.container_id == parent.container_id \
+                and existing.node_id != parent.node_id:
+            for e in storage.adjacency(parent.container_id).incident(existing.node_id):
+                if e.relation_type == relation and {e.source_node_id, e.target_node_id} == {existing.node_id, parent.node_id}:
+                    return {"node": existing, "edge": e, "existing": True}
+            edge = GraphEdge(
+                container_id=parent.container_id,
+                source_node_id=existing.node_id,
+                target_node_id=parent.node_id,
+                relation_type=relation,
+            )
+            storage.upsert_edge(edge)
+            return {"node": existing, "edge": edge, "existing": True}
 
         new_node = GraphNode(
             container_id=parent.container_id,
@@ -333,12 +741,75 @@ def create_app() -> FastAPI:
         edge = GraphEdge(
             container_id=parent.container_id,
             source_node_id=new_node.node_id,
-            target_node_id=node_id,
-            relation_type=RelationType(body.get("relation_type", RelationType.PART_OF)),
+            target_node_id=parent.node_id,
+            relation_type=relation,
         )
         storage.upsert_edge(edge)
 
-        return {"node": new_node, "edge": edge}
+        return {"node": new_node, "edge": edge, "existing": False}
+
+    @app.post("/api/nodes/{node_id}/confirm-suggested", status_code=201)
+    def confirm_suggested(node_id: str, body: dict,
+                          storage: AbstractStorage = Depends(get_storage)):
+        """Tạo node mới từ AI suggestion và tạo edge nối về node gốc.
+        Có existing_node_id (node đã có, gần nghĩa) → chỉ tạo edge tới node đó."""
+        parent = storage.get_node(node_id)
+        if not parent:
+            raise HTTPException(404, "Parent node not found")
+        with storage.batch():
+            result = _add_suggested(storage, parent, body)
+            storage.ensure_layout(parent.container_id)
+        return result
+
+    @app.post("/api/nodes/{node_id}/confirm-suggested/batch", status_code=201)
+    def confirm_suggested_batch(node_id: str, body: list[dict],
+                                storage: AbstractStorage = Depends(get_storage)):
+        """Như confirm-suggested nhưng cho nhiều suggestion — ghi storage 1 lần."""
+        parent = storage.get_node(node_id)
+        if not parent:
+            raise HTTPException(404, "Parent node not found")
+        with storage.batch():
+            items = [_add_suggested(storage, parent, item) for item in body]
+            storage.ensure_layout(parent.container_id)
+        return {"items": items}
+
+    # ────────────────────────────────────────────────────────────
+    # ADMIN
+    # ────────────────────────────────────────────────────────────
+
+    @app.post("/api/admin/compact")
+    def compact_storage(force: bool = False, storage: AbstractStorage = Depends(get_storage)):
+        """Compact JSONL của user hiện tại. force=false → chỉ chạy khi vượt garbage ratio."""
+        ratio, rows = storage.garbage_ratio()
+        stats = storage.compact() if force else storage.maybe_compact(compact_ratio)
+        return {"garbage_ratio": round(ratio, 3), "rows": rows, "compacted": stats is not None, "stats": stats}
+
+    @app.get("/api/admin/llm-cache")
+    def llm_cache_stats():
+        """Hit/miss counters + dung lượng của LLM response cache."""
+        return {"enabled": llm_cache is not None, **(llm_cache.stats() if llm_cache else {})}
+
+    @app.delete("/api/admin/llm-cache")
+    def llm_cache_clear():
+        return {"cleared": llm_cache.clear() if llm_cache else 0}
+
+    @app.get("/api/admin/profiler")
+    def profiler_config():
+        return profiler.config()
+
+    @app.post("/api/admin/profiler")
+    def profiler_configure(mode: str | None = None, slow_ms: float | None = None,
+                           sample: float | None = None):
+        """Bật / tắt profiler lúc chạy: mode = off | auto | cprofile | pyinstrument."""
+        try:
+            return profiler.configure(mode, slow_ms, sample)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        """Prometheus text format — latency theo route, byte storage, thời gian / token LLM."""
+        return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
 
     return app
 
@@ -27,7 +27,9 @@ const STATE = {
   chatHistories:     new Map(), // key: "node:{id}" or "container:{id}" → {messages, html}
   pendingSuggested:  [],     // nodes AI đề xuất đang chờ confirm
   selectedEdgeId:    null,   // Edge đang chọn để edit/delete
-  nodePositions:     new Map(), // lưu vị trí node giữa các lần render: node_id → {x, y}
+  graphContainerId:  null,   // container của STATE.graphData
+  graphRevision:     null,   // revision server của STATE.graphData (delta sync)
+  graphFitted:       null,   // container đã fit zoom theo layout (chỉ fit lần đầu mở)
 };
 
 // ── localStorage helpers to persist chat across page refresh ────────────────
@@ -69,6 +71,11 @@ const api = {
     if (!r.ok) { const e = await r.json().catch(()=>({detail: r.statusText})); throw new Error(e.detail || r.statusText); }
     return r.json();
   },
+  async put(url, body) {
+    const r = await fetch(url, { method:'PUT', headers:{'Content-Type':'application/json'}, body: JSON.stringify(body) });
+    if (!r.ok) { const e = await r.json().catch(()=>({detail: r.statusText})); throw new Error(e.detail || r.statusText); }
+    return r.json();
+  },
   async patch(url, body) {
     const r = await fetch(url, { method:'PATCH', headers:{'Content-Type':'application/json'}, body: JSON.stringify(body) });
     if (!r.ok) { const e = await r.json().catch(()=>({detail: r.statusText})); throw new Error(e.detail || r.statusText); }
@@ -156,7 +163,6 @@ async function selectKnowledge(containerId) {
   STATE.activeContainerId = containerId;
   STATE.activeSourceId    = null;
   STATE.selectedNodeId    = null;
-  STATE.nodePositions.clear();  // reset vị trí khi đổi container
   // Re-render knowledge list (highlight)
   document.querySelectorAll('#knowledge-list .list-item').forEach(el => {
     el.classList.toggle('active', el.dataset.id === containerId);
@@ -232,10 +238,32 @@ function renderSourceList(sources) {
       document.querySelectorAll('#source-list .list-item').forEach(x =>
         x.classList.toggle('active', x.dataset.id === s.source_id));
     });
+    if (s.type === 'PDF') {
+      const badge = document.createElement('span');
+      badge.className = 'src-ingest';
+      el.appendChild(badge);
+      pollIngest(s.source_id, badge);
+    }
     list.appendChild(el);
   });
 }
 
+// Tiến độ ingest PDF (extract + chunk chạy nền trên server) — poll tới khi xong
+async function pollIngest(sourceId, badge) {
+  let st;
+  try { st = await api.get(`/api/sources/${sourceId}/ingest`); } catch(e) { return; }
+  if (!badge.isConnected) return;
+  if (st.state === 'running') {
+    badge.textContent = st.pages_total ? `${st.pages_done}/${st.pages_total} tr.` : '…';
+    setTimeout(() => pollIngest(sourceId, badge), 1000);
+  } else if (st.state === 'done') {
+    badge.textContent = `${st.chunks} chunks`;
+  } else if (st.state === 'error') {
+    badge.textContent = '⚠';
+    badge.title = st.error;
+  }
+}
+
 document.getElementById('btn-add-source').addEventListener('click', () => {
   if (!STATE.activeContainerId) { toast('Chọn Knowledge trước'); return; }
   document.getElementById('inp-src-label').value = '';
@@ -272,14 +300,32 @@ document.getElementById('btn-remove-source').addEventListener('click', async ()
 });
 
 // ═══════════════════════════════════════════════════════════════════
-// COLUMN 3 — Mindmap (D3 Force Graph)
+// COLUMN 3 — Mindmap (layout tính sẵn ở server)
 // ═══════════════════════════════════════════════════════════════════
 
-let simulation = null;
+const graphZoom = d3.zoom().scaleExtent([0.05, 4]);
 
+// Đồng bộ graph theo revision: lần đầu / đổi container → GET /graph (có ETag,
+// trình duyệt tự revalidate), các lần sau chỉ GET /changes?since=rev rồi merge.
+// Không có thay đổi → không render lại. x/y của node do server tính (rks/layout.py).
 async function loadGraph(containerId) {
   try {
-    const data = await api.get(`/api/containers/${containerId}/graph`);
+    let data = null;
+    if (STATE.graphContainerId === containerId && STATE.graphRevision != null) {
+      const delta = await api.get(`/api/containers/${containerId}/changes?since=${STATE.graphRevision}`);
+      if (!delta.reset) {
+        STATE.graphRevision = delta.revision;
+        const changed = delta.nodes.length + delta.edges.length + delta.deleted_nodes.length + delta.deleted_edges.length;
+        if (!changed) return;
+        data = mergeGraphDelta(STATE.graphData, delta);
+      }
+    }
+    if (!data) {
+      // skeleton: chỉ field cần vẽ; document fields tải riêng khi mở node
+      data = await api.get(`/api/containers/${containerId}/graph?view=skeleton`);
+      STATE.graphContainerId = containerId;
+      STATE.graphRevision    = data.revision;
+    }
     // Filter out dangling edges (source or target no longer exists)
     const nodeIds = new Set(data.nodes.map(n => n.node_id));
     data.edges = (data.edges || []).filter(
@@ -294,6 +340,16 @@ async function loadGraph(containerId) {
   }
 }
 
+function mergeGraphDelta(graph, delta) {
+  const nodes = new Map(graph.nodes.map(n => [n.node_id, n]));
+  const edges = new Map(graph.edges.map(e => [e.edge_id, e]));
+  delta.deleted_nodes.forEach(id => nodes.delete(id));
+  delta.deleted_edges.forEach(id => edges.delete(id));
+  delta.nodes.forEach(n => nodes.set(n.node_id, n));
+  delta.edges.forEach(e => edges.set(e.edge_id, e));
+  return { nodes: [...nodes.values()], edges: [...edges.values()] };
+}
+
 function nodeColor(state) {
   const map = {
     EXPLORE:'#fbbf24', BUILD:'#38bdf8', ACTIVE:'#4ade80',
@@ -318,6 +374,8 @@ function nodeWidth(title, isSub) {
 }
 function nodeHeight(isSub) { return isSub ? 30 : 42; }
 
+// Vẽ theo x/y server trả về (toạ độ layout, không phụ thuộc kích thước khung);
+// zoom fit cả graph lần đầu mở container, sau đó giữ nguyên pan / zoom.
 function renderGraph({ nodes, edges }) {
   const svg    = d3.select('#graph-svg');
   const root   = d3.select('#graph-root');
@@ -325,44 +383,18 @@ function renderGraph({ nodes, edges }) {
   const height = document.getElementById('graph-container').clientHeight;
 
   svg.attr('viewBox', `0 0 ${width} ${height}`);
-
-  // ── Preserve existing node positions before clearing ──────────────
-  root.selectAll('.g-node').each(function(d) {
-    if (d && d.node_id) STATE.nodePositions.set(d.node_id, { x: d.x, y: d.y });
-  });
   root.selectAll('*').remove();
 
   if (!nodes.length) return;
 
-  // Assign positions: restored from cache or spread near center/neighbors
-  const existingIds = new Set(STATE.nodePositions.keys());
-  // Calculate centre of already-positioned nodes for anchoring new ones
-  let posAnchorX = width / 2, posAnchorY = height / 2;
-  const posNodes = nodes.filter(n => existingIds.has(n.node_id));
-  if (posNodes.length > 0) {
-    const sumX = posNodes.reduce((s, n) => s + STATE.nodePositions.get(n.node_id).x, 0);
-    const sumY = posNodes.reduce((s, n) => s + STATE.nodePositions.get(n.node_id).y, 0);
-    posAnchorX = sumX / posNodes.length;
-    posAnchorY = sumY / posNodes.length;
-  }
-  let newNodeAngle = 0;
-  nodes.forEach(n => {
-    const pos = STATE.nodePositions.get(n.node_id);
-    if (pos) {
-      n.x = pos.x; n.y = pos.y;
-    } else {
-      // Spread new nodes in a ring around the anchor to avoid clustering
-      const r   = 120 + Math.random() * 80;
-      n.x = posAnchorX + r * Math.cos(newNodeAngle);
-      n.y = posAnchorY + r * Math.sin(newNodeAngle);
-      newNodeAngle += (2 * Math.PI) / Math.max((nodes.length - posNodes.length), 1);
-    }
+  // Node chưa có vị trí (không nên xảy ra — server đặt trước khi trả) → cạnh tâm graph
+  const placed = nodes.filter(n => n.x != null && n.y != null);
+  const cx = placed.length ? d3.mean(placed, n => n.x) : 0;
+  const cy = placed.length ? d3.mean(placed, n => n.y) : 0;
+  nodes.forEach((n, i) => {
+    if (n.x == null || n.y == null) { n.x = cx + 40 * Math.cos(i); n.y = cy + 40 * Math.sin(i); }
   });
 
-  // Use low alpha if most nodes have known positions
-  const knownRatio = posNodes.length / Math.max(nodes.length, 1);
-  const startAlpha = knownRatio >= 0.5 ? 0.15 : 0.6;
-
   // Close edge context if the selected edge is gone
   const edgeIds = new Set(edges.map(e => e.edge_id));
   if (STATE.selectedEdgeId && !edgeIds.has(STATE.selectedEdgeId)) closeEdgeCtx();
@@ -371,7 +403,14 @@ function renderGraph({ nodes, edges }) {
   svg.on('click', () => closeEdgeCtx());
 
   // Zoom + pan
-  svg.call(d3.zoom().scaleExtent([0.2, 4]).on('zoom', e => root.attr('transform', e.transform)));
+  svg.call(graphZoom.on('zoom', e => root.attr('transform', e.transform)));
+  if (STATE.graphFitted !== STATE.graphContainerId) {
+    STATE.graphFitted = STATE.graphContainerId;
+    const [x0, x1] = d3.extent(nodes, n => n.x), [y0, y1] = d3.extent(nodes, n => n.y);
+    const k = Math.min(1, 0.9 * Math.min(width / (x1 - x0 + 160), height / (y1 - y0 + 80)));
+    svg.call(graphZoom.transform, d3.zoomIdentity
+      .translate(width / 2 - k * (x0 + x1) / 2, height / 2 - k * (y0 + y1) / 2).scale(k));
+  }
 
   // Build id maps
   const nodeById = Object.fromEntries(nodes.map(n => [n.node_id, n]));
@@ -379,8 +418,8 @@ function renderGraph({ nodes, edges }) {
   // Links
   const linkData = edges.map(e => ({
     ...e,
-    source: e.source_node_id,
-    target: e.target_node_id,
+    source: nodeById[e.source_node_id],
+    target: nodeById[e.target_node_id],
   }));
 
   const linkG = root.append('g').attr('class', 'links');
@@ -413,7 +452,6 @@ function renderGraph({ nodes, edges }) {
   const nodeSel = nodeG.selectAll('.g-node').data(nodes).enter().append('g')
     .attr('class', d => `g-node state-${d.state}${!rootNodeIds.has(d.node_id) ? ' sub-node' : ''}`)
     .attr('data-id', d => d.node_id)
-    .call(d3.drag().on('start', dragStart).on('drag', dragged).on('end', dragEnd))
     .on('click', (e, d) => selectNode(d.node_id));
 
   nodeSel.append('rect')
@@ -446,64 +484,40 @@ function renderGraph({ nodes, edges }) {
   // Highlight selected
   highlightSelectedNode();
 
-  // Simulation — use startAlpha: low if positions restored, higher if mostly new nodes
-  if (simulation) simulation.stop();
-  simulation = d3.forceSimulation(nodes)
-    .alpha(startAlpha)
-    .alphaDecay(startAlpha < 0.3 ? 0.06 : 0.03)   // decay faster when mostly settled
-    .force('link',   d3.forceLink(linkData).id(d => d.node_id).distance(130))
-    .force('charge', d3.forceManyBody().strength(-280))
-    // Position forces target each node's saved position (prevents clustering on re-render)
-    // For new nodes, fall back to current center
-    .force('x', d3.forceX(d => {
-      const p = STATE.nodePositions.get(d.node_id);
-      return p ? p.x : posAnchorX;
-    }).strength(d => STATE.nodePositions.has(d.node_id) ? 0.15 : 0.05))
-    .force('y', d3.forceY(d => {
-      const p = STATE.nodePositions.get(d.node_id);
-      return p ? p.y : posAnchorY;
-    }).strength(d => STATE.nodePositions.has(d.node_id) ? 0.15 : 0.05))
-    .force('collide', d3.forceCollide(d => {
-      const isSub = !rootNodeIds.has(d.node_id);
-      return isSub ? 33 : 48;
-    }))
-    .on('tick', () => {
-      // Save positions each tick so next render starts from latest positions
-      nodes.forEach(n => STATE.nodePositions.set(n.node_id, { x: n.x, y: n.y }));
-      const pathFn = d => {
-        const sx = d.source.x, sy = d.source.y;
-        const tx = clamp(d.target.x, 70, width - 70);
-        const ty = clamp(d.target.y, 27, height - 27);
-        // Trim path end so arrow tip lands on pill edge, not node center
-        const ddx = tx - sx, ddy = ty - sy;
-        const dist = Math.sqrt(ddx * ddx + ddy * ddy) || 1;
-        const off = 23; // ≈ pill half-height + small gap
-        const ex = tx - (ddx / dist) * off;
-        const ey = ty - (ddy / dist) * off;
-        // Cubic bezier with horizontal-bias control points
-        const cpx = (ex - sx) * 0.45;
-        return `M${sx},${sy} C${sx + cpx},${sy} ${ex - cpx},${ey} ${ex},${ey}`;
-      };
-      paths.attr('d', pathFn);
-      hitPaths.attr('d', pathFn);
-      linkLabels
-        .attr('x', d => {
-          const tx = clamp(d.target.x, 70, width - 70);
-          return (d.source.x + tx) / 2;
-        })
-        .attr('y', d => {
-          const ty = clamp(d.target.y, 27, height - 27);
-          return (d.source.y + ty) / 2 - 6;
-        });
-      nodeSel.attr('transform', d => `translate(${clamp(d.x, 70, width - 70)},${clamp(d.y, 27, height - 27)})`);
-    });
+  const pathFn = d => {
+    const sx = d.source.x, sy = d.source.y;
+    const tx = d.target.x, ty = d.target.y;
+    // Trim path end so arrow tip lands on pill edge, not node center
+    const ddx = tx - sx, ddy = ty - sy;
+    const dist = Math.sqrt(ddx * ddx + ddy * ddy) || 1;
+    const off = 23; // ≈ pill half-height + small gap
+    const ex = tx - (ddx / dist) * off;
+    const ey = ty - (ddy / dist) * off;
+    // Cubic bezier with horizontal-bias control points
+    const cpx = (ex - sx) * 0.45;
+    return `M${sx},${sy} C${sx + cpx},${sy} ${ex - cpx},${ey} ${ex},${ey}`;
+  };
+  const redraw = () => {
+    paths.attr('d', pathFn);
+    hitPaths.attr('d', pathFn);
+    linkLabels
+      .attr('x', d => (d.source.x + d.target.x) / 2)
+      .attr('y', d => (d.source.y + d.target.y) / 2 - 6);
+    nodeSel.attr('transform', d => `translate(${d.x},${d.y})`);
+  };
+  nodeSel.call(d3.drag()
+    .on('drag', (e, d) => { d.x = e.x; d.y = e.y; d.moved = true; redraw(); })
+    .on('end',  (e, d) => { if (d.moved) { d.moved = false; saveNodePosition(d); } }));
+  redraw();
 }
 
-function clamp(v, lo, hi) { return Math.max(lo, Math.min(hi, v)); }
-
-function dragStart(e, d) { if (!e.active && simulation) simulation.alphaTarget(0.3).restart(); d.fx = d.x; d.fy = d.y; }
-function dragged(e, d)    { d.fx = e.x; d.fy = e.y; }
-function dragEnd(e, d)    { if (!e.active && simulation) simulation.alphaTarget(0); d.fx = null; d.fy = null; }
+// Node kéo thả → lưu vị trí; layout incremental ở server giữ nguyên node này
+async function saveNodePosition(d) {
+  try {
+    await api.put(`/api/containers/${STATE.graphContainerId}/layout`,
+                  { positions: { [d.node_id]: [d.x, d.y] } });
+  } catch(e) { toast('Lỗi lưu vị trí: ' + e.message); }
+}
 
 function highlightSelectedNode() {
   d3.selectAll('.g-node').classed('selected', d => d.node_id === STATE.selectedNodeId);
@@ -527,6 +541,49 @@ async function selectNode(nodeId) {
   await loadNodeDocument(nodeId, { silent: true });
 }
 
+// ── Search (node documents + sources, không phân biệt dấu) ────────
+
+const graphSearchInput   = document.getElementById('inp-graph-search');
+const graphSearchResults = document.getElementById('graph-search-results');
+let graphSearchTimer = null;
+
+graphSearchInput.addEventListener('input', () => {
+  clearTimeout(graphSearchTimer);
+  graphSearchTimer = setTimeout(runGraphSearch, 150);
+});
+
+graphSearchInput.addEventListener('keydown', e => {
+  if (e.key === 'Escape') { graphSearchInput.value = ''; graphSearchResults.innerHTML = ''; }
+});
+
+async function runGraphSearch() {
+  const q = graphSearchInput.value.trim();
+  if (!q || !STATE.activeContainerId) { graphSearchResults.innerHTML = ''; return; }
+  try {
+    const r = await api.get(`/api/search?container_id=${STATE.activeContainerId}&q=${encodeURIComponent(q)}`);
+    if (graphSearchInput.value.trim() !== q) return;   // đã gõ tiếp → bỏ kết quả cũ
+    graphSearchResults.innerHTML = r.results.length
+      ? r.results.map(h => `<div class="graph-search-item" data-kind="${h.kind}" data-id="${h.id}">`
+          + `<span class="graph-search-kind">${h.kind === 'source' ? 'SRC' : 'NODE'}</span>${esc(h.title)}</div>`).join('')
+      : '<div class="graph-search-empty">Không tìm thấy</div>';
+  } catch(e) {
+    graphSearchResults.innerHTML = '';
+  }
+}
+
+graphSearchResults.addEventListener('click', e => {
+  const item = e.target.closest('.graph-search-item');
+  if (!item) return;
+  if (item.dataset.kind === 'node') {
+    selectNode(item.dataset.id);
+  } else {
+    STATE.activeSourceId = item.dataset.id;
+    document.querySelectorAll('#source-list .list-item').forEach(x =>
+      x.classList.toggle('active', x.dataset.id === item.dataset.id));
+  }
+  graphSearchResults.innerHTML = '';
+});
+
 // ── Add / Remove Node ─────────────────────────────────────────────
 
 document.getElementById('btn-add-node').addEventListener('click', () => {
@@ -562,8 +619,6 @@ document.getElementById('btn-remove-node').addEventListener('click', async () =>
   if (!confirm(`Xoá node "${name}" và các sub-node chỉ nối qua nó?`)) return;
   try {
     const r = await api.del(`/api/nodes/${STATE.selectedNodeId}?cascade=true`);
-    // Xoá vị trí các node đã bị delete khỏi cache
-    (r.deleted_ids || []).forEach(id => STATE.nodePositions.delete(id));
     toast(`Đã xoá ${r.deleted_ids.length} node`);
     STATE.selectedNodeId = null;
     clearDocumentPanel();
@@ -616,6 +671,25 @@ document.getElementById('btn-open-document').addEventListener('click', async ()
   document.getElementById('panel-document').scrollIntoView({ behavior:'smooth' });
 });
 
+// Auto-document cả container: server chạy job nền, client poll tiến độ
+document.getElementById('btn-auto-doc-all').addEventListener('click', async () => {
+  const containerId = STATE.activeContainerId;
+  if (!containerId) { toast('Chọn Knowledge trước'); return; }
+  let job;
+  try { job = await api.post(`/api/containers/${containerId}/auto-document`, {}); }
+  catch(e) { toast('Lỗi: ' + e.message); return; }
+  toast('AI đang tạo tài liệu cho các node EXPLORE…');
+  while (job.state === 'queued' || job.state === 'running') {
+    await new Promise(r => setTimeout(r, 2000));
+    try { job = await api.get(`/api/jobs/${job.job_id}`); } catch(e) { return; }
+    if (job.total) toast(`Auto-doc: ${job.done}/${job.total}` + (job.failed ? ` (${job.failed} lỗi)` : ''));
+  }
+  if (STATE.activeContainerId === containerId) await loadGraph(containerId);
+  toast(job.state === 'done'
+    ? `Đã tạo tài liệu cho ${job.done} node` + (job.failed ? `, ${job.failed} lỗi` : '')
+    : `Auto-doc ${job.state}: ${(job.errors || []).slice(-1)[0] || ''}`);
+});
+
 // ═══════════════════════════════════════════════════════════════════
 // DOCUMENT PANEL
 // ═══════════════════════════════════════════════════════════════════
@@ -961,6 +1035,32 @@ function addChatMsg(role, text) {
   return el;
 }
 
+// POST + đọc Server-Sent Events từ response body (EventSource chỉ hỗ trợ GET).
+// onEvent(event, data) được gọi cho mỗi event ngay khi nhận đủ.
+async function postEventStream(url, body, onEvent) {
+  const r = await fetch(url, { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(body) });
+  if (!r.ok) { const e = await r.json().catch(()=>({detail: r.statusText})); throw new Error(e.detail || r.statusText); }
+  const reader = r.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+    let sep;
+    while ((sep = buf.indexOf('\n\n')) >= 0) {
+      const raw = buf.slice(0, sep);
+      buf = buf.slice(sep + 2);
+      let event = 'message', data = '';
+      raw.split('\n').forEach(line => {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      });
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+}
+
 async function sendExplore() {
   if (!STATE.selectedNodeId) { toast('Chọn một Node trước'); return; }
   const input = document.getElementById('chat-input');
@@ -974,32 +1074,70 @@ async function sendExplore() {
   const loadingEl = addChatMsg('loading', '...');
   STATE.chatHistory.push({ role: 'user', content: msg });
 
+  // Render dần theo stream: summary + từng block card / từng đoạn text
+  let summaryEl = null, blocksEl = null, streamedText = '';
+  const disp = document.getElementById('chat-display');
+  function startAssistant() {
+    if (!loadingEl.classList.contains('loading')) return;
+    loadingEl.classList.remove('loading');
+    loadingEl.classList.add('assistant');
+    loadingEl.textContent = '';
+  }
+  function ensureBlocks() {
+    if (blocksEl) return;
+    startAssistant();
+    loadingEl.classList.add('has-blocks');
+    summaryEl = document.createElement('div');
+    summaryEl.className = 'res-summary';
+    loadingEl.appendChild(summaryEl);
+    blocksEl = renderBlockCards([]);
+    loadingEl.appendChild(blocksEl);
+  }
+
   try {
-    const result = await api.post('/api/explore', {
+    let result = null;
+    await postEventStream('/api/explore/stream', {
       node_id:      STATE.selectedNodeId,
       container_id: STATE.activeContainerId,
       mode,
       message:      msg,
       history:      STATE.chatHistory.slice(-6),
+    }, (event, data) => {
+      if (event === 'summary') {
+        ensureBlocks();
+        summaryEl.textContent = data;
+      } else if (event === 'block') {
+        ensureBlocks();
+        appendBlockCard(blocksEl, data);
+      } else if (event === 'delta') {
+        startAssistant();
+        streamedText += data;
+        loadingEl.textContent = streamedText;
+      } else if (event === 'done') {
+        result = data;
+      }
+      disp.scrollTop = disp.scrollHeight;
     });
+    if (!result) throw new Error('stream bị ngắt');
 
-    loadingEl.classList.remove('loading');
-    loadingEl.classList.add('assistant');
+    startAssistant();
 
     // Structured block response (clarify mode with JSON)
     if (result.blocks && result.blocks.length) {
-      loadingEl.classList.add('has-blocks');
-      const summaryEl = document.createElement('div');
-      summaryEl.className = 'res-summary';
+      if (!blocksEl || blocksEl.children.length !== result.blocks.length) {
+        // Stream không tách được block (hoặc thiếu) → render lại từ kết quả cuối
+        loadingEl.innerHTML = '';
+        blocksEl = null;
+        ensureBlocks();
+        result.blocks.forEach(b => appendBlockCard(blocksEl, b));
+      }
       summaryEl.textContent = result.reply;
-      loadingEl.appendChild(summaryEl);
-      const blocksEl = renderBlockCards(result.blocks);
-      loadingEl.appendChild(blocksEl);
       // Store blocks data so we can rehydrate after page refresh
       const serialised = result.reply + '\n' +
         result.blocks.map(b => `[${b.type.toUpperCase()}] ${b.title}: ${b.content.join('; ')}`).join('\n');
       STATE.chatHistory.push({ role: 'assistant', content: serialised, blocks: result.blocks, summary: result.reply });
     } else {
+      loadingEl.classList.remove('has-blocks');
       loadingEl.textContent = result.reply;
       STATE.chatHistory.push({ role: 'assistant', content: result.reply });
     }
@@ -1022,56 +1160,60 @@ function renderBlockCards(blocks) {
   container.className = 'res-blocks';
 
   // Build a fast lookup so we can highlight related blocks on click
-  const blockEls = new Map(); // id → DOM element
-
-  blocks.forEach(b => {
-    const card = document.createElement('div');
-    card.className = `res-block type-${b.type}`;
-    card.dataset.bid = b.id;
-
-    const header = document.createElement('div');
-    header.className = 'res-block-header';
-
-    const badge = document.createElement('span');
-    badge.className = 'res-block-badge';
-    badge.textContent = b.type;
-
-    const title = document.createElement('span');
-    title.className = 'res-block-title';
-    title.textContent = b.title;
-
-    header.appendChild(badge);
-    header.appendChild(title);
-    card.appendChild(header);
-
-    const body = document.createElement('ul');
-    body.className = 'res-block-body';
-    (b.content || []).forEach(line => {
-      const li = document.createElement('li');
-      li.textContent = line;
-      body.appendChild(li);
-    });
-    card.appendChild(body);
-
-    // Toggle collapse on click + highlight related blocks
-    card.addEventListener('click', () => {
-      card.classList.toggle('collapsed');
-      const related = [
-        ...((b.relations && b.relations.depends_on) || []),
-        ...((b.relations && b.relations.leads_to) || []),
-      ];
-      // Briefly highlight related
-      blockEls.forEach((el, id) => el.classList.remove('highlighted'));
-      related.forEach(id => blockEls.get(id)?.classList.add('highlighted'));
-    });
+  container._blockEls = new Map(); // id → DOM element
 
-    blockEls.set(b.id, card);
-    container.appendChild(card);
-  });
+  blocks.forEach(b => appendBlockCard(container, b));
 
   return container;
 }
 
+// Thêm 1 block card vào container tạo bởi renderBlockCards (dùng cả khi stream)
+function appendBlockCard(container, b) {
+  const blockEls = container._blockEls;
+  const card = document.createElement('div');
+  card.className = `res-block type-${b.type}`;
+  card.dataset.bid = b.id;
+
+  const header = document.createElement('div');
+  header.className = 'res-block-header';
+
+  const badge = document.createElement('span');
+  badge.className = 'res-block-badge';
+  badge.textContent = b.type;
+
+  const title = document.createElement('span');
+  title.className = 'res-block-title';
+  title.textContent = b.title;
+
+  header.appendChild(badge);
+  header.appendChild(title);
+  card.appendChild(header);
+
+  const body = document.createElement('ul');
+  body.className = 'res-block-body';
+  (b.content || []).forEach(line => {
+    const li = document.createElement('li');
+    li.textContent = line;
+    body.appendChild(li);
+  });
+  card.appendChild(body);
+
+  // Toggle collapse on click + highlight related blocks
+  card.addEventListener('click', () => {
+    card.classList.toggle('collapsed');
+    const related = [
+      ...((b.relations && b.relations.depends_on) || []),
+      ...((b.relations && b.relations.leads_to) || []),
+    ];
+    // Briefly highlight related
+    blockEls.forEach((el, id) => el.classList.remove('highlighted'));
+    related.forEach(id => blockEls.get(id)?.classList.add('highlighted'));
+  });
+
+  blockEls.set(b.id, card);
+  container.appendChild(card);
+}
+
 
 function renderSuggestedNodes(parentNodeId, suggested) {
   const capturedParentId = parentNodeId || STATE.selectedNodeId;
@@ -1084,7 +1226,8 @@ function renderSuggestedNodes(parentNodeId, suggested) {
     row.className = 'suggest-item';
     row.innerHTML = `
       <input type="checkbox" id="sg-${i}" checked/>
-      <span class="s-title">${esc(s.title)} <span style="color:#64748b;font-size:10px">[${s.node_type}]</span></span>
+      <span class="s-title">${esc(s.title)} <span style="color:#64748b;font-size:10px">[${s.node_type}]</span>${
+        s.existing_node_id ? ` <span class="s-existing" title="Node đã có trong graph — chỉ nối edge">≈ ${esc(s.existing_title || '')}</span>` : ''}</span>
       <span class="s-rel">${s.relation_type}</span>`;
     area.appendChild(row);
   });
@@ -1104,24 +1247,24 @@ async function confirmSuggestedNodes(parentNodeId, suggestedList) {
   const toAdd = items.filter((_, i) => checks[i]?.checked);
   if (!toAdd.length) { toast('Không có node nào được chọn'); return; }
 
-  let added = 0;
-  for (const s of toAdd) {
-    try {
-      const result = await api.post(`/api/nodes/${nodeId}/confirm-suggested`, {
-        title:         s.title,
-        node_type:     s.node_type,
-        relation_type: s.relation_type,
-        definition:    s.definition || '',
-      });
-      if (result.edge) added++;
-      else { console.warn('Edge not returned for', s.title); added++; }
-    } catch(e) { console.error(e); toast('Lỗi thêm node: ' + e.message); }
-  }
+  let added = 0, linked = 0;
+  try {
+    // 1 request cho mọi suggestion → server ghi storage 1 lần
+    const result = await api.post(`/api/nodes/${nodeId}/confirm-suggested/batch`, toAdd.map(s => ({
+      title:         s.title,
+      node_type:     s.node_type,
+      relation_type: s.relation_type,
+      definition:    s.definition || '',
+      existing_node_id: s.existing_node_id || null,
+    })));
+    added = (result.items || []).filter(it => !it.existing).length;
+    linked = (result.items || []).length - added;
+  } catch(e) { console.error(e); toast('Lỗi thêm node: ' + e.message); }
 
   document.getElementById('suggested-area').style.display = 'none';
   STATE.pendingSuggested = [];
   await loadGraph(STATE.activeContainerId);
-  toast(`Đã thêm ${added} node vào graph`);
+  toast(`Đã thêm ${added} node vào graph` + (linked ? `, nối ${linked} node đã có` : ''));
 }
 
 document.getElementById('btn-send').addEventListener('click', sendExplore);